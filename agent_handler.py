@@ -1,28 +1,57 @@
+import asyncio
 import json
 import os
-import re
+from dataclasses import asdict
 from datetime import datetime
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
 
-import streamlit as st
-from llama_index.core.agent.workflow import AgentOutput
-from llama_index.core.llms import LLM, ChatMessage
 from llama_index.core.workflow import (Context, Event, StartEvent, StopEvent,
                                        Workflow, step)
-from llama_index.llms.openrouter import OpenRouter
-from llama_index.utils.workflow import draw_all_possible_flows
 
 from api_wrappers import HereAPI, TomTomAPI
+from here_catalog import get_food_type_index
+from json_extract import (ROUTE_INFO_SCHEMA, SEARCH_PLACES_SCHEMA, Schema,
+                          aextract_json_from_stream, extract_json)
 from load_env import load_environment
+from local_router import get_local_router
+from location_memo import known_location_names, resolve_route_info
+from model_tiers import STEP_MODELS, StepModel, hedged, latency_tracker, timed
+from polyline_codec import encode_polyline, extract_polyline_from_route
+from prefetch import prefetch_requests, prefetcher
 from prompt_data import (PROMPT_EXTRACT_ROUTE_INFO,
-                         PROMPT_EXTRACT_SEARCH_PLACES_INFO)
+                         PROMPT_EXTRACT_SEARCH_PLACES_INFO,
+                         PROMPT_KNOWN_LOCATIONS)
+from result_projection import (MAX_RESULT_CHARS, project_places,
+                               project_route, records_to_place_refs,
+                               render_place_page, render_places, render_route,
+                               render_stop_plan)
+from result_store import result_store
+from route_legs import route_by_legs
+from route_profiles import get_route_profile, slim_route_response
+from search_radius import DEFAULT_RADIUS_M, adaptive_search
 from state_manager import StateManager
+from stop_planner import parse_driving_hours, plan_stops
+from token_accounting import (BUDGET_MODEL, CACHED_ANSWERS, CHEAP_MODEL,
+                              answer_cache, budget_history, estimate_tokens,
+                              response_usage, token_accountant)
+from trip_optimizer import optimize_waypoint_order
 
 # Load environment variables
 env_vars = load_environment()
+OPENROUTER_API_KEY = env_vars["OPENROUTER_API_KEY"]
 TOMTOM_API_KEY = env_vars["TOMTOM_API_KEY"]
 HERE_API_KEY = env_vars["HERE_API_KEY"]
 
+# Backend of the routing functions below: "mock" answers from the api-mock fixtures, "local"
+# from the road graph of the OSM extract named by LOCAL_ROAD_NETWORK (see local_router)
+ROUTING_BACKEND = os.getenv("ROUTING_BACKEND", "mock")
+
+# Place records kept in session state per search, the rest stays in the result store (and on the map)
+MAX_SESSION_PLACES = 20
+
+# Prefetched stop searches answer follow-up searches of these place types
+PREFETCH_KINDS = {"hotel": "hotel", "restaurant": "meal"}
+
 # Initialize API clients
 # def get_api_clients():
 #     tomtom_api = TomTomAPI(TOMTOM_API_KEY)
@@ -58,6 +87,11 @@ class SearchPlacesCallEvent(Event):
     location: Dict[str, float]
     place_type: str
     message: str
+    food_types: Optional[List[str]] = None
+
+class PlacesPageEvent(Event):
+    """Streamed while a place search pages through results: the formatted pins of one page."""
+    text: str
 
 class RouteInfoEvent(Event):
     """Event for route information extraction."""
@@ -74,22 +108,58 @@ class RouteCallEvent(Event):
     route_info: Dict[str, Any]
     message: str
 
+class StopPlanEvent(Event):
+    """Event for planning the overnight and meal stops of a multi-day route."""
+    route_ref: str
+    route_message: str
+    max_driving_hours: float
+
 class TripPlannerAgent(Workflow):
     """Trip planner workflow implementation."""
 
-    def __init__(self, api_key: str, model_name: str = "google/gemma-3-27b-it"):
+    def __init__(self, api_key: str, model_name: Optional[str] = None, llm=None):
         super().__init__(verbose=True) # TODO: remove verbose=True after testing
-        self.llm = OpenRouter(
-            api_key=api_key,
-            model=model_name,
-            max_tokens=2048,
-            temperature=0.7,
-            top_p=0.9,
-            frequency_penalty=0.0,
-            presence_penalty=0.0
-        )
-        StateManager.init_session_state()
-        draw_all_possible_flows(self, filename="workflowviz.html") # Use open workflowviz.html to visualize the workflow, remove after testing
+        self.api_key = api_key
+        # When set, every step uses this model (see model_tiers.STEP_MODELS for the per-step models)
+        self.model_name = model_name
+        # Any llama_index LLM can be passed in (e.g. the fake LLM of the benchmarks), else OpenRouter is used
+        self._llm = llm
+        # OpenRouter clients by (model, max_tokens)
+        self._clients: Dict[Tuple[str, int], Any] = {}
+
+    def step_model(self, step: str, degradation: int = 0) -> StepModel:
+        """
+        Model, output cap and hedge model of a step. A passed-in LLM or model serves every
+        step, unhedged. Once a token budget is nearly spent, the budget model does, unhedged.
+        """
+        tier = STEP_MODELS[step]
+        if self._llm is not None:
+            return StepModel(model=self.model_name or self._llm.metadata.model_name, max_tokens=tier.max_tokens)
+        if self.model_name:
+            return StepModel(model=self.model_name, max_tokens=tier.max_tokens)
+        if degradation >= CHEAP_MODEL:
+            return StepModel(model=BUDGET_MODEL, max_tokens=tier.max_tokens)
+        return tier
+
+    def get_llm(self, model: str, max_tokens: int):
+        """Create the OpenRouter client of a model on first use so importing/constructing the agent stays cheap"""
+        # Not a property: Workflow introspects instance members while collecting steps,
+        # which would trigger the heavy import at construction time.
+        if self._llm is not None:
+            return self._llm
+        key = (model, max_tokens)
+        if key not in self._clients:
+            from llama_index.llms.openrouter import OpenRouter
+            self._clients[key] = OpenRouter(
+                api_key=self.api_key,
+                model=model,
+                max_tokens=max_tokens,
+                temperature=0.7,
+                top_p=0.9,
+                frequency_penalty=0.0,
+                presence_penalty=0.0
+            )
+        return self._clients[key]
 
     async def extract_location_and_place_type(self, message: str) -> Tuple[Optional[Dict[str, float]], Optional[str]]:
         """
@@ -116,16 +186,18 @@ class TripPlannerAgent(Workflow):
 
         return location, place_type
     
-    async def search_places_fn(self, location: Tuple[float, float], radius: int = 8047, type: str = "") -> Dict[str, Any]:
+    async def search_places_fn(self, location: Tuple[float, float], radius: int = 8047, type: str = "", food_types: Optional[List[str]] = None, limit: int = 20) -> Dict[str, Any]:
         """Mock function to simulate search_places API call"""
         print(f"\n=== Mock search_places_fn called ===")
         print(f"Location: {location}")
         print(f"Radius: {radius} meters")
+        print(f"Limit: {limit}")
         print(f"Type: {type}")
+        print(f"Food types: {food_types}")
         print("=== End mock search_places_fn ===\n")
         
         # Real API call would be:
-        # result = await here_api.search_places(location, radius, type)
+        # result = await here_api.search_places(location, radius, categories, food_types, limit)
         
         # Read and return the mock location response
         try:
@@ -135,39 +207,99 @@ class TripPlannerAgent(Workflow):
             print(f"Error reading location-response.json: {e}")
             return {"items": []}
 
-    async def calculate_route_fn(self, start: Tuple[float, float], end: Tuple[float, float], waypoints: List[Tuple[float, float]], depart_at: str = None) -> Dict[str, Any]:
+    async def search_place_pages_fn(self, location: Tuple[float, float], radius: int = 8047, type: str = "", food_types: Optional[List[str]] = None, first_page: Optional[Dict[str, Any]] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Mock function to simulate paging through search results, yields browse-shaped pages"""
+        # Real API call would be:
+        # async for page in here_api.iter_places(location, radius, categories, food_types, first_page=first_page):
+        #     yield page
+
+        # The mock response fits in a single page
+        if first_page is not None:
+            yield first_page
+            return
+        yield await self.search_places_fn(location=location, radius=radius, type=type, food_types=food_types)
+
+    async def calculate_route_fn(self, start: Tuple[float, float], end: Tuple[float, float], waypoints: List[Tuple[float, float]], depart_at: str = None, profile: str = "map") -> Dict[str, Any]:
         """Mock function to simulate calculate_route API call"""
         print(f"\n=== Mock calculate_route_fn called ===")
         print(f"Start location: {start}")
         print(f"End location: {end}")
         print(f"Waypoints: {waypoints}")
         print(f"Departure time: {depart_at}")
+        print(f"Profile: {profile}")
         print("=== End mock calculate_route_fn ===\n")
         
         # Real API call would be:
-        # result = await tomtom_api.calculate_route(start, end, waypoints, depart_at)
+        # result = await tomtom_api.calculate_route(start, end, waypoints, depart_at, profile)
+
+        router = self.local_router()
+        if router is not None:
+            return await asyncio.to_thread(router.calculate_route, start, end, None, depart_at, profile, waypoints)
         
-        # Read and return the mock route response
+        # Read the mock route response (recorded with every section) and keep what the profile asks for
         try:
             with open('api-mock/route-response.json', 'r') as f:
-                return json.load(f)
+                return slim_route_response(json.load(f), get_route_profile(profile))
         except Exception as e:
             print(f"Error reading route-response.json: {e}")
             return {"routes": []}
 
-    async def async_chat(self, message: Dict[str, str], history) -> str:
-        """Process user message and return agent response"""
+    async def calculate_matrix_fn(self, origins: List[Tuple[float, float]], destinations: List[Tuple[float, float]]) -> List[List[Optional[float]]]:
+        """Mock function to simulate calculate_matrix API call"""
+        print(f"\n=== Mock calculate_matrix_fn called ===")
+        print(f"Origins: {origins}")
+        print(f"Destinations: {destinations}")
+        print("=== End mock calculate_matrix_fn ===\n")
+
+        # Real API call would be:
+        # data = tomtom_api.calculate_matrix(origins, destinations)
+
+        router = self.local_router()
+        if router is not None:
+            return await asyncio.to_thread(router.calculate_matrix, origins, destinations)
+
+        # There is no recorded matrix response, so no pair is measured: the optimizer keeps
+        # its own estimates for them, and the travel time cache only ever holds measured times
+        data = {"data": [
+            {"originIndex": i, "destinationIndex": j, "detailedError": {"message": "No recorded matrix response"}}
+            for i in range(len(origins)) for j in range(len(destinations))
+        ]}
+        return TomTomAPI.extract_matrix_travel_times(data, len(origins), len(destinations))
+
+    def local_router(self):
+        """Local road graph router when ROUTING_BACKEND is "local", else None (fixtures are used)"""
+        if ROUTING_BACKEND != "local":
+            return None
+        router = get_local_router()
+        if router is None:
+            print("ROUTING_BACKEND is local but LOCAL_ROAD_NETWORK is not set, using the fixtures")
+        return router
+
+    async def search_stop_fn(self, kind: str, location: Tuple[float, float]) -> Dict[str, Any]:
+        """Search used by the stop planner: hotels for overnight stops, restaurants for meals"""
+        return await self.search_places_fn(location=location, radius=8047, type="hotel" if kind == "hotel" else "restaurant")
+
+    async def async_chat(self, message: Dict[str, str], session: Dict[str, Any], on_progress: Optional[Callable[[str], None]] = None) -> str:
+        """
+        Process user message and return agent response.
+        session holds the per-session state (see StateManager.export_session). It travels
+        through the workflow Context and is updated in place when the run finishes, so one
+        agent instance can serve many sessions concurrently.
+        on_progress, if given, receives partial response text (e.g. pages of place results)
+        before the final response is ready. It is called on the event loop thread.
+        """
         print(f"\nUser message: {message}")
         
         try:
-            # Create context with functions
+            # Create context with the per-session state
+            StateManager.init_session_state(session)
+            # A session resumed from its snapshot keeps the budget it already used
+            token_accountant.restore_session(session["session_id"], session["token_usage"])
             ctx = Context(self)
-            await ctx.set("search_places_fn", self.search_places_fn)
-            await ctx.set("calculate_route_fn", self.calculate_route_fn)
-            self.verbose = True
+            await ctx.store.set("session", session)
             # Run workflow with streaming
-            # Copy history to avoid modifying original
-            trimmed_history = history.copy()
+            # Copy history to avoid modifying original, only the latest messages once the token budget runs low
+            trimmed_history = budget_history(session["messages"], session["session_id"]).copy()
 
             # Remove last item only if it's a user message
             if trimmed_history and trimmed_history[-1].get("role") == "user":
@@ -180,14 +312,26 @@ class TripPlannerAgent(Workflow):
 
             
             # Process streaming events
+            from llama_index.core.agent.workflow import AgentOutput
             async for event in handler.stream_events():
-                if isinstance(event, AgentOutput):
+                if isinstance(event, PlacesPageEvent):
+                    if on_progress is not None:
+                        on_progress(event.text)
+                elif isinstance(event, AgentOutput):
                     print("Agent output: ", event.response)
                     print("Tool calls made: ", event.tool_calls)
                     print("Raw LLM response: ", event.raw)
             
             # Get final response
-            return str(await handler)
+            result = str(await handler)
+
+            # Steps work on the copy held by the context, hand the final state back to the caller
+            session.update(await ctx.store.get("session"))
+            session["token_usage"] = token_accountant.session_totals(session["session_id"])
+            usage = token_accountant.session_usage(session["session_id"])
+            print(f"Session tokens: {usage.prompt_tokens} prompt, {usage.completion_tokens} completion "
+                  f"in {usage.calls} LLM calls (~${usage.cost_usd:.4f})")
+            return result
                 
         except Exception as e:
             print(f"Error in async_chat: {e}")
@@ -210,9 +354,10 @@ class TripPlannerAgent(Workflow):
         Your response should be a single word 'ONTOPIC'.
         """
         
-        result = self.llm.complete(prompt)
+        session = await ctx.store.get("session")
+        result = await self.complete_text("intent", prompt, session["session_id"])
         print(f"Determine intent result: {result}")
-        return IntentEvent(message=message, result=str(result).strip())
+        return IntentEvent(message=message, result=result)
 
     @step
     async def convo_offtopic(self, ctx: Context, ev: IntentEvent) -> SearchPlacesInfoEvent | StopEvent:
@@ -220,10 +365,12 @@ class TripPlannerAgent(Workflow):
         print(f"Convo offtopic ev: {ev}")
         
         # Retrieve the current off-topic count from the session state
-        off_topic_count = st.session_state.get("off_topic_count", 0)
+        session = await ctx.store.get("session")
+        off_topic_count = session.get("off_topic_count", 0)
         
         if ev.result == "ONTOPIC":
-            st.session_state["off_topic_count"] = 0  # reset off-topic count
+            session["off_topic_count"] = 0  # reset off-topic count
+            await ctx.store.set("session", session)
 
             # Wrap the message in a new SearchPlacesInfoEvent
             info_event = SearchPlacesInfoEvent(message=ev.message, location=None, place_type=None)
@@ -236,9 +383,13 @@ class TripPlannerAgent(Workflow):
                 return search_places_event  # This could already be a StopEvent
 
         
+        # The conversation moved on, background searches along the last route are not needed now
+        prefetcher.cancel(session["session_id"])
+
         # Increment the off-topic count
         off_topic_count += 1
-        st.session_state["off_topic_count"] = off_topic_count  # Update the session state with the new count
+        session["off_topic_count"] = off_topic_count  # Update the session state with the new count
+        await ctx.store.set("session", session)
         print(f"Off-topic count: {off_topic_count}")
         
         if off_topic_count >= 3 and off_topic_count < 5:
@@ -249,43 +400,98 @@ class TripPlannerAgent(Workflow):
             # Provide a friendly response for off-topic messages
             return StopEvent(result=ev.result)
 
-    def extract_json_from_text(self, text: str) -> Optional[Any]:
+    def extract_json_from_text(self, text: str, schema: Optional[Schema] = None) -> Optional[Any]:
         """
-        Attempts to extract and parse the first JSON object from a string,
-        even if surrounded by extra text or malformed.
+        Extract the first JSON object matching the schema from a string,
+        even if surrounded by extra text, markdown fences or other objects.
         """
-        try:
-            # Try direct parse first (for well-formed JSON)
-            return json.loads(text)
-        except json.JSONDecodeError:
-            pass
-
-        # Remove any markdown code blocks or whitespace
-        cleaned = text.strip("` \n\t")
+        return extract_json(text, schema)
 
-        # Fix double braces {{...}} -> {...}
-        cleaned = re.sub(r"^\{\{(.+?)\}\}$", r"{\1}", cleaned, flags=re.DOTALL)
+    async def complete_text(self, step: str, prompt: str, session_id: Optional[str] = None) -> str:
+        """
+        Complete a prompt with the step's model, hedged with its fallback model when the call
+        is slow. Usage is accounted to the session; once its budget is spent, an earlier
+        answer to the same prompt is reused.
+        """
+        degradation = token_accountant.degradation(session_id)
+        if degradation >= CACHED_ANSWERS:
+            cached = answer_cache.get(step, prompt)
+            if cached is not None:
+                print(f"Token budget spent, reusing the {step} answer to the same prompt")
+                return cached
+        tier = self.step_model(step, degradation)
+
+        async def call(model: str) -> str:
+            try:
+                response = await timed(model, self.get_llm(model, tier.max_tokens).acomplete(prompt))
+            except asyncio.CancelledError:
+                token_accountant.record(session_id, step, model, estimate_tokens(prompt), 0)
+                raise
+            text = str(response).strip()
+            prompt_tokens, completion_tokens = response_usage(response) or (estimate_tokens(prompt), estimate_tokens(text))
+            token_accountant.record(session_id, step, model, prompt_tokens, completion_tokens)
+            return text
+
+        result = await hedged(
+            lambda: call(tier.model),
+            (lambda: call(tier.fallback)) if tier.fallback else None,
+            latency_tracker.hedge_delay(tier.model),
+            lambda text: bool(text)
+        )
+        if result:
+            answer_cache.put(step, prompt, result)
+        return result
 
-        # Find the first { ... } block and try parsing it
-        match = re.search(r"\{.*\}", cleaned, re.DOTALL)
-        if match:
-            json_str = match.group(0)
+    async def complete_json(self, step: str, prompt: str, schema: Optional[Schema] = None,
+                            session_id: Optional[str] = None) -> Tuple[Optional[Any], str]:
+        """
+        Stream a completion and stop generating as soon as the first JSON object
+        matching the schema is closed. Returns the parsed object and the raw text received.
+        A slow call is hedged with the step's fallback model, the first parsed object wins.
+        Accounted and degraded like complete_text (streams report no usage, it is estimated).
+        """
+        degradation = token_accountant.degradation(session_id)
+        if degradation >= CACHED_ANSWERS:
+            cached = answer_cache.get(step, prompt)
+            if cached is not None:
+                print(f"Token budget spent, reusing the {step} answer to the same prompt")
+                return cached
+        tier = self.step_model(step, degradation)
+
+        async def call(model: str) -> Tuple[Optional[Any], str]:
+            async def stream_json() -> Tuple[Optional[Any], str]:
+                stream = await self.get_llm(model, tier.max_tokens).astream_complete(prompt)
+                try:
+                    return await aextract_json_from_stream(stream, schema)
+                finally:
+                    await stream.aclose()
             try:
-                return json.loads(json_str)
-            except json.JSONDecodeError as e:
-                print(f"Failed to parse JSON: {e}")
-                return None
-        return None
+                answer = await timed(model, stream_json())
+            except asyncio.CancelledError:
+                token_accountant.record(session_id, step, model, estimate_tokens(prompt), 0)
+                raise
+            token_accountant.record(session_id, step, model, estimate_tokens(prompt), estimate_tokens(answer[1]))
+            return answer
+
+        result = await hedged(
+            lambda: call(tier.model),
+            (lambda: call(tier.fallback)) if tier.fallback else None,
+            latency_tracker.hedge_delay(tier.model),
+            lambda answer: answer[0] is not None
+        )
+        if result[0] is not None:
+            answer_cache.put(step, prompt, result)
+        return result
 
     @step
     async def extract_search_places_info(self, ctx: Context, ev: SearchPlacesInfoEvent) -> SearchPlacesExamineEvent | RouteInfoEvent | StopEvent:
         try:
             print(f"Extract search places info ev: {ev}")
             message = ev.message
-            prompt = f"\n\n {PROMPT_EXTRACT_SEARCH_PLACES_INFO}\n\n Here is the convo history till now: {st.session_state.messages}\n\n and The user has posted the following message.\n Current Message: {message}\n\n"
+            session = await ctx.store.get("session")
+            prompt = f"\n\n {PROMPT_EXTRACT_SEARCH_PLACES_INFO}\n\n Here is the convo history till now: {budget_history(session['messages'], session['session_id'])}\n\n and The user has posted the following message.\n Current Message: {message}\n\n"
 
-            result = self.llm.complete(prompt)
-            parsed = self.extract_json_from_text(str(result))
+            parsed, result = await self.complete_json("search", prompt, SEARCH_PLACES_SCHEMA, session["session_id"])
 
             if parsed is None:
                 print(f"Failed to extract JSON from result: {result}")
@@ -296,10 +502,11 @@ class TripPlannerAgent(Workflow):
                 print(f"LLM analysis thought: {parsed['thought']}")
 
                 # Optionally, log ambiguous input
-                StateManager.update_app_state("ambiguous", {
+                StateManager.update_app_state(session, "ambiguous", {
                     "original": ev.message,
                     "llm_thought": parsed["thought"]
                 })
+                await ctx.store.set("session", session)
 
                 print(f"LLM analysis thought: {parsed['thought']}")
                 # return StopEvent(
@@ -325,10 +532,11 @@ class TripPlannerAgent(Workflow):
                 return StopEvent(result="The location data seems incomplete. Could you give a more specific place?")
 
             # Save extracted data to app state
-            StateManager.update_app_state("place_search_info", {
+            StateManager.update_app_state(session, "place_search_info", {
                 "location": location,
                 "place_type": place_type
             })
+            await ctx.store.set("session", session)
             
             return RouteInfoEvent(message=message)
         
@@ -347,11 +555,49 @@ class TripPlannerAgent(Workflow):
         valid_types = ["restaurant", "rest_area", "hotel"]
         if ev.place_type not in valid_types:
             return StopEvent(result="The type of place is not valid. Please specify if you are looking for a restaurant, rest area, or hotel.")
-            
+
+        # Narrow restaurant searches to the cuisine the user asked for ("sushi", "bbq", ...),
+        # matched against the local HERE food type catalog instead of another LLM call
+        food_types = None
+        if ev.place_type == "restaurant":
+            current_message = ev.message.rsplit("Current User Message:", 1)[-1]
+            food_types = get_food_type_index().match(current_message) or None
+
         return SearchPlacesCallEvent(
             location=ev.location,
             place_type=ev.place_type,
-            message=ev.message
+            message=ev.message,
+            food_types=food_types
+        )
+
+    async def place_pages(self, location: Tuple[float, float], place_type: str, food_types: Optional[List[str]]) -> Tuple[int, AsyncIterator[Dict[str, Any]]]:
+        """
+        Radius and pages of a place search. Answered from the searches prefetched along the
+        last route when possible, else searched with a radius adapted to the area's density.
+        """
+        kind = PREFETCH_KINDS.get(place_type)
+        if kind and not food_types:
+            prefetched = await prefetcher.lookup(kind, location)
+            if prefetched is not None:
+                print(f"Answering {place_type} search near {location} from prefetched results")
+                return DEFAULT_RADIUS_M, single_page(prefetched)
+
+        # Densities differ per place type and cuisine filter, each is learned on its own
+        density_kind = place_type + (":" + ",".join(sorted(food_types)) if food_types else "")
+        search = await adaptive_search(
+            location,
+            density_kind,
+            lambda radius, limit: self.search_places_fn(location=location, radius=radius, type=place_type, food_types=food_types, limit=limit)
+        )
+        print(f"Searched {place_type} near {location} with radius {search.radius} m in {search.steps} request(s)")
+        if search.complete:
+            return search.radius, single_page(search.page)
+        return search.radius, self.search_place_pages_fn(
+            location=location,
+            radius=search.radius,
+            type=place_type,
+            food_types=food_types,
+            first_page=search.page
         )
 
     @step
@@ -359,39 +605,59 @@ class TripPlannerAgent(Workflow):
         
         """Make the search places API call. Update the app state with the search results."""
         print(f"Call search places ev: {ev}")
-        # Get the search_places function from context
-        search_places_fn = await ctx.get("search_places_fn")
-        
-        # Call the function
-        result = await search_places_fn(
-            location=(ev.location["lat"], ev.location["lon"]),
-            radius=8047,  # 5 miles
-            type=ev.place_type
-        )
+        # Page through the results, each page is formatted on its own and streamed to the chat
+        items = []
+        places = []
+        remaining = MAX_RESULT_CHARS
+        radius, pages = await self.place_pages((ev.location["lat"], ev.location["lon"]), ev.place_type, ev.food_types)
+        async for page in pages:
+            records = project_places(page)
+            text = render_place_page(records, len(places), remaining)
+            remaining -= len(text)
+            ctx.write_event_to_stream(PlacesPageEvent(text=text))
+            items.extend(page.get("items", []))
+            places.extend(records)
         
+        # Keep the full payload server-side, session state only gets compact records and a handle
+        result = {"items": items}
+        session = await ctx.store.get("session")
+        ref = result_store.put("places", result, session_id=session["session_id"])
+
         # Update app state with search results
-        StateManager.update_app_state("search", {
+        StateManager.update_app_state(session, "searches", {
             'location': ev.location,
-            'radius': 8047,
+            'radius': radius,
             'type': ev.place_type,
-            'results': result
+            'food_types': ev.food_types,
+            'ref': ref,
+            'total': len(places),
+            'places': records_to_place_refs(places[:MAX_SESSION_PLACES])
         })
+        await ctx.store.set("session", session)
         
-        return StopEvent(result=str(result))
+        return StopEvent(result=render_places(places))
 
     @step
     async def extract_route_info(self, ctx: Context, ev: RouteInfoEvent) -> RouteExamineEvent | StopEvent:
         """Extract route request parameters from user message. Update the app state with the route information."""
         print(f"Extract route info ev: {ev}")
         message = ev.message
+        session = await ctx.store.get("session")
         
-        prompt = f"\n\n{PROMPT_EXTRACT_ROUTE_INFO}\n\n Here is the convo history till now: {st.session_state.messages}\n\n and The user has posted the following message.\n Current Message: {message}\n\n"
+        # Places the session already located are named in the prompt, the LLM may give them by name only
+        known = known_location_names(session)
+        instructions = PROMPT_EXTRACT_ROUTE_INFO + (PROMPT_KNOWN_LOCATIONS.format(names=", ".join(known)) if known else "")
+        prompt = f"\n\n{instructions}\n\n Here is the convo history till now: {budget_history(session['messages'], session['session_id'])}\n\n and The user has posted the following message.\n Current Message: {message}\n\n"
         
-        result = self.llm.complete(prompt)
+        result = ""
         try:
-            route_info = json.loads(str(result))
+            route_info, result = await self.complete_json("route", prompt, ROUTE_INFO_SCHEMA, session["session_id"])
             if route_info:
-                StateManager.update_chat_state(route_info)
+                # Places given by name only, or re-derived close to where the session located them, keep those
+                # coordinates; missing ones come from the global memo
+                route_info = resolve_route_info(session, route_info)
+                StateManager.update_chat_state(session, route_info)
+                await ctx.store.set("session", session)
                 return RouteExamineEvent(route_info=route_info, message=message)
             else:
                 return StopEvent(result="I need more information to plan your route. Please provide start and end locations with coordinates, and maximum driving hours per day.")
@@ -404,7 +670,9 @@ class TripPlannerAgent(Workflow):
         """Examine if route calculation is feasible."""
         print(f"Examine route call ev: {ev}")
         route_info = ev.route_info
-        StateManager.update_chat_state(route_info)
+        session = await ctx.store.get("session")
+        StateManager.update_chat_state(session, route_info)
+        await ctx.store.set("session", session)
         
         # Check if all required coordinates and maxDrivingHoursPerDay are present
         if not all([
@@ -417,32 +685,136 @@ class TripPlannerAgent(Workflow):
         return RouteCallEvent(route_info=route_info, message=ev.message)
 
     @step
-    async def call_route(self, ctx: Context, ev: RouteCallEvent) -> StopEvent:
+    async def call_route(self, ctx: Context, ev: RouteCallEvent) -> StopPlanEvent | StopEvent:
         """Calculate the route api call. Update the app state with the route results."""
         print(f"Call route ev: {ev}")
-        # Get the calculate_route function from context
-        calculate_route_fn = await ctx.get("calculate_route_fn")
-        
         # Extract coordinates
         start_loc = (ev.route_info["start"]["lat"], ev.route_info["start"]["lon"])
         end_loc = (ev.route_info["end"]["lat"], ev.route_info["end"]["lon"])
         waypoints = [(wp["lat"], wp["lon"]) for wp in ev.route_info.get("waypoints", [])]
+        stops = list(ev.route_info.get("waypoints", []))
+
+        # Visit the stops in the order that makes the trip shortest (solved locally over a
+        # cached travel time matrix), then route the trip leg by leg in that order
+        optimized = None
+        end_at_start = bool(ev.route_info.get("endAtStart"))
+        if len(waypoints) > 1 or end_at_start:
+            optimized = await optimize_waypoint_order(start_loc, end_loc, waypoints, end_at_start, matrix_fn=self.calculate_matrix_fn)
+            if len(optimized["order"]) > len(stops):
+                stops.append(ev.route_info["end"])  # round trip: the end became one more stop
+            stops = [stops[i] for i in optimized["order"]]
+            waypoints = optimized["waypoints"]
+            end_loc = optimized["end"]
         
-        # Call the function
-        result = await calculate_route_fn(
-            start_loc,
-            end_loc,
-            waypoints,
-            ev.route_info.get("departAt", datetime.now().isoformat())
+        # The route is drawn on the map; with a daily driving limit the travel time along
+        # the route is needed as well to work out where each day ends. A limit that is not
+        # a number of hours (the LLM may answer "6 hours", or "unknown") plans no stops.
+        max_hours = parse_driving_hours(ev.route_info.get("maxDrivingHoursPerDay"))
+        if max_hours is None and ev.route_info.get("maxDrivingHoursPerDay"):
+            print(f"Ignoring maxDrivingHoursPerDay {ev.route_info.get('maxDrivingHoursPerDay')!r}, not a number of hours")
+        profile = "day_split" if max_hours else "map"
+
+        # Route the trip leg by leg: legs between unchanged stops come from the leg cache, so
+        # an edited stop or departure time only routes the legs that actually changed. With
+        # no leg cached, the trip is routed in one waypointed request and split into legs.
+        locations = [start_loc] + waypoints + [end_loc]
+        result, legs_routed = await route_by_legs(
+            locations,
+            ev.route_info.get("departAt", datetime.now().isoformat()),
+            profile,
+            lambda origin, destination, depart_at, profile: self.calculate_route_fn(origin, destination, [], depart_at, profile=profile),
+            trip_fn=lambda locations, depart_at, profile: self.calculate_route_fn(locations[0], locations[-1], locations[1:-1], depart_at, profile=profile)
         )
+        print(f"Routed {legs_routed} of {len(locations) - 1} legs ({len(locations) - 1 - legs_routed} from the leg cache)")
         
+        # Keep the full payload server-side, session state only gets the summary and a handle
+        route = project_route(result)
+        session = await ctx.store.get("session")
+        ref = result_store.put("route", result, session_id=session["session_id"])
+
         # Update app state with route results
-        StateManager.update_app_state("route", {
+        StateManager.update_app_state(session, "routes", {
             'start': ev.route_info.get('start'),
             'end': ev.route_info.get('end'),
-            'waypoints': ev.route_info.get('waypoints'),
-            'results': result
+            'endAtStart': end_at_start,
+            'waypoints': stops,
+            'waypoint_order': optimized["order"] if optimized else None,
+            'ref': ref,
+            'summary': asdict(route) if route else None,
+            # Geometry stays with the session (compact) so a resumed trip can be redrawn
+            'polyline': encode_polyline(extract_polyline_from_route(result))
         })
-        
-        return StopEvent(result="Your route has been displayed. If you need to make changes, please let me know.")()
+        await ctx.store.set("session", session)
+
+        response = render_route(route)
+        if optimized and optimized["order"] != sorted(optimized["order"]):
+            saved_minutes = (optimized["seconds_before"] - optimized["seconds_after"]) / 60
+            response += f"\n\nI reordered your stops to save about {saved_minutes:.0f} minutes of driving: " + \
+                " -> ".join(stop.get("name", f"{stop['lat']},{stop['lon']}") for stop in stops)
+
+        # Trips longer than a day of driving get their hotels and meal stops planned right away
+        plan_now = bool(route and max_hours and route.travel_time and route.travel_time > max_hours * 3600)
+
+        # The next question is usually about hotels or food along the route, search them in the
+        # background now (only the destination when the stops are planned right away anyway)
+        prefetcher.schedule(
+            session["session_id"],
+            prefetch_requests(result, None if plan_now else max_hours),
+            self.search_stop_fn
+        )
+
+        if plan_now:
+            return StopPlanEvent(route_ref=ref, route_message=response, max_driving_hours=max_hours)
+        return StopEvent(result=response)
+
+    @step
+    async def plan_trip_stops(self, ctx: Context, ev: StopPlanEvent) -> StopEvent:
+        """Search overnight hotels and midday meal stops for every day of the route in one batch."""
+        print(f"Plan trip stops ev: {ev}")
+        route_data = result_store.get(ev.route_ref)
+        if route_data is None:
+            return StopEvent(result=ev.route_message)
+
+        days, results = await plan_stops(route_data, ev.max_driving_hours, prefetcher.with_prefetch(self.search_stop_fn))
+
+        session = await ctx.store.get("session")
+        ref = result_store.put("stops", results, session_id=session["session_id"])
+        StateManager.update_app_state(session, "stop_plans", {
+            'route_ref': ev.route_ref,
+            'ref': ref,
+            'days': [
+                {**day, 'hotels': records_to_place_refs(day['hotels']), 'meals': records_to_place_refs(day['meals'])}
+                for day in days
+            ]
+        })
+        await ctx.store.set("session", session)
+
+        return StopEvent(result=ev.route_message + "\n\n" + render_stop_plan(days))
             
+
+
+async def single_page(page: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+    """A search answered by one page, in the shape of a paged search"""
+    yield page
+
+
+def draw_workflow(filename: str = "workflowviz.html") -> str:
+    """Render all possible workflow flows to an HTML file (open it in a browser to inspect the workflow)"""
+    from llama_index.utils.workflow import draw_all_possible_flows
+
+    agent = TripPlannerAgent(api_key=OPENROUTER_API_KEY)
+    draw_all_possible_flows(agent, filename=filename)
+    return filename
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Trip planner workflow tools")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    draw_parser = subparsers.add_parser("draw", help="Write the workflow visualization to an HTML file")
+    draw_parser.add_argument("--output", default="workflowviz.html", help="Output HTML file")
+    args = parser.parse_args()
+
+    if args.command == "draw":
+        print(f"Workflow visualization written to {draw_workflow(args.output)}")
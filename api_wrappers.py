@@ -1,8 +1,41 @@
+import asyncio
 import json
-from typing import Any, Dict, List, Optional, Tuple
+import math
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 
 import requests
 
+from here_catalog import get_catalog
+from local_router import get_local_router
+from route_profiles import (DEFAULT_ROUTE_PROFILE, get_route_profile,
+                            route_request_params, slim_route_response)
+from trip_optimizer import haversine_distances
+
+# HERE browse returns at most 100 items per request and has no offset to page with
+MAX_BROWSE_LIMIT = 100
+
+
+def page_areas(location: Tuple[float, float], radius: float) -> List[Tuple[Tuple[float, float], float]]:
+    """
+    Search areas used as pages: the full circle first, then 7 circles of half the radius
+    (the center and a ring of 6 at 0.866 r) which together cover it, so a dense area
+    still yields everything the single capped request could not return.
+    """
+    lat, lon = location
+    sub_radius = radius / 2
+    ring_distance = radius * math.sqrt(3) / 2
+    meters_per_deg_lat = 111320.0
+    meters_per_deg_lon = meters_per_deg_lat * max(0.01, math.cos(math.radians(lat)))
+    areas = [(location, radius), (location, sub_radius)]
+    for k in range(6):
+        angle = math.radians(60 * k)
+        areas.append((
+            (lat + ring_distance * math.cos(angle) / meters_per_deg_lat,
+             lon + ring_distance * math.sin(angle) / meters_per_deg_lon),
+            sub_radius
+        ))
+    return areas
+
 
 class TomTomAPI:
     def __init__(self, api_key: str):
@@ -38,23 +71,22 @@ class TomTomAPI:
         start_location: Tuple[float, float], 
         end_location: Tuple[float, float], 
         supporting_points: List[Tuple[float, float]] = None,
-        departure_time: str = None
+        departure_time: str = None,
+        profile: str = DEFAULT_ROUTE_PROFILE,
+        waypoints: List[Tuple[float, float]] = None
     ) -> Dict[str, Any]:
-        """Calculate a route using TomTom API"""
-        start_str = f"{start_location[0]},{start_location[1]}"
-        end_str = f"{end_location[0]},{end_location[1]}"
+        """
+        Calculate a route using TomTom API, requesting and keeping only what the route profile needs.
+        waypoints are stops visited in the given order, supporting_points only shape the route.
+        """
+        route_profile = get_route_profile(profile)
+        locations = [start_location] + list(waypoints or []) + [end_location]
+        locations_str = ":".join(f"{lat},{lon}" for lat, lon in locations)
         
-        url = f"{self.base_url}/routing/1/calculateRoute/{start_str}:{end_str}/json"
+        url = f"{self.base_url}/routing/1/calculateRoute/{locations_str}/json"
         
-        params = {
-            "instructionsType": "text",
-            "routeRepresentation": "polyline",
-            "computeTravelTimeFor": "all",
-            "routeType": "fastest",
-            "traffic": "true",
-            "extendedRouteRepresentation": "travelTime",
-            "key": self.api_key
-        }
+        params = route_request_params(route_profile)
+        params["key"] = self.api_key
         
         if departure_time:
             params["departAt"] = departure_time
@@ -75,12 +107,58 @@ class TomTomAPI:
         try:
             response = requests.post(url, params=params, json=data if data else None)
             response.raise_for_status()
-            return response.json()
+            return slim_route_response(response.json(), route_profile)
         except (requests.RequestException, json.JSONDecodeError) as e:
             print(f"Error calculating route API: {str(e)}")
+            # Fail over to the local road graph when one is configured
+            router = get_local_router()
+            if router is not None:
+                print("Routing on the local road graph instead")
+                return router.calculate_route(start_location, end_location, supporting_points, departure_time, profile, waypoints)
             return {}
     
-    def extract_route_summary(self, route_data: Dict[str, Any]) -> Dict[str, Any]:
+    def calculate_matrix(
+        self,
+        origins: List[Tuple[float, float]],
+        destinations: List[Tuple[float, float]],
+        departure_time: str = None
+    ) -> Dict[str, Any]:
+        """Travel times between every origin and destination with the synchronous Matrix Routing v2 API"""
+        url = f"{self.base_url}/routing/matrix/2"
+        params = {"key": self.api_key}
+        data = {
+            "origins": [{"point": {"latitude": lat, "longitude": lon}} for lat, lon in origins],
+            "destinations": [{"point": {"latitude": lat, "longitude": lon}} for lat, lon in destinations],
+            "options": {
+                "departAt": departure_time or "now",
+                "routeType": "fastest",
+                "traffic": "historical"
+            }
+        }
+
+        print(f"\nMatrix API call: {len(origins)} x {len(destinations)}")
+
+        try:
+            response = requests.post(url, params=params, json=data)
+            response.raise_for_status()
+            return response.json()
+        except (requests.RequestException, json.JSONDecodeError) as e:
+            print(f"Error calculating matrix API: {str(e)}")
+            return {}
+
+    @staticmethod
+    def extract_matrix_travel_times(matrix_data: Dict[str, Any], n_origins: int, n_destinations: int) -> List[List[Optional[float]]]:
+        """Travel time in seconds per [origin][destination] of a matrix response, None where no route was found"""
+        times: List[List[Optional[float]]] = [[None] * n_destinations for _ in range(n_origins)]
+        for cell in matrix_data.get('data', []):
+            summary = cell.get('routeSummary')
+            if summary is None:
+                continue
+            times[cell['originIndex']][cell['destinationIndex']] = summary.get('travelTimeInSeconds')
+        return times
+
+    @staticmethod
+    def extract_route_summary(route_data: Dict[str, Any]) -> Dict[str, Any]:
         """Extract summary information from a route"""
         summary = {
             'distance': None,
@@ -120,31 +198,11 @@ class HereAPI:
         self.api_key = api_key
         self.base_url = "https://browse.search.hereapi.com/v1"
         
-        # Common category groups
-        self.meal_categories = [
-            "100", "100-1000-0000", "100-1000-0001", "100-1000-0002", "100-1000-0003", 
-            "100-1000-0004", "100-1000-0005", "100-1000-0006", "100-1000-0007", 
-            "100-1000-0008", "100-1000-0009", "100-1000-0050", "100-1100-0000", 
-            "100-1100-0010", "100-1100-0331"
-        ]
-        
-        self.rest_categories = [
-            "400-4300", "550", "800-8500", "800-8300", "700-7600", "600-6000", 
-            "600-6100", "600-6200", "600-6300-0066", "600-6400", "600-6600", 
-            "600-6900-0247", "700-7460", "700-7850", "700-7900", "900-9200"
-        ]
-        
-        self.hotel_categories = [
-            "550", "500-5000-0000", "500-5000-0053", "500-5000-0054", "500-5100-0000", 
-            "500-5100-0055", "500-5100-0056", "500-5100-0057", "500-5100-0058", 
-            "500-5100-0059", "500-5100-0060", "500-5100-0061", "550-5510-0000", 
-            "550-5510-0202", "550-5510-0203", "550-5510-0204", "550-5510-0205", 
-            "550-5510-0206", "550-5510-0227", "550-5510-0242", "550-5510-0358", 
-            "550-5510-0359", "550-5510-0374", "550-5510-0378", "550-5510-0379", 
-            "550-5510-0380", "550-5510-0387", "550-5520-0000", "550-5520-0207", 
-            "550-5520-0208", "550-5520-0209", "550-5520-0210", "550-5520-0211", 
-            "550-5520-0212", "550-5520-0228", "550-5520-0357"
-        ]
+        # Common category groups, from the catalogs in here/categories
+        catalog = get_catalog()
+        self.meal_categories = list(catalog.group("meal"))
+        self.rest_categories = list(catalog.group("rest"))
+        self.hotel_categories = list(catalog.group("hotel"))
         
         self.gas_stations = ["700-7600"]
     
@@ -164,6 +222,8 @@ class HereAPI:
             "at": f"{lat},{lon}",
             "in": f"circle:{lat},{lon};r={radius}",
             "limit": limit,
+            # Time zone of each place, its opening hours are in local time
+            "show": "tz",
             "apiKey": self.api_key
         }
         
@@ -181,16 +241,66 @@ class HereAPI:
             print(f"Error searching places: {str(e)}")
             return {"items": []}
     
+    async def iter_places(
+        self,
+        location: Tuple[float, float],
+        radius: int = 8047,
+        categories: List[str] = None,
+        food_types: List[str] = None,
+        page_size: int = MAX_BROWSE_LIMIT,
+        first_page: Dict[str, Any] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Page through the places of an area, yielding browse-shaped {"items": [...]} pages
+        as they arrive. Stops after the first page unless it came back full; further pages
+        search the sub-areas of page_areas() and only yield places not seen before.
+        first_page is the response of the full circle when the caller already has it.
+        """
+        seen = set()
+        for index, (center, area_radius) in enumerate(page_areas(location, radius)):
+            if index == 0 and first_page is not None:
+                data = first_page
+            else:
+                data = await asyncio.to_thread(
+                    self.search_places, center, int(area_radius), categories, food_types, page_size
+                )
+            items = data.get('items', [])
+            outside = set()
+            if index > 0:
+                # Sub-areas reach beyond the requested circle, the page is measured in one go
+                positioned = [i for i, item in enumerate(items)
+                              if 'lat' in item.get('position', {}) and 'lng' in item.get('position', {})]
+                if positioned:
+                    distances = haversine_distances(
+                        location, [(items[i]['position']['lat'], items[i]['position']['lng']) for i in positioned]
+                    )
+                    outside = {i for i, distance in zip(positioned, distances) if distance > radius}
+            fresh = []
+            for i, item in enumerate(items):
+                # Places without an id cannot be recognized on another page, they are all kept
+                place_id = item.get('id')
+                if i in outside or (place_id is not None and place_id in seen):
+                    continue
+                if place_id is not None:
+                    seen.add(place_id)
+                fresh.append(item)
+            if fresh:
+                yield {'items': fresh}
+            if index == 0 and len(items) < page_size:
+                return  # everything fit in the first page
+
     def search_meal_places(
         self, 
         location: Tuple[float, float], 
         radius: int = 8047,
         food_type: str = None,
-        limit: int = 20
+        limit: int = 20,
+        food_types: List[str] = None
     ) -> Dict[str, Any]:
-        """Search for meal places near a location"""
+        """Search for meal places near a location, optionally restricted to HERE food type ids"""
         categories = self.meal_categories
-        food_types = [food_type] if food_type else None
+        if food_type:
+            food_types = [food_type] + [ft for ft in (food_types or []) if ft != food_type]
         
         return self.search_places(location, radius, categories, food_types, limit)
     
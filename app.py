@@ -1,7 +1,8 @@
 #source venv/bin/activate && streamlit run app.py
-import asyncio
 import datetime
 import os
+import queue
+import time
 from typing import Any, Dict, List, Optional, Tuple
 
 import folium
@@ -9,8 +10,15 @@ import streamlit as st
 from streamlit_folium import st_folium
 
 # Import custom modules
-from agent_handler import TripPlannerAgent
+from chat_components import display_chat_history, display_message
+# agent_handler (llama_index, OpenRouter) is imported lazily in get_agent() to keep the first render fast
 from load_env import load_environment
+from loop_runner import get_loop_runner
+from map_utils import add_fast_marker_layer, add_route_to_map, place_marker_rows
+from polyline_codec import decode_polyline
+from result_projection import project_places, records_to_dicts, resolve_place_refs
+from result_store import result_store
+from session_store import SQLiteSessionStore
 from state_manager import StateManager
 
 # Set page configuration
@@ -20,12 +28,26 @@ st.set_page_config(page_title="Rovis Streamlit AI", layout="wide")
 env_vars = load_environment()
 OPENROUTER_API_KEY = env_vars["OPENROUTER_API_KEY"]
 
-# Initialize session state
+# Durable session snapshots, so a restart or a reconnect to another replica resumes the trip
+@st.cache_resource
+def get_session_store():
+    return SQLiteSessionStore(os.getenv("SESSION_DB_PATH", "rovis_sessions.db"))
+
+StateManager.set_persistence_backend(get_session_store())
+
+# Initialize session state (or resume the session named in the URL)
+resumed_session = None
 if 'initialized' not in st.session_state:
+    resumed_session = StateManager.resume_session(st.query_params.get("sid", ""))
+
+if resumed_session:
+    st.session_state.initialized = True
+    StateManager.import_session(st.session_state, resumed_session)
+elif 'initialized' not in st.session_state:
     st.session_state.initialized = True
     st.session_state.messages = []
     st.session_state.off_topic_count = 0  # Initialize off-topic count
-    StateManager.init_session_state()
+    StateManager.init_session_state(st.session_state)
     # Add welcome message
     welcome_msg = (
         "I can help you plan your travel. Please answer these questions:\n"
@@ -37,15 +59,35 @@ if 'initialized' not in st.session_state:
     )
     st.session_state.messages.append({"role": "assistant", "content": welcome_msg})
 
-# Initialize LLM agent
+st.query_params["sid"] = st.session_state.session_id
+
+# Initialize LLM agent (created on the first chat message, not on the first render).
+# The agent is stateless and shared by all sessions, per-session state is passed to async_chat.
 @st.cache_resource
 def get_agent():
+    from agent_handler import TripPlannerAgent
     agent = TripPlannerAgent(
         api_key=OPENROUTER_API_KEY
     )
     return agent
 
-agent = get_agent()
+def latest_search_places() -> List[Dict[str, Any]]:
+    """All places of the latest search: the full payload while the result store has it, else the session records"""
+    searches = st.session_state.get('app_state', {}).get('searches', [])
+    if not searches:
+        return []
+    latest = searches[-1]
+    payload = result_store.get(latest.get('ref', ''))
+    if payload is not None:
+        return records_to_dicts(project_places(payload))
+    return records_to_dicts(resolve_place_refs(latest.get('places', [])))
+
+def latest_route_points() -> List[Tuple[float, float]]:
+    """Geometry of the latest route, kept encoded in the session so a resumed trip is redrawn"""
+    routes = st.session_state.get('app_state', {}).get('routes', [])
+    if not routes or not routes[-1].get('polyline'):
+        return []
+    return decode_polyline(routes[-1]['polyline'])
 
 # Main chat interface
 st.header("Rovis")
@@ -56,54 +98,66 @@ col1, col2 = st.columns([1, 1])
 # Chat interface in first column
 with col1:
     # Create a container for chat messages
-    chat_container = st.empty()
+    chat_container = st.container()
 
-    # Display chat messages
-    with chat_container.container():
-        for message in st.session_state.messages:
-            with st.chat_message(message["role"]):
-                st.markdown(message["content"])
+    # Display chat messages (only the most recent window, see chat_components)
+    with chat_container:
+        display_chat_history(st.session_state.messages)
 
     # Chat input
     if message := st.chat_input("Type your message here..."):
         # Add user message to chat
-        st.session_state.messages.append({"role": "user", "content": message})
+        user_message = {"role": "user", "content": message}
+        st.session_state.messages.append(user_message)
         
-        # Update chat display immediately
-        with chat_container.container():
-            for message in st.session_state.messages:
-                with st.chat_message(message["role"]):
-                    st.markdown(message["content"])
+        # Append the new message instead of redrawing the history
+        with chat_container:
+            display_message(user_message)
         
         try:
             # Send message to agent
-            response = asyncio.run(agent.async_chat(message, st.session_state.messages))
+            agent = get_agent()
+            session = StateManager.export_session(st.session_state)
+            # Runs on the process-wide event loop thread, so connections and background tasks persist across turns.
+            # Partial results (pages of places) are shown as they arrive, until the response is ready.
+            progress = queue.Queue()
+            future = get_loop_runner().submit(agent.async_chat(user_message, session, on_progress=progress.put))
+            with chat_container:
+                placeholder = st.empty()
+            partial = ""
+            while not future.done():
+                try:
+                    partial += progress.get(timeout=0.05)
+                    placeholder.markdown(partial)
+                except queue.Empty:
+                    pass
+            placeholder.empty()
+            response = future.result()
+            StateManager.import_session(st.session_state, session)
             
             # Add assistant message to chat
-            st.session_state.messages.append({"role": "assistant", "content": response})
-            
-            # Update chat display immediately
-            with chat_container.container():
-                for message in st.session_state.messages:
-                    with st.chat_message(message["role"]):
-                        st.markdown(message["content"])
+            assistant_message = {"role": "assistant", "content": response}
                     
         except Exception as e:
             st.error(f"An error occurred: {str(e)}")
-            st.session_state.messages.append({
+            assistant_message = {
                 "role": "assistant",
                 "content": "I apologize, but I encountered an error. Please try again."
-            })
-            # Update chat display immediately
-            with chat_container.container():
-                for message in st.session_state.messages:
-                    with st.chat_message(message["role"]):
-                        st.markdown(message["content"])
+            }
+
+        st.session_state.messages.append(assistant_message)
+        StateManager.persist_session(st.session_state)
+
+        # Append the response instead of redrawing the history
+        with chat_container:
+            display_message(assistant_message)
 
 # Map in second column
 with col2:
-    # Create and display a basic map centered on the US
+    # Create and display a basic map centered on the US, with the latest route and every place of the latest search
     m = folium.Map(location=[37.0902, -95.7129], zoom_start=4)
+    add_route_to_map(m, latest_route_points())
+    add_fast_marker_layer(m, place_marker_rows(latest_search_places()))
     st_folium(m, width=700, height=500)
 
 # Add styling
@@ -0,0 +1 @@
+# Benchmarks for Rovis Streamlit AI
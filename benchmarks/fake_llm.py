@@ -0,0 +1,157 @@
+"""
+Deterministic stand-in for the OpenRouter LLM used by the benchmarks.
+
+ScriptedLLM answers each workflow prompt (intent, search places, route) with the
+response scripted for the user message the prompt is about, simulating a time to
+first token and a generation rate, and records every call with approximate token
+counts. Responses are looked up per prompt, so concurrent sessions can share it.
+"""
+import asyncio
+import re
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List
+
+from llama_index.core.llms import (CompletionResponse, CompletionResponseAsyncGen,
+                                   CompletionResponseGen, CustomLLM, LLMMetadata)
+from llama_index.core.llms.callbacks import llm_completion_callback
+from pydantic import PrivateAttr
+
+from prompt_data import (PROMPT_EXTRACT_ROUTE_INFO,
+                         PROMPT_EXTRACT_SEARCH_PLACES_INFO)
+
+# Word pieces and punctuation, a rough but stable approximation of model tokens
+TOKEN_PATTERN = re.compile(r"\s*(?:\w+|[^\w\s])")
+
+INTENT_MARKER = "Categorize the intent"
+SEARCH_MARKER = PROMPT_EXTRACT_SEARCH_PLACES_INFO.strip().splitlines()[0]
+ROUTE_MARKER = PROMPT_EXTRACT_ROUTE_INFO.strip().splitlines()[0]
+
+# Every workflow prompt ends with the message built by async_chat, which ends with this
+CURRENT_MESSAGE_MARKER = "Current User Message:"
+
+# Used when a turn does not script a prompt kind
+DEFAULT_RESPONSES = {
+    "intent": "ONTOPIC",
+    "search": '{"thought": "The user is not asking to search for places."}',
+    "route": '{"thought": "The user is not asking for a route."}',
+    "other": "",
+}
+
+
+def count_tokens(text: str) -> int:
+    return len(TOKEN_PATTERN.findall(text))
+
+
+def classify_prompt(prompt: str) -> str:
+    """Which workflow prompt this is: intent, search, route or other"""
+    if INTENT_MARKER in prompt:
+        return "intent"
+    if SEARCH_MARKER in prompt:
+        return "search"
+    if ROUTE_MARKER in prompt:
+        return "route"
+    return "other"
+
+
+@dataclass
+class LLMCall:
+    kind: str
+    prompt_tokens: int
+    completion_tokens: int = 0
+    streamed: bool = False
+
+
+class ScriptedLLM(CustomLLM):
+    """Fake LLM with configurable latency (seconds to first token) and token rate (0 = instant)"""
+
+    latency: float = 0.0
+    tokens_per_second: float = 0.0
+    chunk_tokens: int = 4
+
+    # user message -> responses keyed by prompt kind (intent / search / route)
+    _script: Dict[str, Dict[str, str]] = PrivateAttr(default_factory=dict)
+    _calls: List[LLMCall] = PrivateAttr(default_factory=list)
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return LLMMetadata(model_name="scripted-fake", is_chat_model=False)
+
+    def script(self, turns: List[Dict[str, Any]]) -> None:
+        """Register corpus turns ({"user": ..., "llm": {kind: response}}) to answer from"""
+        for turn in turns:
+            self._script[turn["user"]] = dict(turn.get("llm", {}))
+
+    def responses_for(self, prompt: str) -> Dict[str, str]:
+        """Scripted responses of the user message this prompt is about"""
+        current = prompt.rsplit(CURRENT_MESSAGE_MARKER, 1)[-1].lstrip()
+        matches = [message for message in self._script if current.startswith(message)]
+        if not matches:
+            return {}
+        return self._script[max(matches, key=len)]
+
+    def take_calls(self) -> List[LLMCall]:
+        """Calls recorded since the last take_calls()"""
+        calls, self._calls = self._calls, []
+        return calls
+
+    def _start_call(self, prompt: str, streamed: bool) -> tuple:
+        kind = classify_prompt(prompt)
+        call = LLMCall(kind=kind, prompt_tokens=count_tokens(prompt), streamed=streamed)
+        self._calls.append(call)
+        return call, self.responses_for(prompt).get(kind, DEFAULT_RESPONSES[kind])
+
+    def _chunks(self, text: str) -> Iterator[tuple]:
+        tokens = TOKEN_PATTERN.findall(text)
+        for i in range(0, len(tokens), self.chunk_tokens):
+            piece = tokens[i:i + self.chunk_tokens]
+            yield "".join(piece), len(piece)
+
+    def _generation_time(self, n_tokens: int) -> float:
+        return n_tokens / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+
+    @llm_completion_callback()
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        call, text = self._start_call(prompt, streamed=False)
+        call.completion_tokens = count_tokens(text)
+        time.sleep(self.latency + self._generation_time(call.completion_tokens))
+        return CompletionResponse(text=text)
+
+    @llm_completion_callback()
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponseGen:
+        call, text = self._start_call(prompt, streamed=True)
+
+        def gen() -> CompletionResponseGen:
+            time.sleep(self.latency)
+            accumulated = ""
+            for delta, n_tokens in self._chunks(text):
+                time.sleep(self._generation_time(n_tokens))
+                accumulated += delta
+                call.completion_tokens += n_tokens
+                yield CompletionResponse(text=accumulated, delta=delta)
+
+        return gen()
+
+    @llm_completion_callback()
+    async def acomplete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        call, text = self._start_call(prompt, streamed=False)
+        call.completion_tokens = count_tokens(text)
+        await asyncio.sleep(self.latency + self._generation_time(call.completion_tokens))
+        return CompletionResponse(text=text)
+
+    @llm_completion_callback()
+    async def astream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponseAsyncGen:
+        call, text = self._start_call(prompt, streamed=True)
+
+        async def gen() -> CompletionResponseAsyncGen:
+            # Only chunks the consumer actually reads are generated (and counted), so
+            # stopping a stream early shows up as saved completion tokens
+            await asyncio.sleep(self.latency)
+            accumulated = ""
+            for delta, n_tokens in self._chunks(text):
+                await asyncio.sleep(self._generation_time(n_tokens))
+                accumulated += delta
+                call.completion_tokens += n_tokens
+                yield CompletionResponse(text=accumulated, delta=delta)
+
+        return gen()
@@ -0,0 +1,140 @@
+"""
+Import-time benchmark.
+
+Runs `python -X importtime -c "import <module>"` in a fresh interpreter for each
+target module, reports the slowest imports and appends the totals to a history
+file so cold-start regressions can be tracked over time.
+
+Usage:
+    python -m benchmarks.importtime
+    python -m benchmarks.importtime agent_handler --top 15 --max-ms 1500
+"""
+import argparse
+import datetime
+import json
+import os
+import re
+import subprocess
+import sys
+from typing import Any, Dict, List, Optional
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HISTORY_FILE = os.path.join(ROOT_DIR, "benchmarks", "importtime_history.jsonl")
+
+# What the Streamlit script imports before its first render, plus the agent itself
+DEFAULT_MODULES = ["streamlit", "folium", "streamlit_folium", "state_manager", "agent_handler"]
+
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$")
+
+
+def measure_module(module: str) -> Dict[str, Any]:
+    """Import a module in a fresh interpreter and parse the -X importtime report"""
+    env = dict(os.environ)
+    # agent_handler validates API keys at import time; a dummy key keeps it importable here
+    env.setdefault("OPENROUTER_API_KEY", "importtime-benchmark")
+
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{proc.stderr[-2000:]}")
+
+    entries = []
+    for line in proc.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            entries.append({
+                "name": name,
+                "self_us": int(self_us),
+                "cumulative_us": int(cumulative_us),
+                "depth": len(indent) // 2,
+            })
+
+    # Top-level entries (depth 0) add up to the total time of the import statement
+    total_us = sum(e["cumulative_us"] for e in entries if e["depth"] == 0)
+    return {"module": module, "total_us": total_us, "entries": entries}
+
+
+def best_of(module: str, repeat: int) -> Dict[str, Any]:
+    """Measure a module several times and keep the fastest run (first run also warms the .pyc cache)"""
+    runs = [measure_module(module) for _ in range(max(1, repeat))]
+    return min(runs, key=lambda r: r["total_us"])
+
+
+def git_revision() -> Optional[str]:
+    try:
+        proc = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT_DIR, capture_output=True, text=True
+        )
+        return proc.stdout.strip() or None
+    except OSError:
+        return None
+
+
+def load_last_record(path: str) -> Optional[Dict[str, Any]]:
+    if not os.path.exists(path):
+        return None
+    last = None
+    with open(path, "r") as f:
+        for line in f:
+            if line.strip():
+                last = json.loads(line)
+    return last
+
+
+def print_report(result: Dict[str, Any], previous: Optional[Dict[str, Any]], top: int) -> None:
+    module = result["module"]
+    total_ms = result["total_us"] / 1000
+    line = f"{module}: {total_ms:.1f} ms"
+    if previous and module in previous.get("modules", {}):
+        prev_ms = previous["modules"][module] / 1000
+        line += f" (previous {prev_ms:.1f} ms, {total_ms - prev_ms:+.1f} ms)"
+    print(line)
+
+    slowest = sorted(result["entries"], key=lambda e: e["self_us"], reverse=True)[:top]
+    for entry in slowest:
+        print(f"    {entry['self_us'] / 1000:8.1f} ms self  {entry['cumulative_us'] / 1000:8.1f} ms cumulative  {entry['name']}")
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Track module import time over time")
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES, help="Modules to import")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per module, the fastest is kept")
+    parser.add_argument("--top", type=int, default=10, help="Number of slowest imports to list per module")
+    parser.add_argument("--history", default=HISTORY_FILE, help="JSONL file the totals are appended to")
+    parser.add_argument("--no-record", action="store_true", help="Do not append this run to the history file")
+    parser.add_argument("--max-ms", type=float, default=None, help="Fail if any module takes longer than this")
+    args = parser.parse_args(argv)
+
+    previous = load_last_record(args.history)
+    results = [best_of(module, args.repeat) for module in args.modules]
+
+    for result in results:
+        print_report(result, previous, args.top)
+
+    if not args.no_record:
+        record = {
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "revision": git_revision(),
+            "python": sys.version.split()[0],
+            "modules": {r["module"]: r["total_us"] for r in results},
+        }
+        with open(args.history, "a") as f:
+            f.write(json.dumps(record) + "\n")
+
+    if args.max_ms is not None:
+        too_slow = [r["module"] for r in results if r["total_us"] / 1000 > args.max_ms]
+        if too_slow:
+            print(f"Import time budget of {args.max_ms:.0f} ms exceeded by: {', '.join(too_slow)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
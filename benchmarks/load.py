@@ -0,0 +1,248 @@
+"""
+Multi-session load test.
+
+Simulates N planners using one process at the same time, the way the Streamlit
+app serves them: every session runs on its own thread (like a script run) and submits
+its turns to the shared background event loop (loop_runner), with the scripted fake
+LLM of the benchmarks and the api-mock fixtures (plus a simulated provider delay)
+as backends. Concurrency is ramped level by level and for each level the harness
+reports throughput, turn latency percentiles, event-loop lag and memory per session.
+
+Usage:
+    python -m benchmarks.load
+    python -m benchmarks.load --levels 1,8,32,64 --latency-ms 400 --provider-latency-ms 150
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import resource
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stdout
+from typing import Any, Dict, List, Optional
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_LEVELS = [1, 2, 4, 8, 16, 32]
+# Interval of the probe that measures how late the event loop wakes up
+LAG_PROBE_INTERVAL = 0.01
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile, 0 for an empty list"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class LoopLagMonitor:
+    """Sleeps in a loop on the event loop under test and records how late each wakeup is"""
+
+    def __init__(self, interval: float = LAG_PROBE_INTERVAL):
+        self.interval = interval
+        self.lags_ms: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    async def _probe(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.lags_ms.append(max(0.0, loop.time() - expected) * 1000)
+
+    async def start(self) -> None:
+        self._task = asyncio.get_running_loop().create_task(self._probe())
+
+    async def stop(self) -> None:
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+
+def make_agent(llm, provider_latency: float):
+    """TripPlannerAgent whose mock HERE/TomTom calls take as long as a real request would"""
+    from agent_handler import TripPlannerAgent
+
+    class LoadTestAgent(TripPlannerAgent):
+        async def search_places_fn(self, *args, **kwargs):
+            await asyncio.sleep(provider_latency)
+            return await super().search_places_fn(*args, **kwargs)
+
+        async def calculate_route_fn(self, *args, **kwargs):
+            await asyncio.sleep(provider_latency)
+            return await super().calculate_route_fn(*args, **kwargs)
+
+    return LoadTestAgent(api_key="load-test", llm=llm)
+
+
+def session_worker(agent, runner, conversations: List[Dict[str, Any]], rounds: int, offset: int,
+                   sessions: List[Dict[str, Any]], latencies_ms: List[float], errors: List[str]) -> None:
+    """One simulated planner: plays `rounds` conversations, each in a fresh session"""
+    from state_manager import StateManager
+
+    for i in range(rounds):
+        conversation = conversations[(offset + i) % len(conversations)]
+        session: Dict[str, Any] = {}
+        StateManager.init_session_state(session)
+        sessions.append(session)
+        for turn in conversation["turns"]:
+            user_message = {"role": "user", "content": turn["user"]}
+            session["messages"].append(user_message)
+            started = time.perf_counter()
+            response = runner.run(agent.async_chat(user_message, session))
+            latencies_ms.append((time.perf_counter() - started) * 1000)
+            session["messages"].append({"role": "assistant", "content": response})
+            if turn.get("expect", "") not in response:
+                errors.append(f"{conversation['name']}: {response[:60]}")
+
+
+def session_footprint_kb(session: Dict[str, Any]) -> float:
+    """State a session keeps in the process: its session dict plus its result store payloads"""
+    from result_store import estimate_size, result_store
+
+    return (estimate_size(session) + result_store.session_bytes(session["session_id"])) / 1024
+
+
+def run_level(agent, runner, conversations: List[Dict[str, Any]], concurrency: int, rounds: int,
+              trace_memory: bool) -> Dict[str, Any]:
+    """Run `concurrency` sessions at once and collect the metrics of this load level"""
+    from result_store import result_store
+
+    sessions: List[Dict[str, Any]] = []
+    latencies_ms: List[float] = []
+    errors: List[str] = []
+    monitor = LoopLagMonitor()
+    runner.run(monitor.start())
+
+    if trace_memory:
+        tracemalloc.start()
+        traced_before, _ = tracemalloc.get_traced_memory()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="session") as pool:
+        futures = [
+            pool.submit(session_worker, agent, runner, conversations, rounds, offset,
+                        sessions, latencies_ms, errors)
+            for offset in range(concurrency)
+        ]
+        for future in futures:
+            future.result()
+    elapsed = time.perf_counter() - started
+
+    peak_per_session_kb = None
+    if trace_memory:
+        _, traced_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        peak_per_session_kb = (traced_peak - traced_before) / 1024 / concurrency
+
+    runner.run(monitor.stop())
+    footprints = [session_footprint_kb(session) for session in sessions]
+    for session in sessions:
+        result_store.drop_session(session["session_id"])
+
+    return {
+        "concurrency": concurrency,
+        "sessions": len(sessions),
+        "turns": len(latencies_ms),
+        "errors": errors,
+        "elapsed_s": elapsed,
+        "throughput_tps": len(latencies_ms) / elapsed if elapsed else 0.0,
+        "latency_ms": {pct: percentile(latencies_ms, pct) for pct in (50, 90, 99)},
+        "latency_max_ms": max(latencies_ms, default=0.0),
+        "loop_lag_ms": {pct: percentile(monitor.lags_ms, pct) for pct in (50, 99)},
+        "loop_lag_max_ms": max(monitor.lags_ms, default=0.0),
+        "session_kb": sum(footprints) / len(footprints) if footprints else 0.0,
+        "peak_per_session_kb": peak_per_session_kb,
+        # ru_maxrss is in kilobytes on Linux
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def print_header(trace_memory: bool) -> None:
+    columns = (f"{'sessions':>8} {'turns/s':>8} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} "
+               f"{'lag p99':>8} {'lag max':>8} {'KB/sess':>8}")
+    if trace_memory:
+        columns += f" {'peak KB':>8}"
+    print(columns + f" {'RSS MB':>8}")
+
+
+def print_level(result: Dict[str, Any]) -> None:
+    line = (f"{result['concurrency']:>8d} {result['throughput_tps']:>8.1f} "
+            f"{result['latency_ms'][50]:>8.1f} {result['latency_ms'][90]:>8.1f} {result['latency_ms'][99]:>8.1f} "
+            f"{result['loop_lag_ms'][99]:>8.2f} {result['loop_lag_max_ms']:>8.2f} {result['session_kb']:>8.1f}")
+    if result["peak_per_session_kb"] is not None:
+        line += f" {result['peak_per_session_kb']:>8.1f}"
+    line += f" {result['max_rss_mb']:>8.1f}"
+    if result["errors"]:
+        line += f"  {len(result['errors'])} unexpected responses"
+    print(line)
+
+
+def main(argv: List[str] = None) -> int:
+    from benchmarks.workflow import CORPUS_FILE, load_corpus
+
+    parser = argparse.ArgumentParser(description="Ramp concurrent planner sessions against one agent process")
+    parser.add_argument("--levels", default=",".join(map(str, DEFAULT_LEVELS)),
+                        help="Comma separated numbers of concurrent sessions")
+    parser.add_argument("--rounds", type=int, default=2, help="Conversations each session plays per level")
+    parser.add_argument("--corpus", default=CORPUS_FILE, help="Scripted conversations")
+    parser.add_argument("--latency-ms", type=float, default=300.0, help="Fake LLM time to first token")
+    parser.add_argument("--tokens-per-second", type=float, default=60.0, help="Fake LLM generation rate (0 = instant)")
+    parser.add_argument("--provider-latency-ms", type=float, default=100.0, help="Simulated HERE/TomTom request time")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="Also trace peak allocations per session (slows the run down)")
+    parser.add_argument("--json", default=None, help="Also write the results to this file")
+    args = parser.parse_args(argv)
+
+    # agent_handler validates API keys at import time and reads api-mock/ relative to the repo
+    os.environ.setdefault("OPENROUTER_API_KEY", "load-test")
+    os.chdir(ROOT_DIR)
+    if ROOT_DIR not in sys.path:
+        sys.path.insert(0, ROOT_DIR)
+
+    from benchmarks.fake_llm import ScriptedLLM
+    from loop_runner import get_loop_runner
+
+    levels = [int(level) for level in args.levels.split(",") if level.strip()]
+    conversations = load_corpus(args.corpus)
+    llm = ScriptedLLM(latency=args.latency_ms / 1000, tokens_per_second=args.tokens_per_second)
+    llm.script([turn for conversation in conversations for turn in conversation["turns"]])
+    agent = make_agent(llm, args.provider_latency_ms / 1000)
+    runner = get_loop_runner()
+
+    print(f"Fake LLM {args.latency_ms:.0f} ms to first token, {args.tokens_per_second:.0f} tokens/s; "
+          f"providers {args.provider_latency_ms:.0f} ms; {args.rounds} conversations per session")
+    print_header(args.trace_memory)
+
+    results = []
+    with open(os.devnull, "w") as devnull:
+        # Warm up lazy imports and indexes outside of the measurements
+        with redirect_stdout(devnull):
+            run_level(agent, runner, conversations, 1, 1, False)
+        for concurrency in levels:
+            # The agent logs with print() from the loop thread, keep it out of the report
+            with redirect_stdout(devnull):
+                result = run_level(agent, runner, conversations, concurrency, args.rounds, args.trace_memory)
+            results.append(result)
+            print_level(result)
+            llm.take_calls()
+
+    runner.stop()
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"settings": vars(args), "levels": results}, f, indent=2)
+
+    return 1 if any(result["errors"] for result in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,276 @@
+"""
+End-to-end workflow benchmark.
+
+Drives TripPlannerAgent.async_chat through the scripted conversations of
+workflow_corpus.json, with a deterministic fake LLM (benchmarks/fake_llm.py) and the
+api-mock fixtures standing in for OpenRouter, HERE and TomTom. Reports per-turn
+latency, time per workflow step, LLM calls, prompt/completion tokens and peak memory,
+and fails when a run regresses against the stored baseline.
+
+Usage:
+    python -m benchmarks.workflow
+    python -m benchmarks.workflow --latency-ms 300 --tokens-per-second 40 --no-compare
+    python -m benchmarks.workflow --update-baseline
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+from typing import Any, Dict, List, Optional
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CORPUS_FILE = os.path.join(ROOT_DIR, "benchmarks", "workflow_corpus.json")
+BASELINE_FILE = os.path.join(ROOT_DIR, "benchmarks", "workflow_baseline.json")
+
+# Absolute slack on top of the relative tolerance, keeps tiny timings from flapping
+LATENCY_SLACK_MS = 5.0
+MEMORY_SLACK_KB = 64.0
+
+
+def load_corpus(path: str) -> List[Dict[str, Any]]:
+    with open(path, "r") as f:
+        return json.load(f)["conversations"]
+
+
+class StepTimes:
+    """Collects the duration of workflow step spans from the llama_index instrumentation"""
+
+    def __init__(self, workflow_name: str):
+        from llama_index_instrumentation import get_dispatcher
+        from llama_index_instrumentation.span_handlers import SimpleSpanHandler
+
+        self.prefix = workflow_name + "."
+        self.handler = SimpleSpanHandler()
+        self.dispatcher = get_dispatcher()
+        self.dispatcher.add_span_handler(self.handler)
+
+    def take(self) -> Dict[str, float]:
+        """Milliseconds per step since the last take(), keyed by step name"""
+        steps: Dict[str, float] = {}
+        for span in self.handler.completed_spans:
+            # Span ids look like "TripPlannerAgent.call_route-<uuid>"
+            name = span.id_.split("-", 1)[0]
+            if not name.startswith(self.prefix) or name == self.prefix + "run":
+                continue
+            step_name = name[len(self.prefix):]
+            steps[step_name] = steps.get(step_name, 0.0) + span.duration * 1000
+        self.handler.completed_spans = []
+        return steps
+
+    def close(self) -> None:
+        self.dispatcher.span_handlers.remove(self.handler)
+
+
+async def run_conversation(agent, llm, conversation: Dict[str, Any], step_times: Optional[StepTimes]) -> List[Dict[str, Any]]:
+    """Play one conversation against a fresh session, like app.py does per chat input"""
+    from prefetch import prefetcher
+    from result_store import result_store
+    from state_manager import StateManager
+
+    session: Dict[str, Any] = {}
+    StateManager.init_session_state(session)
+    turns = []
+    try:
+        for turn in conversation["turns"]:
+            llm.take_calls()
+            if step_times is not None:
+                step_times.take()
+
+            user_message = {"role": "user", "content": turn["user"]}
+            session["messages"].append(user_message)
+            started = time.perf_counter()
+            with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+                response = await agent.async_chat(user_message, session)
+            latency_ms = (time.perf_counter() - started) * 1000
+            session["messages"].append({"role": "assistant", "content": response})
+
+            calls = llm.take_calls()
+            turns.append({
+                "latency_ms": latency_ms,
+                "llm_calls": len(calls),
+                "prompt_tokens": sum(c.prompt_tokens for c in calls),
+                "completion_tokens": sum(c.completion_tokens for c in calls),
+                "steps_ms": step_times.take() if step_times is not None else {},
+                "response": response,
+                "expect_ok": turn.get("expect", "") in response,
+            })
+    finally:
+        # Background prefetches of this conversation would otherwise run into the next measurement
+        prefetcher.cancel(session["session_id"])
+        result_store.drop_session(session["session_id"])
+    return turns
+
+
+def median_turns(runs: List[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """Merge repeated runs of a conversation: median timings, counts of the first run"""
+    merged = []
+    for turn_runs in zip(*runs):
+        first = turn_runs[0]
+        step_names = sorted({name for run in turn_runs for name in run["steps_ms"]})
+        merged.append({
+            "latency_ms": round(statistics.median(r["latency_ms"] for r in turn_runs), 3),
+            "llm_calls": first["llm_calls"],
+            "prompt_tokens": first["prompt_tokens"],
+            "completion_tokens": first["completion_tokens"],
+            "steps_ms": {
+                name: round(statistics.median(r["steps_ms"].get(name, 0.0) for r in turn_runs), 3)
+                for name in step_names
+            },
+            "response": first["response"],
+            "expect_ok": all(r["expect_ok"] for r in turn_runs),
+        })
+    return merged
+
+
+async def run_benchmark(conversations: List[Dict[str, Any]], latency: float, tokens_per_second: float,
+                        repeat: int, warmup: int) -> Dict[str, Any]:
+    from agent_handler import TripPlannerAgent
+    from benchmarks.fake_llm import ScriptedLLM
+
+    llm = ScriptedLLM(latency=latency, tokens_per_second=tokens_per_second)
+    llm.script([turn for conversation in conversations for turn in conversation["turns"]])
+    agent = TripPlannerAgent(api_key="benchmark", llm=llm)
+
+    # Lazy imports and index builds happen on the first turns, keep them out of the numbers
+    for _ in range(warmup):
+        for conversation in conversations:
+            await run_conversation(agent, llm, conversation, None)
+
+    step_times = StepTimes(type(agent).__name__)
+    results = {}
+    try:
+        for conversation in conversations:
+            runs = [await run_conversation(agent, llm, conversation, step_times) for _ in range(max(1, repeat))]
+
+            # Memory is measured in a separate run, tracing allocations skews the timings
+            tracemalloc.start()
+            try:
+                before, _ = tracemalloc.get_traced_memory()
+                await run_conversation(agent, llm, conversation, None)
+                _, peak = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+
+            results[conversation["name"]] = {
+                "turns": median_turns(runs),
+                "peak_memory_kb": round((peak - before) / 1024, 1),
+            }
+    finally:
+        step_times.close()
+    return results
+
+
+def print_report(results: Dict[str, Any]) -> None:
+    for name, result in results.items():
+        print(f"{name}  (peak memory {result['peak_memory_kb']:.1f} KB)")
+        for index, turn in enumerate(result["turns"], 1):
+            flag = "" if turn["expect_ok"] else "  UNEXPECTED RESPONSE: " + turn["response"][:60]
+            print(f"  turn {index}: {turn['latency_ms']:8.2f} ms  {turn['llm_calls']} llm calls  "
+                  f"{turn['prompt_tokens']:6d} prompt / {turn['completion_tokens']:4d} completion tokens{flag}")
+            for step_name, ms in sorted(turn["steps_ms"].items(), key=lambda item: -item[1]):
+                print(f"      {ms:8.2f} ms  {step_name}")
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float, compare_timings: bool) -> List[str]:
+    """Regressions of this run against the baseline, as readable lines"""
+    regressions = []
+    for name, result in results.items():
+        base = baseline["conversations"].get(name)
+        if base is None:
+            continue
+        if len(base["turns"]) != len(result["turns"]):
+            regressions.append(f"{name}: corpus changed ({len(base['turns'])} -> {len(result['turns'])} turns), update the baseline")
+            continue
+        for index, (turn, base_turn) in enumerate(zip(result["turns"], base["turns"]), 1):
+            label = f"{name} turn {index}"
+            for key in ("llm_calls", "prompt_tokens", "completion_tokens"):
+                if turn[key] > base_turn[key]:
+                    regressions.append(f"{label}: {key} {base_turn[key]} -> {turn[key]}")
+            if compare_timings and turn["latency_ms"] > base_turn["latency_ms"] * (1 + tolerance) + LATENCY_SLACK_MS:
+                regressions.append(f"{label}: latency {base_turn['latency_ms']:.2f} -> {turn['latency_ms']:.2f} ms")
+        if result["peak_memory_kb"] > base["peak_memory_kb"] * (1 + tolerance) + MEMORY_SLACK_KB:
+            regressions.append(f"{name}: peak memory {base['peak_memory_kb']:.1f} -> {result['peak_memory_kb']:.1f} KB")
+    return regressions
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the trip planner workflow end to end")
+    parser.add_argument("conversations", nargs="*", help="Conversation names of the corpus (default: all)")
+    parser.add_argument("--corpus", default=CORPUS_FILE, help="Scripted conversations")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="Stored results to compare against")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per conversation, median timings are kept")
+    parser.add_argument("--warmup", type=int, default=1, help="Unrecorded passes over the corpus")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Fake LLM time to first token")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0, help="Fake LLM generation rate (0 = instant)")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative increase of latency and memory")
+    parser.add_argument("--update-baseline", action="store_true", help="Store this run as the new baseline")
+    parser.add_argument("--no-compare", action="store_true", help="Only report, do not compare with the baseline")
+    parser.add_argument("--json", default=None, help="Also write the results to this file")
+    args = parser.parse_args(argv)
+
+    # agent_handler validates API keys at import time and reads api-mock/ relative to the repo
+    os.environ.setdefault("OPENROUTER_API_KEY", "workflow-benchmark")
+    os.chdir(ROOT_DIR)
+    if ROOT_DIR not in sys.path:
+        sys.path.insert(0, ROOT_DIR)
+
+    conversations = load_corpus(args.corpus)
+    if args.conversations:
+        unknown = set(args.conversations) - {c["name"] for c in conversations}
+        if unknown:
+            parser.error(f"Unknown conversations: {', '.join(sorted(unknown))}")
+        conversations = [c for c in conversations if c["name"] in args.conversations]
+
+    settings = {"latency_ms": args.latency_ms, "tokens_per_second": args.tokens_per_second}
+    results = asyncio.run(run_benchmark(
+        conversations, args.latency_ms / 1000, args.tokens_per_second, args.repeat, args.warmup
+    ))
+    print_report(results)
+
+    record = {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "settings": settings,
+        "conversations": results,
+    }
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(record, f, indent=2)
+
+    failed = [name for name, result in results.items() if not all(t["expect_ok"] for t in result["turns"])]
+    if failed:
+        print(f"Unexpected responses in: {', '.join(failed)}")
+
+    if args.update_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(record, f, indent=2)
+            f.write("\n")
+        print(f"Baseline written to {os.path.relpath(args.baseline, ROOT_DIR)}")
+    elif not args.no_compare:
+        if not os.path.exists(args.baseline):
+            print("No baseline yet, run with --update-baseline to create one")
+        else:
+            with open(args.baseline, "r") as f:
+                baseline = json.load(f)
+            # Timings are only comparable with the same fake LLM settings, counts always are
+            same_settings = baseline.get("settings") == settings
+            if not same_settings:
+                print("Fake LLM settings differ from the baseline, comparing counts and memory only")
+            regressions = compare(results, baseline, args.tolerance, same_settings)
+            for line in regressions:
+                print(f"REGRESSION {line}")
+            if regressions:
+                return 1
+            print("No regressions against the baseline")
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,58 @@
+from typing import Any, Dict, List, Tuple
+
+import streamlit as st
+
+# Number of most recent messages rendered as chat bubbles on every rerun
+CHAT_WINDOW = 20
+# Number of older messages added per "Load older messages" click
+OLDER_PAGE_SIZE = 20
+
+
+def init_chat_view() -> None:
+    """Initialize chat view state if not exists"""
+    if 'chat_older_shown' not in st.session_state:
+        st.session_state.chat_older_shown = 0
+
+
+@st.cache_data(max_entries=128, show_spinner=False)
+def history_markdown(messages: Tuple[Tuple[str, str], ...]) -> str:
+    """Render older messages as a single markdown block (cached, past messages never change)"""
+    parts = []
+    for role, content in messages:
+        speaker = "You" if role == "user" else "Rovis"
+        parts.append(f"**{speaker}:** {content}")
+    return "\n\n---\n\n".join(parts)
+
+
+def load_older_messages() -> None:
+    """Button callback: show one more page of older messages"""
+    st.session_state.chat_older_shown += OLDER_PAGE_SIZE
+
+
+def display_message(message: Dict[str, Any]) -> None:
+    """Append one message to the current container"""
+    with st.chat_message(message["role"]):
+        st.markdown(message["content"])
+
+
+def display_chat_history(messages: List[Dict[str, Any]], window: int = CHAT_WINDOW) -> None:
+    """
+    Display the last `window` messages as chat bubbles. Older messages are only
+    rendered on request, as one cached markdown block, so the number of elements
+    per rerun stays constant however long the conversation gets.
+    """
+    init_chat_view()
+    older = messages[:-window] if len(messages) > window else []
+
+    if older:
+        shown = min(st.session_state.chat_older_shown, len(older))
+        remaining = len(older) - shown
+        if remaining:
+            st.button(f"Load older messages ({remaining} more)", key="chat_load_older", on_click=load_older_messages)
+        if shown:
+            page = older[len(older) - shown:]
+            with st.expander(f"Earlier messages ({shown})", expanded=True):
+                st.markdown(history_markdown(tuple((m["role"], m["content"]) for m in page)))
+
+    for message in messages[-window:]:
+        display_message(message)
@@ -0,0 +1,424 @@
+import json
+import math
+import os
+import pickle
+import re
+import threading
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+CATEGORIES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "here", "categories")
+
+# Catalog group -> (file, id field, name field)
+CATALOG_FILES = {
+    "meal": ("here_mealcategories.json", "CategoryId", "CategoryType"),
+    "rest": ("here_restcategories.json", "CategoryId", "CategoryType"),
+    "hotel": ("here_hotelcategories.json", "CategoryId", "CategoryType"),
+    "food": ("here_foodtypes.json", "FoodtypeID", "FoodType"),
+}
+
+# Groups holding HERE place categories (the rest are food types)
+CATEGORY_GROUPS = ("meal", "rest", "hotel")
+
+# Precompiled indexes, rebuilt whenever a source file changes
+CACHE_FILE = os.path.join(CATEGORIES_DIR, ".catalog_cache.pickle")
+CACHE_VERSION = 1
+
+# Name matches count more than matches in the (long) descriptions
+NAME_WEIGHT = 3
+DESCRIPTION_WEIGHT = 1
+
+STOPWORDS = frozenset([
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "in", "is", "it", "of",
+    "on", "or", "such", "that", "the", "this", "to", "used", "with", "which", "other",
+    "food", "type", "category", "places", "place",
+])
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens without stopwords"""
+    return [t for t in TOKEN_PATTERN.findall(text.lower()) if t not in STOPWORDS]
+
+
+class CatalogEntry(NamedTuple):
+    id: str
+    name: str
+    description: str
+    group: str
+
+
+class HereCatalog:
+    """
+    In-memory indexes over the HERE category and food type catalogs in here/categories:
+
+    - get(id): O(1) lookup by category/food type id
+    - group(name): ids of a catalog file in file order (meal, rest, hotel, food)
+    - expand(prefix): the id and all its descendants, e.g. "500-5000" -> 500-5000-xxxx
+    - search(text): ids ranked by token matches in names and descriptions
+    """
+
+    def __init__(self, entries: List[CatalogEntry], groups: Dict[str, Tuple[str, ...]], indexes: Optional[Dict[str, Any]] = None):
+        self.entries = entries
+        self.groups = groups
+        self.by_id: Dict[str, int] = {}
+        self.children: Dict[str, Tuple[str, ...]] = {}
+        # token -> ((entry index, weight), ...)
+        self.token_index: Dict[str, Tuple[Tuple[int, int], ...]] = {}
+        if indexes is None:
+            self._build()
+        else:
+            self.by_id = indexes["by_id"]
+            self.children = indexes["children"]
+            self.token_index = indexes["token_index"]
+
+    def _build(self) -> None:
+        children: Dict[str, List[str]] = {}
+        postings: Dict[str, Dict[int, int]] = {}
+
+        for idx, entry in enumerate(self.entries):
+            self.by_id[entry.id] = idx
+
+            # Register the id under each of its hierarchical prefixes: "100-1000-0001" -> "100", "100-1000"
+            parts = entry.id.split("-")
+            for depth in range(1, len(parts)):
+                children.setdefault("-".join(parts[:depth]), []).append(entry.id)
+
+            for weight, text in ((NAME_WEIGHT, entry.name), (DESCRIPTION_WEIGHT, entry.description)):
+                for token in set(tokenize(text)):
+                    entry_weights = postings.setdefault(token, {})
+                    entry_weights[idx] = max(entry_weights.get(idx, 0), weight)
+
+        self.children = {prefix: tuple(sorted(ids)) for prefix, ids in children.items()}
+        self.token_index = {token: tuple(sorted(weights.items())) for token, weights in postings.items()}
+
+    @classmethod
+    def from_files(cls, directory: str = CATEGORIES_DIR) -> "HereCatalog":
+        """Parse the JSON catalog files"""
+        entries: List[CatalogEntry] = []
+        seen: Dict[str, int] = {}
+        groups: Dict[str, Tuple[str, ...]] = {}
+
+        for group, (filename, id_field, name_field) in CATALOG_FILES.items():
+            with open(os.path.join(directory, filename), "r") as f:
+                items = json.load(f)
+            ids = []
+            for item in items:
+                entry_id = item[id_field]
+                ids.append(entry_id)
+                # Some ids appear in several files (e.g. "550"), keep the first definition
+                if entry_id not in seen:
+                    seen[entry_id] = len(entries)
+                    entries.append(CatalogEntry(entry_id, item.get(name_field, ""), item.get("Description", ""), group))
+            groups[group] = tuple(ids)
+
+        return cls(entries, groups)
+
+    @classmethod
+    def load(cls, directory: str = CATEGORIES_DIR, cache_file: Optional[str] = CACHE_FILE) -> "HereCatalog":
+        """Load from the precompiled cache if it is up to date, otherwise parse and refresh the cache"""
+        fingerprint = _source_fingerprint(directory)
+
+        if cache_file and os.path.exists(cache_file):
+            try:
+                with open(cache_file, "rb") as f:
+                    cached = pickle.load(f)
+                if cached.get("version") == CACHE_VERSION and cached.get("fingerprint") == fingerprint:
+                    return cls._from_cache_data(cached)
+            except (OSError, pickle.UnpicklingError, EOFError, KeyError, TypeError) as e:
+                print(f"Ignoring HERE catalog cache: {e}")
+
+        catalog = cls.from_files(directory)
+
+        if cache_file:
+            try:
+                with open(cache_file, "wb") as f:
+                    pickle.dump(catalog._to_cache_data(fingerprint), f, protocol=pickle.HIGHEST_PROTOCOL)
+            except OSError as e:
+                # A read-only deployment just parses the JSON on every start
+                print(f"Could not write HERE catalog cache: {e}")
+
+        return catalog
+
+    def _to_cache_data(self, fingerprint: List[Any]) -> Dict[str, Any]:
+        # Only builtin types, so the cache does not depend on where this class is imported from
+        return {
+            "version": CACHE_VERSION,
+            "fingerprint": fingerprint,
+            "entries": [tuple(entry) for entry in self.entries],
+            "groups": self.groups,
+            "by_id": self.by_id,
+            "children": self.children,
+            "token_index": self.token_index,
+        }
+
+    @classmethod
+    def _from_cache_data(cls, data: Dict[str, Any]) -> "HereCatalog":
+        entries = [CatalogEntry(*entry) for entry in data["entries"]]
+        return cls(entries, data["groups"], indexes=data)
+
+    def get(self, entry_id: str) -> Optional[CatalogEntry]:
+        """Look up a category or food type by id"""
+        idx = self.by_id.get(entry_id)
+        return self.entries[idx] if idx is not None else None
+
+    def group(self, name: str) -> Tuple[str, ...]:
+        """Ids of one catalog file, in file order"""
+        return self.groups.get(name, ())
+
+    def expand(self, prefix: str) -> List[str]:
+        """The id itself (if known) followed by all its known descendants"""
+        expanded = [prefix] if prefix in self.by_id else []
+        expanded.extend(self.children.get(prefix, ()))
+        return expanded
+
+    def search(self, text: str, groups: Optional[Tuple[str, ...]] = None, limit: int = 5) -> List[Tuple[str, int]]:
+        """Rank ids by weighted token matches against names and descriptions"""
+        scores: Dict[int, int] = {}
+        for token in set(tokenize(text)):
+            for idx, weight in self.token_index.get(token, ()):
+                scores[idx] = scores.get(idx, 0) + weight
+
+        ranked = []
+        for idx, score in sorted(scores.items(), key=lambda item: (-item[1], item[0])):
+            entry = self.entries[idx]
+            if groups is None or entry.group in groups:
+                ranked.append((entry.id, score))
+                if len(ranked) >= limit:
+                    break
+        return ranked
+
+    def filters_for(self, text: str, min_score: int = NAME_WEIGHT) -> Dict[str, List[str]]:
+        """
+        Map free text such as "cheap motel" or "sushi" to HERE browse filters:
+        {"categories": [...], "food_types": [...]} holding the ids whose score reaches min_score.
+        """
+        categories = [cid for cid, score in self.search(text, CATEGORY_GROUPS) if score >= min_score]
+        food_types = [fid for fid, score in self.search(text, ("food",)) if score >= min_score]
+        return {"categories": categories, "food_types": food_types}
+
+
+# Spellings users type that the catalog words differently
+FOOD_SYNONYMS = {
+    "bbq": "barbecue",
+    "barbeque": "barbecue",
+    "steakhouse": "steak",
+    "veggie": "vegetarian",
+    "taco": "mexican",
+    "tacos": "mexican",
+    "burrito": "mexican",
+}
+
+
+def normalize_token(token: str) -> str:
+    """Map a token to the form used in the food type index (synonyms, simple plurals)"""
+    token = FOOD_SYNONYMS.get(token, token)
+    if len(token) > 4 and token.endswith("es") and not token.endswith("ses"):
+        return token[:-2]
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+# Words after which a misspelt word is taken for a cuisine ("suhsi restaurant", "itallian food")
+FOOD_CUES = frozenset([
+    "food", "foods", "restaurant", "restaurants", "cuisine", "dish", "dishes", "place", "places", "spot", "joint",
+])
+# Shorter words are too close to ordinary words ("nice" -> "ice") to correct
+MIN_TYPO_LENGTH = 5
+
+
+def trigrams(token: str) -> set:
+    padded = f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def is_typo_of(token: str, term: str) -> bool:
+    """
+    True if token is term with one swapped, extra or missing letter. Substitutions are
+    not accepted: they turn place names into cuisines ("vegas" -> "vegan").
+    """
+    if token == term:
+        return True
+    if len(token) == len(term):
+        diffs = [i for i in range(len(token)) if token[i] != term[i]]
+        return (len(diffs) == 2 and diffs[1] == diffs[0] + 1
+                and token[diffs[0]] == term[diffs[1]] and token[diffs[1]] == term[diffs[0]])
+    if abs(len(token) - len(term)) == 1:
+        shorter, longer = sorted((token, term), key=len)
+        i = 0
+        while i < len(shorter) and shorter[i] == longer[i]:
+            i += 1
+        return shorter[i:] == longer[i + 1:]
+    return False
+
+
+class FoodTypeIndex:
+    """
+    BM25 inverted index over here_foodtypes.json that maps a free-text cuisine request
+    ("sushi", "some good bbq", "thai food") to ranked HERE FoodtypeIDs. Names are boosted
+    over descriptions and only food types whose name matches the request are returned,
+    so generic requests ("a restaurant") do not turn into filters. When the request names
+    no cuisine outright, a word typed right before a food cue ("suhsi restaurant") or
+    making up the whole request falls back to a name word one typo away (see is_typo_of).
+    Other words are left alone, place names are often a typo away from a cuisine
+    ("paris" -> "parsi", "tampa" -> "tapas", "seoul" -> "soul").
+    """
+
+    NAME_BOOST = 3
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self, entries: List[CatalogEntry]):
+        self.ids: List[str] = []
+        self.name_tokens: List[frozenset] = []
+        self.doc_lengths: List[int] = []
+        # token -> [(doc index, term frequency), ...]
+        self.postings: Dict[str, List[Tuple[int, int]]] = {}
+        self.trigram_index: Dict[str, set] = {}
+
+        for entry in entries:
+            names = [normalize_token(t) for t in tokenize(entry.name)]
+            terms = names * self.NAME_BOOST + [normalize_token(t) for t in tokenize(entry.description)]
+            doc = len(self.ids)
+            self.ids.append(entry.id)
+            self.name_tokens.append(frozenset(names))
+            self.doc_lengths.append(len(terms))
+
+            counts: Dict[str, int] = {}
+            for term in terms:
+                counts[term] = counts.get(term, 0) + 1
+            for term, tf in counts.items():
+                self.postings.setdefault(term, []).append((doc, tf))
+
+        # Typo fallback only targets name words, the words a cuisine request is made of
+        self.name_vocabulary = frozenset().union(*self.name_tokens)
+        for term in self.name_vocabulary:
+            for gram in trigrams(term):
+                self.trigram_index.setdefault(gram, set()).add(term)
+
+        count = len(self.ids)
+        self.avg_doc_length = sum(self.doc_lengths) / count if count else 0.0
+        self.idf = {
+            term: math.log(1 + (count - len(docs) + 0.5) / (len(docs) + 0.5))
+            for term, docs in self.postings.items()
+        }
+
+    def _closest_term(self, token: str) -> Optional[str]:
+        if len(token) < MIN_TYPO_LENGTH:
+            return None
+        candidates = set()
+        for gram in trigrams(token):
+            candidates.update(self.trigram_index.get(gram, ()))
+        for term in sorted(candidates):
+            if is_typo_of(token, term):
+                return term
+        return None
+
+    def query_terms(self, text: str) -> List[str]:
+        """Normalized query terms, typos of cuisine words resolved to vocabulary words"""
+        words = TOKEN_PATTERN.findall(text.lower())
+        terms = []
+        unknown = []
+        for i, word in enumerate(words):
+            if word in STOPWORDS:
+                continue
+            term = normalize_token(word)
+            if term in self.postings:
+                if term not in terms:
+                    terms.append(term)
+            else:
+                unknown.append(i)
+
+        if any(term in self.name_vocabulary for term in terms):
+            return terms
+        for i in unknown:
+            if len(words) > 1 and (i + 1 == len(words) or words[i + 1] not in FOOD_CUES):
+                continue
+            # Match typos on the word as typed, plural stripping would make "vegas" one letter from "vegan"
+            term = self._closest_term(words[i])
+            if term is not None and term not in terms:
+                terms.append(term)
+        return terms
+
+    def rank(self, text: str, limit: int = 5) -> List[Tuple[str, float]]:
+        """(FoodtypeID, BM25 score) for food types whose name matches the request, best first"""
+        terms = self.query_terms(text)
+        scores: Dict[int, float] = {}
+        for term in terms:
+            idf = self.idf[term]
+            for doc, tf in self.postings[term]:
+                norm = self.K1 * (1 - self.B + self.B * self.doc_lengths[doc] / self.avg_doc_length)
+                scores[doc] = scores.get(doc, 0.0) + idf * tf * (self.K1 + 1) / (tf + norm)
+
+        query = set(terms)
+        matches = [doc for doc in scores if self.name_tokens[doc] & query]
+        matches.sort(key=lambda doc: -scores[doc])
+        return [(self.ids[doc], scores[doc]) for doc in matches[:limit]]
+
+    def named(self, text: str) -> List[str]:
+        """FoodtypeIDs whose whole name appears in the request ("italian pizza" -> Italian, Pizza)"""
+        query = set(self.query_terms(text))
+        return [self.ids[doc] for doc, tokens in enumerate(self.name_tokens) if tokens and tokens <= query]
+
+    def match(self, text: str, limit: int = 3, relative_cutoff: float = 0.6) -> List[str]:
+        """FoodtypeIDs to pass as the foodTypes filter, empty if the text names no cuisine"""
+        # A request naming a cuisine outright ("chinese") gets that type, which also
+        # covers its regional sub-types, rather than whichever sub-type scores highest
+        named = self.named(text)
+        if named:
+            return named[:limit]
+        ranked = self.rank(text, limit)
+        if not ranked:
+            return []
+        best = ranked[0][1]
+        return [food_type for food_type, score in ranked if score >= best * relative_cutoff]
+
+
+def _source_fingerprint(directory: str) -> List[Any]:
+    fingerprint = []
+    for filename, _, _ in CATALOG_FILES.values():
+        stat = os.stat(os.path.join(directory, filename))
+        fingerprint.append((filename, stat.st_size, stat.st_mtime_ns))
+    return fingerprint
+
+
+_catalog: Optional[HereCatalog] = None
+_catalog_lock = threading.Lock()
+
+
+def get_catalog() -> HereCatalog:
+    """Process-wide catalog, loaded once"""
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None:
+            _catalog = HereCatalog.load()
+        return _catalog
+
+
+_food_type_index: Optional[FoodTypeIndex] = None
+
+
+def get_food_type_index() -> FoodTypeIndex:
+    """Process-wide food type index, built once from the catalog"""
+    global _food_type_index
+    catalog = get_catalog()
+    with _catalog_lock:
+        if _food_type_index is None:
+            food_types = [catalog.get(food_id) for food_id in catalog.group("food")]
+            _food_type_index = FoodTypeIndex([entry for entry in food_types if entry is not None])
+        return _food_type_index
+
+
+if __name__ == "__main__":
+    import sys
+
+    # python here_catalog.py build        -> precompile the binary cache
+    # python here_catalog.py <free text>  -> show the matching filters
+    if sys.argv[1:] == ["build"]:
+        if os.path.exists(CACHE_FILE):
+            os.remove(CACHE_FILE)
+        catalog = HereCatalog.load()
+        print(f"Wrote {CACHE_FILE} ({len(catalog.entries)} entries)")
+    else:
+        print(get_catalog().filters_for(" ".join(sys.argv[1:])))
@@ -0,0 +1,166 @@
+import json
+from typing import (Any, AsyncIterable, Dict, Iterable, List, Optional, Tuple,
+                    Union)
+
+# A schema is a list of alternative shapes. A shape maps each required key to either
+# a type / tuple of types, or a nested shape for dict values. An object is valid if it
+# matches any of the alternatives.
+Shape = Dict[str, Union[type, Tuple[type, ...], "Shape"]]
+Schema = List[Shape]
+
+NUMBER = (int, float)
+NULLABLE_DICT = (dict, type(None))
+
+SEARCH_PLACES_SCHEMA: Schema = [
+    {"thought": str},
+    {"location": {"lat": NUMBER, "lon": NUMBER}, "place_type": str},
+]
+
+ROUTE_INFO_SCHEMA: Schema = [
+    {"start": NULLABLE_DICT, "end": NULLABLE_DICT},
+    {"origin": dict, "destination": dict},
+    {"thought": str},
+]
+
+
+def matches_shape(obj: Any, shape: Shape) -> bool:
+    """Check that obj is a dict holding every key of the shape with the expected type"""
+    if not isinstance(obj, dict):
+        return False
+    for key, expected in shape.items():
+        if key not in obj:
+            return False
+        value = obj[key]
+        if isinstance(expected, dict):
+            if not matches_shape(value, expected):
+                return False
+            continue
+        expected_types = expected if isinstance(expected, tuple) else (expected,)
+        # bool is a subclass of int, but true/false is never a valid coordinate
+        if isinstance(value, bool) and bool not in expected_types:
+            return False
+        if not isinstance(value, expected_types):
+            return False
+    return True
+
+
+def matches_schema(obj: Any, schema: Optional[Schema]) -> bool:
+    """Check obj against any of the schema alternatives (no schema accepts any JSON object)"""
+    if not schema:
+        return isinstance(obj, dict)
+    return any(matches_shape(obj, shape) for shape in schema)
+
+
+class IncrementalJSONExtractor:
+    """
+    Brace/string-aware state machine that finds the first complete JSON object in
+    text arriving in chunks. Every character is scanned once, so long outputs stay
+    linear, and the caller can stop generation as soon as feed() returns an object.
+    """
+
+    def __init__(self, schema: Optional[Schema] = None):
+        self.schema = schema
+        self.result: Optional[Any] = None
+        self.done = False
+        self._buffer: List[str] = []  # characters of the object being scanned
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+
+    def feed(self, chunk: str) -> Optional[Any]:
+        """Consume a chunk of text. Returns the first valid object once it closes, else None."""
+        if self.done:
+            return self.result
+
+        for char in chunk:
+            if self._depth == 0:
+                # Outside of an object: skip prose, markdown fences etc. until the next '{'
+                if char == "{":
+                    self._buffer = ["{"]
+                    self._depth = 1
+                continue
+
+            self._buffer.append(char)
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == "{":
+                self._depth += 1
+            elif char == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    candidate = self._parse("".join(self._buffer))
+                    self._buffer = []
+                    if candidate is not None:
+                        self.result = candidate
+                        self.done = True
+                        return candidate
+
+        return None
+
+    def _parse(self, text: str) -> Optional[Any]:
+        """Parse a closed {...} span and validate it, None if it is not what we expect"""
+        for candidate_text in (text, self._strip_double_braces(text)):
+            if candidate_text is None:
+                continue
+            try:
+                obj = json.loads(candidate_text)
+            except json.JSONDecodeError:
+                continue
+            if matches_schema(obj, self.schema):
+                return obj
+        return None
+
+    @staticmethod
+    def _strip_double_braces(text: str) -> Optional[str]:
+        # Some models copy the escaped {{...}} from prompt templates
+        if text.startswith("{{") and text.endswith("}}"):
+            return text[1:-1]
+        return None
+
+
+def extract_json(text: str, schema: Optional[Schema] = None) -> Optional[Any]:
+    """Extract the first JSON object in text that matches the schema"""
+    return IncrementalJSONExtractor(schema).feed(text)
+
+
+def extract_json_from_stream(chunks: Iterable[str], schema: Optional[Schema] = None) -> Tuple[Optional[Any], str]:
+    """
+    Consume streamed text chunks until the first valid JSON object closes.
+    The stream is closed at that point so the producer (e.g. an LLM generation) stops.
+    Returns the object (or None) and the text consumed so far.
+    """
+    extractor = IncrementalJSONExtractor(schema)
+    consumed = []
+    try:
+        for chunk in chunks:
+            consumed.append(chunk)
+            if extractor.feed(chunk) is not None:
+                break
+    finally:
+        close = getattr(chunks, "close", None)
+        if close is not None:
+            close()
+    return extractor.result, "".join(consumed)
+
+
+async def aextract_json_from_stream(responses: AsyncIterable[Any], schema: Optional[Schema] = None) -> Tuple[Optional[Any], str]:
+    """
+    Async variant of extract_json_from_stream for LLM completion streams: consumes the
+    response deltas until the first valid JSON object closes and then stops reading.
+    The caller closes the stream to cancel the rest of the generation.
+    """
+    extractor = IncrementalJSONExtractor(schema)
+    consumed = []
+    async for response in responses:
+        delta = getattr(response, "delta", response) or ""
+        consumed.append(delta)
+        if extractor.feed(delta) is not None:
+            break
+    return extractor.result, "".join(consumed)
@@ -0,0 +1,379 @@
+import heapq
+import math
+import os
+import threading
+import xml.etree.ElementTree as ET
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from route_legs import splice_legs
+from route_profiles import DEFAULT_ROUTE_PROFILE, get_route_profile, slim_route_response
+from trip_optimizer import EARTH_RADIUS_M
+
+Point = Tuple[float, float]
+
+GRAPH_CACHE_VERSION = 1
+# Free-flow speed (km/h) per OSM highway class, for ways without a usable maxspeed tag.
+# Ways of other classes (footways, tracks, ...) are not part of the drivable graph.
+HIGHWAY_SPEEDS_KMH = {
+    "motorway": 105, "motorway_link": 60,
+    "trunk": 90, "trunk_link": 50,
+    "primary": 75, "primary_link": 45,
+    "secondary": 65, "secondary_link": 40,
+    "tertiary": 55, "tertiary_link": 35,
+    "unclassified": 45, "residential": 35, "road": 40,
+    "living_street": 10, "service": 20,
+}
+# A requested location farther than this from any road cannot be routed
+MAX_SNAP_DISTANCE_M = 5000
+# Spacing of the travel time progress entries along a route (TomTom reports them sparsely too)
+PROGRESS_INTERVAL_S = 30
+
+
+def _speed_kmh(tags: Dict[str, str]) -> Optional[float]:
+    """Speed of a drivable way, None for ways cars cannot use"""
+    default = HIGHWAY_SPEEDS_KMH.get(tags.get("highway", ""))
+    if default is None or tags.get("access") in ("no", "private") or tags.get("motor_vehicle") == "no":
+        return None
+    maxspeed = tags.get("maxspeed", "").strip().lower()
+    try:
+        if maxspeed.endswith("mph"):
+            return float(maxspeed[:-3]) * 1.609
+        return float(maxspeed) if maxspeed else default
+    except ValueError:
+        return default  # "signals", "walk", country codes...
+
+
+def _direction(tags: Dict[str, str]) -> int:
+    """1 one way forward, -1 one way against the node order, 0 both ways"""
+    oneway = tags.get("oneway", "").lower()
+    if oneway in ("yes", "true", "1"):
+        return 1
+    if oneway == "-1":
+        return -1
+    if oneway == "no":
+        return 0
+    if tags.get("highway") in ("motorway", "motorway_link") or tags.get("junction") == "roundabout":
+        return 1
+    return 0
+
+
+def _haversine(lat1, lon1, lat2, lon2):
+    """Great-circle meters between arrays (or scalars) of coordinates in degrees"""
+    lat1, lon1, lat2, lon2 = (np.radians(v) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+class RoadGraph:
+    """
+    Drivable road network in array-backed (CSR) form: the edges leaving node i are
+    offsets[i]:offsets[i + 1] of targets, lengths (m) and times (s). Node coordinates
+    are kept for every node of a way, so a path is also the geometry of the route.
+    """
+
+    def __init__(self, lat: np.ndarray, lon: np.ndarray, offsets: np.ndarray,
+                 targets: np.ndarray, lengths: np.ndarray, times: np.ndarray):
+        self.lat = lat
+        self.lon = lon
+        self.offsets = offsets
+        self.targets = targets
+        self.lengths = lengths
+        self.times = times
+        # Fastest speed of any edge, keeps the A* estimate a lower bound of the travel time
+        self.max_speed = float((lengths / np.maximum(times, 1e-6)).max()) if len(times) else 1.0
+        # Plain lists are much faster than numpy scalars in the search loops, built on first use
+        self._lists: Optional[Tuple[list, list, list, list]] = None
+
+    @property
+    def node_count(self) -> int:
+        return len(self.lat)
+
+    @property
+    def edge_count(self) -> int:
+        return len(self.targets)
+
+    @classmethod
+    def from_osm(cls, path: str) -> "RoadGraph":
+        """Parse an OSM XML extract: drivable ways first, then the coordinates of only their nodes"""
+        ways: List[Tuple[List[int], float, int]] = []
+        for _, element in ET.iterparse(path, events=("end",)):
+            if element.tag == "way":
+                tags = {tag.get("k"): tag.get("v") for tag in element.iter("tag")}
+                speed = _speed_kmh(tags)
+                refs = [int(nd.get("ref")) for nd in element.iter("nd")]
+                if speed is not None and len(refs) > 1:
+                    ways.append((refs, speed / 3.6, _direction(tags)))
+            if element.tag in ("node", "way", "relation"):
+                element.clear()
+
+        needed = {ref for refs, _, _ in ways for ref in refs}
+        coordinates: Dict[int, Tuple[float, float]] = {}
+        for _, element in ET.iterparse(path, events=("end",)):
+            if element.tag == "node":
+                node_id = int(element.get("id"))
+                if node_id in needed:
+                    coordinates[node_id] = (float(element.get("lat")), float(element.get("lon")))
+            if element.tag in ("node", "way", "relation"):
+                element.clear()
+
+        index = {node_id: i for i, node_id in enumerate(coordinates)}
+        lat = np.array([coordinates[node_id][0] for node_id in coordinates], dtype=np.float64)
+        lon = np.array([coordinates[node_id][1] for node_id in coordinates], dtype=np.float64)
+
+        edges: List[Tuple[int, int, float]] = []
+        for refs, speed, direction in ways:
+            nodes = [index[ref] for ref in refs if ref in index]  # extracts can cut ways at the border
+            for a, b in zip(nodes[:-1], nodes[1:]):
+                if direction >= 0:
+                    edges.append((a, b, speed))
+                if direction <= 0:
+                    edges.append((b, a, speed))
+        edge_array = np.array(edges, dtype=np.float64).reshape(-1, 3)
+        return cls.from_edges(lat, lon, edge_array[:, 0].astype(np.int64), edge_array[:, 1].astype(np.int64), edge_array[:, 2])
+
+    @classmethod
+    def from_edges(cls, lat: np.ndarray, lon: np.ndarray, sources: np.ndarray, targets: np.ndarray,
+                   speeds: np.ndarray) -> "RoadGraph":
+        """Build the CSR arrays from an edge list (speeds in m/s)"""
+        lengths = _haversine(lat[sources], lon[sources], lat[targets], lon[targets]) if len(sources) else np.zeros(0)
+        order = np.argsort(sources, kind="stable")
+        offsets = np.zeros(len(lat) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=len(lat)), out=offsets[1:])
+        return cls(
+            lat, lon, offsets,
+            targets[order].astype(np.int32),
+            lengths[order].astype(np.float32),
+            (lengths[order] / speeds[order]).astype(np.float32),
+        )
+
+    @classmethod
+    def load(cls, path: str, cache_file: Optional[str] = None) -> "RoadGraph":
+        """Load from the compiled .npz next to the extract if it is up to date, otherwise parse and refresh it"""
+        cache_file = cache_file or path + ".graph.npz"
+        stat = os.stat(path)
+        fingerprint = np.array([GRAPH_CACHE_VERSION, stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+
+        if os.path.exists(cache_file):
+            try:
+                with np.load(cache_file) as data:
+                    if np.array_equal(data["fingerprint"], fingerprint):
+                        return cls(data["lat"], data["lon"], data["offsets"], data["targets"], data["lengths"], data["times"])
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Ignoring road graph cache: {e}")
+
+        graph = cls.from_osm(path)
+        try:
+            np.savez(cache_file, fingerprint=fingerprint, lat=graph.lat, lon=graph.lon, offsets=graph.offsets,
+                     targets=graph.targets, lengths=graph.lengths, times=graph.times)
+        except OSError as e:
+            # A read-only deployment just parses the extract on every start
+            print(f"Could not write road graph cache: {e}")
+        return graph
+
+    def nearest_node(self, point: Point) -> Tuple[int, float]:
+        """Closest node to a location and its distance in meters"""
+        distances = _haversine(point[0], point[1], self.lat, self.lon)
+        node = int(distances.argmin())
+        return node, float(distances[node])
+
+    def _adjacency(self) -> Tuple[list, list, list, list]:
+        if self._lists is None:
+            self._lists = (self.offsets.tolist(), self.targets.tolist(), self.times.tolist(), self.lengths.tolist())
+        return self._lists
+
+    def shortest_path(self, source: int, target: int) -> Optional[List[int]]:
+        """Fastest path between two nodes (A* on travel time), None if target is unreachable"""
+        offsets, targets, times, _ = self._adjacency()
+        target_lat, target_lon = math.radians(self.lat[target]), math.radians(self.lon[target])
+        lat, lon = self.lat, self.lon
+        cos_target = math.cos(target_lat)
+
+        def estimate(node: int) -> float:
+            node_lat = math.radians(lat[node])
+            a = math.sin((target_lat - node_lat) / 2) ** 2 + \
+                math.cos(node_lat) * cos_target * math.sin((target_lon - math.radians(lon[node])) / 2) ** 2
+            return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a))) / self.max_speed
+
+        best = {source: 0.0}
+        previous = {source: -1}
+        queue = [(estimate(source), 0.0, source)]
+        while queue:
+            _, seconds, node = heapq.heappop(queue)
+            if node == target:
+                path = [node]
+                while previous[path[-1]] != -1:
+                    path.append(previous[path[-1]])
+                return path[::-1]
+            if seconds > best[node]:
+                continue  # stale queue entry
+            for edge in range(offsets[node], offsets[node + 1]):
+                neighbour = targets[edge]
+                arrival = seconds + times[edge]
+                if arrival < best.get(neighbour, math.inf):
+                    best[neighbour] = arrival
+                    previous[neighbour] = node
+                    heapq.heappush(queue, (arrival + estimate(neighbour), arrival, neighbour))
+        return None
+
+    def travel_times_from(self, source: int, targets: List[int]) -> Dict[int, float]:
+        """Fastest travel times from source to each reachable target (Dijkstra, stops once all are settled)"""
+        offsets, edge_targets, times, _ = self._adjacency()
+        remaining = set(targets)
+        settled: Dict[int, float] = {}
+        best = {source: 0.0}
+        queue = [(0.0, source)]
+        while queue and remaining:
+            seconds, node = heapq.heappop(queue)
+            if node in settled:
+                continue
+            settled[node] = seconds
+            remaining.discard(node)
+            for edge in range(offsets[node], offsets[node + 1]):
+                neighbour = edge_targets[edge]
+                arrival = seconds + times[edge]
+                if arrival < best.get(neighbour, math.inf):
+                    best[neighbour] = arrival
+                    heapq.heappush(queue, (arrival, neighbour))
+        return {target: settled[target] for target in targets if target in settled}
+
+    def edge_between(self, a: int, b: int) -> Tuple[float, float]:
+        """Length and time of the fastest edge from a to b"""
+        offsets, targets, times, lengths = self._adjacency()
+        edges = [edge for edge in range(offsets[a], offsets[a + 1]) if targets[edge] == b]
+        edge = min(edges, key=lambda e: times[e])
+        return lengths[edge], times[edge]
+
+
+class LocalRouter:
+    """
+    Routing stand-in for TomTom on a local RoadGraph: calculate_route and calculate_matrix
+    take the arguments of the TomTomAPI methods and answer in the same shape, so it can
+    replace the provider in development, benchmarks and when the provider fails.
+    Travel times are free-flow, there is no traffic.
+    """
+
+    def __init__(self, graph: RoadGraph):
+        self.graph = graph
+
+    def _snap(self, point: Point) -> Optional[int]:
+        node, distance = self.graph.nearest_node(point)
+        if distance > MAX_SNAP_DISTANCE_M:
+            print(f"No road within {MAX_SNAP_DISTANCE_M} m of {point}")
+            return None
+        return node
+
+    def route_leg(self, origin: Point, destination: Point, departure: datetime) -> Optional[Dict[str, Any]]:
+        """One-leg calculateRoute response with every section a profile can ask for, None if there is no path"""
+        source, target = self._snap(origin), self._snap(destination)
+        if source is None or target is None:
+            return None
+        path = self.graph.shortest_path(source, target)
+        if path is None:
+            return None
+
+        meters, seconds = [0.0], [0.0]
+        for a, b in zip(path[:-1], path[1:]):
+            length, time = self.graph.edge_between(a, b)
+            meters.append(meters[-1] + length)
+            seconds.append(seconds[-1] + time)
+
+        progress = []
+        next_entry = 0.0
+        for index, elapsed in enumerate(seconds):
+            if elapsed >= next_entry or index == len(path) - 1:
+                progress.append({"pointIndex": index, "travelTimeInSeconds": int(round(elapsed)),
+                                 "distanceInMeters": int(round(meters[index]))})
+                next_entry = elapsed + PROGRESS_INTERVAL_S
+
+        travel_time = int(round(seconds[-1]))
+        summary = {
+            "lengthInMeters": int(round(meters[-1])),
+            "travelTimeInSeconds": travel_time,
+            "trafficDelayInSeconds": 0,
+            "trafficLengthInMeters": 0,
+            "departureTime": departure.isoformat(),
+            "arrivalTime": (departure + timedelta(seconds=travel_time)).isoformat(),
+            "noTrafficTravelTimeInSeconds": travel_time,
+        }
+        points = [{"latitude": float(self.graph.lat[node]), "longitude": float(self.graph.lon[node])} for node in path]
+        return {
+            "formatVersion": "0.0.12",
+            "routes": [{"summary": summary, "legs": [{"summary": dict(summary), "points": points}], "progress": progress}],
+        }
+
+    def calculate_route(
+        self,
+        start_location: Point,
+        end_location: Point,
+        supporting_points: List[Point] = None,
+        departure_time: str = None,
+        profile: str = DEFAULT_ROUTE_PROFILE,
+        waypoints: List[Point] = None
+    ) -> Dict[str, Any]:
+        """Route start -> waypoints -> end, shaped and slimmed like TomTomAPI.calculate_route ({} on failure)"""
+        try:
+            departure = datetime.fromisoformat(departure_time) if departure_time else None
+        except ValueError:
+            departure = None
+        departure = (departure or datetime.now()).replace(microsecond=0)
+
+        locations = [start_location] + list(waypoints or []) + [end_location]
+        legs = []
+        for origin, destination in zip(locations[:-1], locations[1:]):
+            leg = self.route_leg(origin, destination, departure)
+            if leg is None:
+                return {}
+            legs.append(leg["routes"][0])
+        return slim_route_response(splice_legs(legs, departure.isoformat()), get_route_profile(profile))
+
+    def calculate_matrix(self, origins: List[Point], destinations: List[Point]) -> List[List[Optional[float]]]:
+        """Travel seconds[origin][destination] like TomTomAPI.extract_matrix_travel_times, None where unroutable"""
+        destination_nodes = [self._snap(point) for point in destinations]
+        reachable = [node for node in destination_nodes if node is not None]
+        rows = []
+        for origin in origins:
+            source = self._snap(origin)
+            times = self.graph.travel_times_from(source, reachable) if source is not None else {}
+            rows.append([round(times[node]) if node in times else None for node in destination_nodes])
+        return rows
+
+
+_router: Optional[LocalRouter] = None
+_router_lock = threading.Lock()
+
+
+def get_local_router() -> Optional[LocalRouter]:
+    """Process-wide router on the extract named by LOCAL_ROAD_NETWORK, None when it is not configured"""
+    global _router
+    path = os.getenv("LOCAL_ROAD_NETWORK")
+    if not path:
+        return None
+    with _router_lock:
+        if _router is None:
+            _router = LocalRouter(RoadGraph.load(path))
+        return _router
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Local routing on an OSM extract")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser("build", help="Compile the road graph of an OSM XML extract")
+    build_parser.add_argument("extract", help="OSM XML file (.osm)")
+    route_parser = subparsers.add_parser("route", help="Print the route summary between two lat,lon points")
+    route_parser.add_argument("extract", help="OSM XML file (.osm)")
+    route_parser.add_argument("start", help="lat,lon")
+    route_parser.add_argument("end", help="lat,lon")
+    args = parser.parse_args()
+
+    graph = RoadGraph.load(args.extract)
+    print(f"Road graph: {graph.node_count} nodes, {graph.edge_count} edges")
+    if args.command == "route":
+        start, end = (tuple(float(v) for v in text.split(",")) for text in (args.start, args.end))
+        route = LocalRouter(graph).calculate_route(start, end, profile="summary")
+        print(json.dumps(route.get("routes", [{}])[0].get("summary", "No route"), indent=2))
@@ -0,0 +1,151 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, MutableMapping, Optional
+
+from trip_optimizer import haversine_matrix
+
+# Locations remembered per session (session["locations"]), least recently resolved dropped first
+MAX_SESSION_LOCATIONS = 50
+# Locations remembered by the process-wide memo
+MAX_GLOBAL_LOCATIONS = 20000
+# Fields of a route request holding one location each
+ROUTE_LOCATION_FIELDS = ("start", "end")
+# Fresh coordinates this close to the remembered ones are the same place re-derived (the
+# remembered ones are kept), further away they correct the place
+SAME_PLACE_RADIUS_M = 10000
+# Known location names listed in the route extraction prompt, most recently resolved last
+MAX_PROMPT_LOCATIONS = 20
+
+_NON_WORD = re.compile(r"[^\w]+")
+
+
+def normalize_name(name: str) -> str:
+    """Memo key of a location name: case, punctuation and spacing do not matter"""
+    return _NON_WORD.sub(" ", name.casefold()).strip()
+
+
+def has_coordinates(mention: Any) -> bool:
+    return isinstance(mention, dict) and isinstance(mention.get("lat"), (int, float)) \
+        and isinstance(mention.get("lon"), (int, float))
+
+
+class LocationMemo:
+    """
+    Process-wide memo of location names resolved to coordinates, with their provenance
+    (what resolved them and when). Names can be ambiguous across users, so it only fills
+    in coordinates a mention lacks; a session's own memo takes precedence over it.
+    """
+
+    def __init__(self, max_entries: int = MAX_GLOBAL_LOCATIONS):
+        self.max_entries = max_entries
+        # normalized name -> {"name", "lat", "lon", "source", "resolved_at"}
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> Optional[Dict[str, Any]]:
+        key = normalize_name(name)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, entry: Dict[str, Any]) -> None:
+        key = normalize_name(entry["name"])
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+location_memo = LocationMemo()
+
+
+def remember(session: MutableMapping[str, Any], mention: Dict[str, Any], source: str,
+             memo: LocationMemo = location_memo) -> None:
+    """Record a resolved mention in the session's memo and the process-wide one"""
+    entry = {
+        "name": mention["name"],
+        "lat": float(mention["lat"]),
+        "lon": float(mention["lon"]),
+        "source": source,
+        "resolved_at": time.time(),
+    }
+    locations = session.setdefault("locations", {})
+    key = normalize_name(entry["name"])
+    locations.pop(key, None)
+    locations[key] = entry
+    while len(locations) > MAX_SESSION_LOCATIONS:
+        locations.pop(next(iter(locations)))
+    memo.put(entry)
+
+
+def known_location_names(session: MutableMapping[str, Any], limit: int = MAX_PROMPT_LOCATIONS) -> List[str]:
+    """Names of the places the session resolved, for the extraction prompt to refer to by name"""
+    return [entry["name"] for entry in list(session.get("locations", {}).values())[-limit:]]
+
+
+def _same_place(mention: Dict[str, Any], known: Dict[str, Any], radius_m: float = SAME_PLACE_RADIUS_M) -> bool:
+    distances = haversine_matrix([(mention["lat"], mention["lon"]), (known["lat"], known["lon"])])
+    return float(distances[0, 1]) <= radius_m
+
+
+def resolve_mention(session: MutableMapping[str, Any], mention: Any, source: str = "llm",
+                    memo: LocationMemo = location_memo) -> Any:
+    """
+    A location mention ({"name"} with or without "lat"/"lon") resolved against the memos.
+    A name the session resolved before keeps those coordinates when the mention has none,
+    or re-derived ones close to them (so edits route the same legs); coordinates further
+    away correct the place. The global memo fills in missing coordinates. Newly resolved
+    mentions are remembered.
+    """
+    if not isinstance(mention, dict) or not mention.get("name"):
+        return mention
+    name = mention["name"]
+    known = session.get("locations", {}).get(normalize_name(name))
+    if known is not None and has_coordinates(mention) and not _same_place(mention, known):
+        print(f"Location memo: {name} corrected from ({known['lat']}, {known['lon']}) to ({mention['lat']}, {mention['lon']})")
+        known = None
+    elif known is None and not has_coordinates(mention):
+        known = memo.get(name)
+    if known is not None:
+        print(f"Location memo: {name} -> ({known['lat']}, {known['lon']}), resolved by {known['source']}")
+        return {**mention, "lat": known["lat"], "lon": known["lon"]}
+    if has_coordinates(mention):
+        remember(session, mention, source, memo)
+    return mention
+
+
+def resolve_route_info(session: MutableMapping[str, Any], route_info: Dict[str, Any],
+                       memo: LocationMemo = location_memo) -> Dict[str, Any]:
+    """
+    Route request with its locations resolved against the memos. The origin/destination
+    shape of the prompt is mapped to start/end, and a start or end left out of the request
+    (e.g. an edit that only adds a stop) keeps the one already in the chat state.
+    """
+    route_info = dict(route_info)
+    for alias, field in (("origin", "start"), ("destination", "end")):
+        if alias in route_info and route_info.get(field) is None:
+            route_info[field] = route_info.pop(alias)
+
+    if "thought" in route_info and not any(route_info.get(field) for field in ROUTE_LOCATION_FIELDS):
+        return route_info
+
+    chat_state = session.get("chat_state", {})
+    for field in ROUTE_LOCATION_FIELDS:
+        mention = route_info.get(field)
+        if mention is None:
+            if has_coordinates(chat_state.get(field)):
+                route_info[field] = chat_state[field]
+            continue
+        route_info[field] = resolve_mention(session, mention, memo=memo)
+    if isinstance(route_info.get("waypoints"), list):
+        route_info["waypoints"] = [resolve_mention(session, waypoint, memo=memo) for waypoint in route_info["waypoints"]]
+    return route_info
@@ -0,0 +1,90 @@
+import asyncio
+import concurrent.futures
+import threading
+from typing import Any, Coroutine, Optional
+
+
+class BackgroundLoop:
+    """
+    A long-lived asyncio event loop running on a dedicated daemon thread.
+
+    Streamlit reruns the script on its own threads, so instead of creating a new loop per
+    message with asyncio.run(), coroutines are submitted to this loop and the script thread
+    waits on the returned future. Connection pools, loop-bound caches and background tasks
+    therefore survive between turns and are shared by all sessions of the process.
+    """
+
+    def __init__(self, name: str = "rovis-event-loop"):
+        self.name = name
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """The running loop, started on first access"""
+        self.start()
+        return self._loop
+
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        """Start the loop thread if it is not running yet"""
+        with self._lock:
+            if self.is_running():
+                return
+            ready = threading.Event()
+            self._loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(target=self._run, args=(ready,), name=self.name, daemon=True)
+            self._thread.start()
+            ready.wait()
+
+    def _run(self, ready: threading.Event) -> None:
+        asyncio.set_event_loop(self._loop)
+        self._loop.call_soon(ready.set)
+        self._loop.run_forever()
+
+    def submit(self, coro: Coroutine[Any, Any, Any]) -> concurrent.futures.Future:
+        """Schedule a coroutine on the loop from any thread"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro: Coroutine[Any, Any, Any], timeout: Optional[float] = None) -> Any:
+        """Schedule a coroutine and block the calling thread until it finishes"""
+        future = self.submit(coro)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise
+
+    def stop(self) -> None:
+        """Cancel pending tasks and stop the loop thread"""
+        with self._lock:
+            if not self.is_running():
+                return
+            loop, thread = self._loop, self._thread
+
+        async def _shutdown():
+            tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            loop.stop()
+
+        asyncio.run_coroutine_threadsafe(_shutdown(), loop)
+        thread.join()
+        loop.close()
+
+
+_loop_runner: Optional[BackgroundLoop] = None
+_loop_runner_lock = threading.Lock()
+
+
+def get_loop_runner() -> BackgroundLoop:
+    """Process-wide background loop shared by all sessions"""
+    global _loop_runner
+    with _loop_runner_lock:
+        if _loop_runner is None:
+            _loop_runner = BackgroundLoop()
+        return _loop_runner
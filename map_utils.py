@@ -1,9 +1,10 @@
+import html
 import re
 from typing import Any, Dict, List, Optional, Tuple
 
 import folium
 import streamlit as st
-from folium.plugins import Draw, MarkerCluster
+from folium.plugins import Draw, FastMarkerCluster, MarkerCluster
 from streamlit_folium import folium_static
 
 
@@ -47,6 +48,38 @@ def add_places_to_map(
             ).add_to(m)
     return m
 
+# Markers of a FastMarkerCluster are created in the browser from plain data rows
+# [lat, lon, tooltip, popup html], instead of one folium.Marker element per place
+FAST_MARKER_CALLBACK = """
+function (row) {
+    var marker = L.marker(new L.LatLng(row[0], row[1]));
+    marker.bindTooltip(row[2]);
+    marker.bindPopup(row[3]);
+    return marker;
+}
+"""
+
+def place_marker_rows(places: List[Dict[str, Any]]) -> List[List[Any]]:
+    """Data rows for add_fast_marker_layer from place records (lat, lon, title, address)"""
+    rows = []
+    for idx, place in enumerate(places):
+        if place.get('lat') is None or place.get('lon') is None:
+            continue
+        title = html.escape(place.get('title') or 'Place')
+        address = html.escape(place.get('address') or '')
+        rows.append([place['lat'], place['lon'], f"Pin {idx+1}: {title}", f"<b>{title}</b><br>{address}"])
+    return rows
+
+def add_fast_marker_layer(
+    m: folium.Map,
+    rows: List[List[Any]],
+    name: str = "Places"
+) -> folium.Map:
+    """Add many markers as one clustered layer, rendered client-side (see FAST_MARKER_CALLBACK)"""
+    if rows:
+        FastMarkerCluster(data=rows, callback=FAST_MARKER_CALLBACK, name=name).add_to(m)
+    return m
+
 def add_route_to_map(
     m: folium.Map,
     route: List[Tuple[float, float]],
@@ -155,39 +188,3 @@ def display_map(
 ) -> None:
     """Display the map in Streamlit"""
     folium_static(m, width=width, height=height)
-
-def extract_polyline_from_route(route_data: Dict[str, Any]) -> List[Tuple[float, float]]:
-    """Extract polyline coordinates from TomTom route response"""
-    polyline = []
-    
-    if 'routes' in route_data and len(route_data['routes']) > 0:
-        route = route_data['routes'][0]
-        
-        if 'legs' in route and len(route['legs']) > 0:
-            for leg in route['legs']:
-                if 'points' in leg:
-                    for point in leg['points']:
-                        if 'latitude' in point and 'longitude' in point:
-                            polyline.append((point['latitude'], point['longitude']))
-    
-    return polyline
-
-def format_places_from_here_api(places_data: Dict[str, Any]) -> List[Dict[str, Any]]:
-    """Format places from HERE API response"""
-    formatted_places = []
-    
-    if 'items' in places_data:
-        for item in places_data['items']:
-            place = {
-                'title': item.get('title', 'Unknown'),
-                'position': [
-                    item.get('position', {}).get('lat', 0),
-                    item.get('position', {}).get('lng', 0)
-                ],
-                'address': item.get('address', {}),
-                'distance': item.get('distance', 0),
-                'categories': item.get('categories', [])
-            }
-            formatted_places.append(place)
-    
-    return formatted_places
\ No newline at end of file
@@ -0,0 +1,116 @@
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Deque, Dict, Optional, TypeVar
+
+import numpy as np
+
+T = TypeVar("T")
+
+
+@dataclass(frozen=True)
+class StepModel:
+    """Model a workflow step calls, its output cap, and the model a slow call is hedged with"""
+    model: str
+    max_tokens: int
+    fallback: Optional[str] = None
+
+
+def _step_model(step: str, model: str, max_tokens: int, fallback: Optional[str]) -> StepModel:
+    """StepModel with the models overridable by LLM_MODEL_<STEP> and LLM_FALLBACK_<STEP> ("" disables hedging)"""
+    return StepModel(
+        model=os.getenv(f"LLM_MODEL_{step.upper()}", model),
+        max_tokens=max_tokens,
+        fallback=os.getenv(f"LLM_FALLBACK_{step.upper()}", fallback) or None,
+    )
+
+
+# Models per workflow step (OpenRouter ids). The intent check answers one word, or a short
+# reply to an off-topic message, so a small fast model does; extraction needs the larger
+# models. The caps are sized to each step's output: extraction stops at the first JSON object.
+STEP_MODELS: Dict[str, StepModel] = {
+    "intent": _step_model("intent", "google/gemma-3-4b-it", 300, "google/gemma-3-12b-it"),
+    "search": _step_model("search", "google/gemma-3-27b-it", 400, "mistralai/mistral-small-3.1-24b-instruct"),
+    "route": _step_model("route", "google/gemma-3-27b-it", 800, "mistralai/mistral-small-3.1-24b-instruct"),
+}
+
+# A call still running after this percentile of its model's latencies gets a hedge
+HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+# Hedge delay while a model has too few latency samples for the percentile
+HEDGE_DELAY_S = float(os.getenv("LLM_HEDGE_DELAY_S", "8"))
+MIN_LATENCY_SAMPLES = 20
+# Recent latencies kept per model
+LATENCY_WINDOW = 200
+
+
+class LatencyTracker:
+    """Recent call latencies per model across all sessions, for the hedge delay"""
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self.window = window
+        self._latencies: Dict[str, Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, model: str, seconds: float) -> None:
+        with self._lock:
+            self._latencies.setdefault(model, deque(maxlen=self.window)).append(seconds)
+
+    def hedge_delay(self, model: str, percentile: float = HEDGE_PERCENTILE, default: float = HEDGE_DELAY_S) -> float:
+        """Seconds after which a call to model is hedged: the percentile of its latencies, default until there are enough"""
+        with self._lock:
+            latencies = list(self._latencies.get(model, ()))
+        if len(latencies) < MIN_LATENCY_SAMPLES:
+            return default
+        return float(np.percentile(latencies, percentile))
+
+
+latency_tracker = LatencyTracker()
+
+
+async def timed(model: str, call: Awaitable[T], tracker: LatencyTracker = latency_tracker) -> T:
+    """Await a model call and record its latency. A call cut short by a hedge counts with the time it ran."""
+    started = time.perf_counter()
+    try:
+        return await call
+    finally:
+        tracker.observe(model, time.perf_counter() - started)
+
+
+async def hedged(primary: Callable[[], Awaitable[T]], fallback: Optional[Callable[[], Awaitable[T]]],
+                 delay: float, is_valid: Callable[[T], bool]) -> T:
+    """
+    Run primary; if it has not answered after delay seconds (or fails, or gives an invalid
+    answer), run fallback as well and take the first valid answer. The call still running
+    is cancelled. When no answer is valid, the last one is returned (or its error raised).
+    """
+    tasks = {asyncio.ensure_future(primary())}
+    hedge_started = fallback is None
+    last: Optional[asyncio.Future] = None
+
+    def start_hedge() -> None:
+        nonlocal hedge_started
+        hedge_started = True
+        tasks.add(asyncio.ensure_future(fallback()))
+
+    try:
+        while tasks:
+            done, _ = await asyncio.wait(tasks, timeout=None if hedge_started else delay,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                print(f"LLM call still running after {delay:.1f}s, hedging with the fallback model")
+                start_hedge()
+                continue
+            for task in done:
+                tasks.discard(task)
+                if task.exception() is None and is_valid(task.result()):
+                    return task.result()
+                last = task
+            if not hedge_started:
+                start_hedge()
+        return last.result()
+    finally:
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,117 @@
+import re
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Sequence
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+import numpy as np
+
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+# BYDAY codes of a HERE recurrence, in the order of datetime.weekday()
+WEEKDAYS = ["MO", "TU", "WE", "TH", "FR", "SA", "SU"]
+
+_START = re.compile(r"T(\d{2})(\d{2})")
+_DURATION = re.compile(r"PT(?:(\d+)H)?(?:(\d+)M)?")
+_BYDAY = re.compile(r"BYDAY:([A-Z,]+)")
+
+
+def parse_structured(entry: Dict[str, Any]) -> List[List[int]]:
+    """Minute-of-week intervals [start, end) of one structured HERE opening hours entry"""
+    start = _START.match(entry.get("start", ""))
+    duration = _DURATION.fullmatch(entry.get("duration", ""))
+    if not start or not duration:
+        return []
+    start_minute = int(start.group(1)) * 60 + int(start.group(2))
+    length = int(duration.group(1) or 0) * 60 + int(duration.group(2) or 0)
+
+    days = _BYDAY.search(entry.get("recurrence", ""))
+    weekdays = [WEEKDAYS.index(day) for day in days.group(1).split(",") if day in WEEKDAYS] if days else range(7)
+    return [[day * MINUTES_PER_DAY + start_minute, day * MINUTES_PER_DAY + start_minute + length] for day in weekdays]
+
+
+def compile_opening_hours(opening_hours: Optional[List[Dict[str, Any]]]) -> Optional[np.ndarray]:
+    """
+    Compile the openingHours of a HERE place to sorted, merged minute intervals covering
+    the week before, the week and the week after (int32, shape (n, 2)). The week after
+    lets a stay that starts late on Sunday run into Monday, the week before keeps hours
+    that start late on Sunday open early on Monday. Hours of a single service (entries
+    with categories) only count when the place has no general hours. None when the hours
+    are unknown.
+    """
+    if not opening_hours:
+        return None
+    general = [entry for entry in opening_hours if not entry.get("categories")]
+    intervals = [interval
+                 for entry in (general or opening_hours)
+                 for structured in entry.get("structured", [])
+                 for interval in parse_structured(structured)]
+    if not intervals:
+        return None
+
+    intervals = [[start + shift, end + shift]
+                 for shift in (-MINUTES_PER_WEEK, 0, MINUTES_PER_WEEK)
+                 for start, end in intervals]
+    intervals.sort()
+    merged = [intervals[0]]
+    for start, end in intervals[1:]:
+        if start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return np.array(merged, dtype=np.int32)
+
+
+def zone(name: Optional[str]):
+    """ZoneInfo for an IANA name, None if it is missing or unknown"""
+    if not name:
+        return None
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        return None
+
+
+def local_minute_of_week(when: datetime, tz_name: Optional[str] = None) -> int:
+    """Minute of the week (Monday 00:00 = 0) of an instant at a place, in the place's time zone when known"""
+    tz = zone(tz_name)
+    if tz is not None and when.tzinfo is not None:
+        when = when.astimezone(tz)
+    return when.weekday() * MINUTES_PER_DAY + when.hour * 60 + when.minute
+
+
+class HoursIndex:
+    """
+    Compiled opening hours of many places packed into flat interval arrays, so "open at
+    these times" is answered for all of them with a few vectorized operations.
+    """
+
+    def __init__(self, hours: Sequence[Optional[np.ndarray]]):
+        self.count = len(hours)
+        self.known = np.array([h is not None for h in hours], dtype=bool)
+        known = [(i, h) for i, h in enumerate(hours) if h is not None]
+        if known:
+            self.owner = np.concatenate([np.full(len(h), i, dtype=np.int32) for i, h in known])
+            self.starts = np.concatenate([h[:, 0] for _, h in known])
+            self.ends = np.concatenate([h[:, 1] for _, h in known])
+        else:
+            self.owner = np.zeros(0, dtype=np.int32)
+            self.starts = self.ends = np.zeros(0, dtype=np.int32)
+
+    def open_at(self, minutes: np.ndarray, stay: int = 0, unknown: bool = True) -> np.ndarray:
+        """
+        Whether each place is open from its minute of the week for stay minutes.
+        minutes has one entry per place; places with unknown hours get `unknown`.
+        """
+        at = np.asarray(minutes, dtype=np.int64)[self.owner]
+        inside = (self.starts <= at) & (at + stay <= self.ends)
+        is_open = np.bincount(self.owner[inside], minlength=self.count) > 0
+        is_open[~self.known] = unknown
+        return is_open
+
+
+def eta_after(departure: datetime, day: int, seconds_into_day: float) -> datetime:
+    """
+    Arrival time of a stop reached after seconds_into_day of driving on the given day,
+    assuming every driving day starts at the clock time of the departure.
+    """
+    return departure + timedelta(days=day - 1, seconds=seconds_into_day)
@@ -2,7 +2,7 @@ from typing import Any, Dict, List
 
 import streamlit as st
 
-from travel_components import format_distance, format_time_duration
+from result_projection import format_distance, format_time_duration
 
 
 def display_places_sidebar(places: List[Dict[str, Any]]) -> None:
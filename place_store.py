@@ -0,0 +1,144 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from opening_hours import compile_opening_hours
+
+# Places kept by the process-wide store, least recently returned evicted first
+PLACE_STORE_SIZE = 100000
+
+DAY_SECONDS = 24 * 3600
+# How long each field of a place is trusted before a search that returns the place refreshes it
+FIELD_TTLS = {
+    "title": 30 * DAY_SECONDS,
+    "position": 30 * DAY_SECONDS,
+    "address": 30 * DAY_SECONDS,
+    "category": 7 * DAY_SECONDS,
+    # Hours change with seasons and holidays
+    "hours": DAY_SECONDS,
+    "tz": 30 * DAY_SECONDS,
+}
+FIELDS = tuple(FIELD_TTLS)
+# Key of a HERE browse item each field is read from
+SOURCE_KEYS = {
+    "title": "title",
+    "position": "position",
+    "address": "address",
+    "category": "categories",
+    "hours": "openingHours",
+    "tz": "timeZone",
+}
+
+
+class Place:
+    """One HERE place, shared by every search and session that returned it"""
+    __slots__ = ("id", "title", "lat", "lon", "address", "category", "hours", "tz", "fetched_at")
+
+    def __init__(self, place_id: str):
+        self.id = place_id
+        self.title = "Unknown"
+        self.lat = 0.0
+        self.lon = 0.0
+        self.address = ""
+        self.category: Optional[str] = None
+        # Opening hours compiled once (see opening_hours.compile_opening_hours), None = unknown
+        self.hours: Optional[np.ndarray] = None
+        # IANA time zone of the place, None = unknown
+        self.tz: Optional[str] = None
+        # When each of FIELDS was last read from a provider response, 0 = never
+        self.fetched_at = [0.0] * len(FIELDS)
+
+    def is_fresh(self, field: str, now: Optional[float] = None) -> bool:
+        now = time.time() if now is None else now
+        return now - self.fetched_at[FIELDS.index(field)] < FIELD_TTLS[field]
+
+    def stale_fields(self, now: Optional[float] = None) -> List[str]:
+        """Fields that were never fetched or are past their TTL"""
+        now = time.time() if now is None else now
+        return [field for field in FIELDS if not self.is_fresh(field, now)]
+
+
+def _apply_field(place: Place, field: str, item: Dict[str, Any]) -> None:
+    """Read one field of a place from a HERE browse item"""
+    if field == "title":
+        place.title = item.get("title") or "Unknown"
+    elif field == "position":
+        position = item.get("position", {})
+        place.lat = float(position.get("lat", 0))
+        place.lon = float(position.get("lng", 0))
+    elif field == "address":
+        place.address = item.get("address", {}).get("label", "")
+    elif field == "category":
+        categories = item.get("categories", [])
+        primary = next((cat for cat in categories if cat.get("primary")), categories[0] if categories else {})
+        name = primary.get("name")
+        # A handful of category names is shared by all places
+        place.category = sys.intern(name) if name else None
+    elif field == "hours":
+        place.hours = compile_opening_hours(item.get("openingHours"))
+    elif field == "tz":
+        name = (item.get("timeZone") or {}).get("name")
+        place.tz = sys.intern(name) if name else None
+
+
+class PlaceStore:
+    """
+    Process-wide, deduplicated store of HERE places keyed by their id. Overlapping
+    searches of all sessions resolve to the same Place, so a popular region costs the
+    same memory however many users search it, and a place is only read from a provider
+    response again when one of its fields is stale. Sessions keep place ids and look
+    the places up here. LRU bounded; get() returns None for evicted ids.
+    """
+
+    def __init__(self, max_entries: int = PLACE_STORE_SIZE):
+        self.max_entries = max_entries
+        self._places: "OrderedDict[str, Place]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def intern(self, item: Dict[str, Any], now: Optional[float] = None) -> Optional[Place]:
+        """
+        The shared Place for a HERE browse item, created or refreshed from it as needed.
+        Only stale fields present in the item are read. None for items without an id.
+        """
+        place_id = item.get("id")
+        if not place_id:
+            return None
+        now = time.time() if now is None else now
+        with self._lock:
+            place = self._places.get(place_id)
+            if place is None:
+                place = Place(place_id)
+                self._places[place_id] = place
+                while len(self._places) > self.max_entries:
+                    self._places.popitem(last=False)
+            else:
+                self._places.move_to_end(place_id)
+
+            for index, field in enumerate(FIELDS):
+                if now - place.fetched_at[index] < FIELD_TTLS[field] or SOURCE_KEYS[field] not in item:
+                    continue
+                _apply_field(place, field, item)
+                place.fetched_at[index] = now
+            return place
+
+    def get(self, place_id: str) -> Optional[Place]:
+        with self._lock:
+            place = self._places.get(place_id)
+            if place is not None:
+                self._places.move_to_end(place_id)
+            return place
+
+    def __contains__(self, place_id: str) -> bool:
+        with self._lock:
+            return place_id in self._places
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._places)
+
+
+place_store = PlaceStore()
@@ -0,0 +1,70 @@
+from typing import Any, Dict, List, Tuple
+
+# Encoded polyline algorithm format (as used by Google/HERE/OSRM): each coordinate delta
+# is stored as a variable-length base64-ish string, ~4-6 bytes per point instead of a
+# JSON object per point.
+PRECISION = 5
+
+
+def _encode_value(value: int) -> str:
+    value = ~(value << 1) if value < 0 else value << 1
+    chunks = []
+    while value >= 0x20:
+        chunks.append(chr((0x20 | (value & 0x1f)) + 63))
+        value >>= 5
+    chunks.append(chr(value + 63))
+    return "".join(chunks)
+
+
+def encode_polyline(points: List[Tuple[float, float]], precision: int = PRECISION) -> str:
+    """Encode (lat, lon) points to an encoded polyline string"""
+    factor = 10 ** precision
+    encoded = []
+    prev_lat = prev_lon = 0
+    for lat, lon in points:
+        lat_i, lon_i = int(round(lat * factor)), int(round(lon * factor))
+        encoded.append(_encode_value(lat_i - prev_lat))
+        encoded.append(_encode_value(lon_i - prev_lon))
+        prev_lat, prev_lon = lat_i, lon_i
+    return "".join(encoded)
+
+
+def decode_polyline(encoded: str, precision: int = PRECISION) -> List[Tuple[float, float]]:
+    """Decode an encoded polyline string to (lat, lon) points"""
+    factor = 10 ** precision
+    points = []
+    index = lat = lon = 0
+    length = len(encoded)
+    while index < length:
+        deltas = []
+        for _ in range(2):
+            shift = result = 0
+            while True:
+                byte = ord(encoded[index]) - 63
+                index += 1
+                result |= (byte & 0x1f) << shift
+                shift += 5
+                if byte < 0x20:
+                    break
+            deltas.append(~(result >> 1) if result & 1 else result >> 1)
+        lat += deltas[0]
+        lon += deltas[1]
+        points.append((lat / factor, lon / factor))
+    return points
+
+
+def extract_polyline_from_route(route_data: Dict[str, Any]) -> List[Tuple[float, float]]:
+    """Extract polyline coordinates from TomTom route response"""
+    polyline = []
+    
+    if 'routes' in route_data and len(route_data['routes']) > 0:
+        route = route_data['routes'][0]
+        
+        if 'legs' in route and len(route['legs']) > 0:
+            for leg in route['legs']:
+                if 'points' in leg:
+                    for point in leg['points']:
+                        if 'latitude' in point and 'longitude' in point:
+                            polyline.append((point['latitude'], point['longitude']))
+    
+    return polyline
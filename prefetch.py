@@ -0,0 +1,210 @@
+import asyncio
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from polyline_codec import extract_polyline_from_route
+from stop_planner import DEDUPE_RADIUS_M, SearchFn, StopRequest, split_into_days, stop_requests
+from trip_optimizer import haversine_matrix
+
+# How long a prefetched search answers follow-up questions
+PREFETCH_TTL_SECONDS = 15 * 60
+# Prefetched searches kept by the process-wide cache
+PREFETCH_CACHE_SIZE = 500
+# Prefetches running at once across all sessions, they yield provider capacity to user requests
+MAX_PREFETCH_IN_FLIGHT = 2
+# Global prefetch budget: searches scheduled and not finished yet, across all sessions
+MAX_PREFETCH_PENDING = 64
+# Searches prefetched for one route at most
+MAX_PREFETCH_PER_ROUTE = 12
+
+
+class PrefetchCache:
+    """
+    Search results prefetched along routes, shared by all sessions. A lookup matches
+    the closest cached search of the same kind within DEDUPE_RADIUS_M, the same
+    tolerance the stop planner uses to share one search between nearby stops.
+    """
+
+    def __init__(self, max_entries: int = PREFETCH_CACHE_SIZE, ttl: float = PREFETCH_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # (kind, location) -> (result, expires at), least recently used first
+        self._entries: "OrderedDict[Tuple[str, Tuple[float, float]], Tuple[Dict[str, Any], float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, kind: str, location: Tuple[float, float]) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            for key in [key for key, (_, expires) in self._entries.items() if expires <= now]:
+                del self._entries[key]
+            key = _closest([key for key in self._entries if key[0] == kind], location)
+            if key is None:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key][0]
+
+    def put(self, kind: str, location: Tuple[float, float], result: Dict[str, Any]) -> None:
+        key = (kind, tuple(location))
+        with self._lock:
+            self._entries[key] = (result, time.time() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+def _closest(keys: List[Tuple[str, Tuple[float, float]]], location: Tuple[float, float],
+             radius_m: float = DEDUPE_RADIUS_M) -> Optional[Tuple[str, Tuple[float, float]]]:
+    """Key whose location is closest to location, if within radius_m"""
+    if not keys:
+        return None
+    distances = haversine_matrix([location] + [key[1] for key in keys])[0, 1:]
+    index = int(distances.argmin())
+    return keys[index] if distances[index] <= radius_m else None
+
+
+def prefetch_requests(route_data: Dict[str, Any], max_driving_hours: Optional[float],
+                      limit: int = MAX_PREFETCH_PER_ROUTE) -> List[StopRequest]:
+    """
+    Searches a follow-up question about a route is likely to need, most likely first:
+    hotels and food at the destination, then the overnight and midday meal stops of
+    each driving day.
+    """
+    points = extract_polyline_from_route(route_data)
+    if not points:
+        return []
+
+    requests = [StopRequest(kind="hotel", location=points[-1]), StopRequest(kind="meal", location=points[-1])]
+    if max_driving_hours:
+        for request in stop_requests(split_into_days(route_data, max_driving_hours)):
+            same_kind = [(r.kind, r.location) for r in requests if r.kind == request.kind]
+            if _closest(same_kind, request.location) is None:
+                requests.append(request)
+    return requests[:limit]
+
+
+class PrefetchScheduler:
+    """
+    Runs prefetch searches as background tasks on the running event loop and fills the
+    prefetch cache. At most max_in_flight run at once and at most max_pending wait
+    across all sessions; what does not fit the budget is not prefetched. A session's
+    prefetches are cancelled when it schedules new ones or moves on (cancel()).
+    """
+
+    def __init__(self, cache: PrefetchCache, max_in_flight: int = MAX_PREFETCH_IN_FLIGHT,
+                 max_pending: int = MAX_PREFETCH_PENDING):
+        self.cache = cache
+        self.max_in_flight = max_in_flight
+        self.max_pending = max_pending
+        # Tasks per session, and per task what it searches (so lookups can wait for it)
+        self._sessions: Dict[str, Set[asyncio.Task]] = {}
+        self._requests: Dict[asyncio.Task, StopRequest] = {}
+        # Tasks holding the semaphore, i.e. searching now rather than queued behind others
+        self._started: Set[asyncio.Task] = set()
+        # One semaphore per event loop (the app's loop runner, or a benchmark's own loop)
+        self._semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+
+    @property
+    def pending(self) -> int:
+        return len(self._requests)
+
+    def schedule(self, session_id: str, requests: List[StopRequest], search_fn: SearchFn) -> int:
+        """Replace the session's prefetches with these searches. Returns how many were started."""
+        self.cancel(session_id)
+        loop = asyncio.get_running_loop()
+        tasks = self._sessions.setdefault(session_id, set())
+        started = 0
+        for request in requests:
+            if self.pending >= self.max_pending:
+                break
+            if self.cache.get(request.kind, request.location) is not None or self._in_flight(request.kind, request.location):
+                continue
+            task = loop.create_task(self._prefetch(request, search_fn))
+            self._requests[task] = request
+            tasks.add(task)
+            task.add_done_callback(lambda done, session_id=session_id: self._forget(session_id, done))
+            started += 1
+        return started
+
+    def cancel(self, session_id: str) -> int:
+        """Cancel the session's prefetches that have not finished. Returns how many were cancelled."""
+        tasks = self._sessions.pop(session_id, set())
+        for task in tasks:
+            task.cancel()
+        return len(tasks)
+
+    async def lookup(self, kind: str, location: Tuple[float, float]) -> Optional[Dict[str, Any]]:
+        """
+        A prefetched result near location, waiting for a prefetch of it that is searching
+        right now. None if there is none: a prefetch still queued behind other background
+        work is not waited for, the caller searches itself instead.
+        """
+        result = self.cache.get(kind, location)
+        if result is not None:
+            return result
+        task = self._in_flight(kind, location, started_only=True)
+        if task is None:
+            return None
+        # A cancelled prefetch must not cancel the caller, wait for it without awaiting it
+        await asyncio.wait({task})
+        if task.cancelled():
+            return None
+        return self.cache.get(kind, location)
+
+    def with_prefetch(self, search_fn: SearchFn) -> SearchFn:
+        """
+        search_fn that is answered from prefetched results when there are any. Its own
+        results fill the cache, so a prefetch of the same search still queued is skipped.
+        """
+        async def search(kind: str, location: Tuple[float, float]) -> Dict[str, Any]:
+            result = await self.lookup(kind, location)
+            if result is not None:
+                return result
+            result = await search_fn(kind, location)
+            self.cache.put(kind, location, result)
+            return result
+        return search
+
+    def _in_flight(self, kind: str, location: Tuple[float, float], started_only: bool = False) -> Optional[asyncio.Task]:
+        """Closest unfinished prefetch of kind near location; with started_only, only one that is searching now"""
+        loop = asyncio.get_running_loop()
+        tasks = [task for task, request in self._requests.items()
+                 if request.kind == kind and task.get_loop() is loop and not task.done()
+                 and (not started_only or task in self._started)]
+        keys = [(kind, tuple(self._requests[task].location)) for task in tasks]
+        key = _closest(keys, location)
+        return tasks[keys.index(key)] if key is not None else None
+
+    async def _prefetch(self, request: StopRequest, search_fn: SearchFn) -> None:
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.setdefault(loop, asyncio.Semaphore(self.max_in_flight))
+        async with semaphore:
+            # A user's own search may have answered it while this one was queued
+            if self.cache.get(request.kind, request.location) is not None:
+                return
+            self._started.add(asyncio.current_task())
+            try:
+                result = await search_fn(request.kind, request.location)
+            except Exception as e:
+                print(f"Prefetch of {request.kind} near {request.location} failed: {e}")
+                return
+        self.cache.put(request.kind, request.location, result)
+
+    def _forget(self, session_id: str, task: asyncio.Task) -> None:
+        self._requests.pop(task, None)
+        self._started.discard(task)
+        tasks = self._sessions.get(session_id)
+        if tasks is not None:
+            tasks.discard(task)
+            if not tasks:
+                self._sessions.pop(session_id, None)
+
+
+prefetch_cache = PrefetchCache()
+prefetcher = PrefetchScheduler(prefetch_cache)
@@ -109,6 +109,14 @@ CRITICAL RULES:
 '''
 
 
+# Appended to PROMPT_EXTRACT_ROUTE_INFO when the session already located some places
+PROMPT_KNOWN_LOCATIONS = '''
+KNOWN LOCATIONS:
+These places were already located earlier in this conversation: {names}.
+For a location that is one of these places, give only its name exactly as listed, e.g. {{"name": "<name>"}}, without "lat" and "lon". Its coordinates are filled in for you.
+Give "lat" and "lon" for a known place only if the user says it was located wrongly or means a different place of that name.
+'''
+
 PROMPT_EXTRACT_SEARCH_PLACES_INFO = '''
 You are an intelligent travel assistant designed to understand user messages and extract precise information about their intent to search for places to trip, eat, rest, or stay around a *specific, singular geographic location*.
 
@@ -0,0 +1,275 @@
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from api_wrappers import TomTomAPI
+from opening_hours import zone
+from place_store import Place, place_store
+
+# Upper bound for the text of a single chat message built from tool results.
+# The message is kept in the history and re-sent to the LLM on later turns.
+MAX_RESULT_CHARS = 1500
+
+
+def format_time_duration(seconds: int) -> str:
+    """Format seconds into a readable time duration (e.g., 2h 30m)"""
+    hours = seconds // 3600
+    minutes = (seconds % 3600) // 60
+    
+    if hours > 0:
+        return f"{hours}h {minutes}m"
+    else:
+        return f"{minutes}m"
+
+def format_distance(meters: float) -> str:
+    """Format meters into a readable distance (km or m)"""
+    if meters >= 1000:
+        return f"{meters/1000:.1f} km"
+    else:
+        return f"{int(meters)} m"
+
+
+def format_places_from_here_api(places_data: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Format places from HERE API response"""
+    formatted_places = []
+    
+    if 'items' in places_data:
+        for item in places_data['items']:
+            place = {
+                'id': item.get('id'),
+                'title': item.get('title', 'Unknown'),
+                'position': [
+                    item.get('position', {}).get('lat', 0),
+                    item.get('position', {}).get('lng', 0)
+                ],
+                'address': item.get('address', {}),
+                'distance': item.get('distance', 0),
+                'categories': item.get('categories', [])
+            }
+            formatted_places.append(place)
+    
+    return formatted_places
+
+
+@dataclass
+class PlaceRecord:
+    """Compact view of a HERE place, enough to list it in the chat and pin it on the map"""
+    id: Optional[str]
+    title: str
+    lat: float
+    lon: float
+    address: str
+    distance: Optional[int]
+    category: Optional[str]
+
+
+@dataclass
+class RouteRecord:
+    """Compact view of a TomTom route summary"""
+    distance: Optional[int]
+    travel_time: Optional[int]
+    traffic_delay: Optional[int]
+    departure_time: Optional[str]
+    arrival_time: Optional[str]
+    legs: int
+    points: int
+
+
+def place_record(place: Place, distance: Optional[int]) -> PlaceRecord:
+    """Record of a stored place, distance is the one of the search that returned it"""
+    return PlaceRecord(
+        id=place.id,
+        title=place.title,
+        lat=place.lat,
+        lon=place.lon,
+        address=place.address,
+        distance=distance,
+        category=place.category
+    )
+
+
+def project_places(places_data: Dict[str, Any]) -> List[PlaceRecord]:
+    """
+    Project a HERE browse response to compact place records. Places are interned in the
+    shared place store, a place seen before is only re-read for its stale fields.
+    """
+    records = []
+    for item in places_data.get('items', []):
+        place = place_store.intern(item)
+        if place is not None:
+            records.append(place_record(place, item.get('distance')))
+            continue
+
+        # No HERE id to share it by, project the item on its own
+        place = format_places_from_here_api({'items': [item]})[0]
+        categories = place.get('categories', [])
+        primary = next((cat for cat in categories if cat.get('primary')), categories[0] if categories else {})
+        records.append(PlaceRecord(
+            id=place.get('id'),
+            title=place.get('title', 'Unknown'),
+            lat=place['position'][0],
+            lon=place['position'][1],
+            address=place.get('address', {}).get('label', ''),
+            distance=place.get('distance'),
+            category=primary.get('name')
+        ))
+    return records
+
+
+def project_route(route_data: Dict[str, Any]) -> Optional[RouteRecord]:
+    """Project a TomTom calculateRoute response to a compact route record"""
+    if not route_data.get('routes'):
+        return None
+
+    summary = TomTomAPI.extract_route_summary(route_data)
+    route = route_data['routes'][0]
+    legs = route.get('legs', [])
+    return RouteRecord(
+        distance=summary['distance'],
+        travel_time=summary['travel_time'],
+        traffic_delay=summary.get('traffic_delay'),
+        # calculateRoute reports the times on the route summary rather than on the legs
+        departure_time=summary['departure_time'] or route.get('summary', {}).get('departureTime'),
+        arrival_time=summary['arrival_time'] or route.get('summary', {}).get('arrivalTime'),
+        legs=len(legs),
+        points=sum(len(leg.get('points', [])) for leg in legs)
+    )
+
+
+def records_to_dicts(records: List[Any]) -> List[Dict[str, Any]]:
+    """Plain dicts for session state"""
+    return [asdict(record) for record in records]
+
+
+def records_to_place_refs(records: List[PlaceRecord]) -> List[Dict[str, Any]]:
+    """
+    Session state entries for place records: the compact record itself, so a session
+    resumed from its snapshot (after a restart or on another replica) still has its
+    places when the in-process place store does not.
+    """
+    return [asdict(record) for record in records]
+
+
+def resolve_place_refs(refs: List[Dict[str, Any]]) -> List[PlaceRecord]:
+    """
+    Place records for session entries of records_to_place_refs. A place still in the
+    place store is read from there (its fields may have been refreshed since), else
+    the record saved with the session is used.
+    """
+    records = []
+    for ref in refs:
+        place = place_store.get(ref['id']) if ref.get('id') else None
+        if place is not None:
+            records.append(place_record(place, ref.get('distance')))
+        elif 'title' in ref:
+            records.append(PlaceRecord(**ref))
+        else:
+            print(f"Place {ref.get('id')} is neither in the place store nor saved with the session, leaving it out")
+    return records
+
+
+def fit_to_budget(header: str, lines: List[str], budget: int = MAX_RESULT_CHARS) -> str:
+    """Append lines to the header until the budget is reached, then summarize what was left out"""
+    text = header
+    for idx, line in enumerate(lines):
+        if len(text) + len(line) > budget:
+            return text + f"...and {len(lines) - idx} more."
+        text += line
+    return text
+
+
+def place_line(idx: int, record: PlaceRecord) -> str:
+    """One pin of a place listing"""
+    line = f"**Pin {idx+1}: {record.title}**"
+    if record.category:
+        line += f" ({record.category})"
+    if record.distance is not None:
+        line += f", {format_distance(record.distance)} away"
+    if record.address:
+        line += f"\n- {record.address}"
+    return line + "\n\n"
+
+
+def render_place_page(records: List[PlaceRecord], offset: int, budget: int = MAX_RESULT_CHARS) -> str:
+    """
+    Format one page of a paged search on its own, pins numbered from offset, so pages can
+    be shown as they arrive without reformatting the earlier ones. budget is what is left
+    of the message after the earlier pages; once it is used up, pages are only counted.
+    """
+    lines = [place_line(offset + idx, record) for idx, record in enumerate(records)]
+    if budget <= 0:
+        return f"...and {len(lines)} more on the map.\n\n"
+    return fit_to_budget("", lines, budget)
+
+
+def render_places(records: List[PlaceRecord], budget: int = MAX_RESULT_CHARS) -> str:
+    """
+    Format place records as a size-bounded chat message. The result handle is not part of
+    the text (chat text is shown to the user and pasted back into prompts), it stays in
+    the search entry of the app state.
+    """
+    if not records:
+        return "No places found."
+
+    lines = [place_line(idx, record) for idx, record in enumerate(records)]
+    return fit_to_budget("Here are the places I found:\n\n", lines, budget)
+
+
+def render_route(record: Optional[RouteRecord], budget: int = MAX_RESULT_CHARS) -> str:
+    """Format a route record as a size-bounded chat message (its handle stays in the app state)"""
+    if record is None:
+        return "I could not calculate that route. Please check the locations and try again."
+
+    lines = []
+    if record.distance is not None:
+        lines.append(f"- Distance: {format_distance(record.distance)}\n")
+    if record.travel_time is not None:
+        lines.append(f"- Travel time: {format_time_duration(record.travel_time)}\n")
+    if record.traffic_delay:
+        lines.append(f"- Traffic delay: {format_time_duration(record.traffic_delay)}\n")
+    if record.departure_time:
+        lines.append(f"- Departure: {record.departure_time}\n")
+    if record.arrival_time:
+        lines.append(f"- Arrival: {record.arrival_time}\n")
+    lines.append("If you need to make changes, please let me know.")
+
+    return fit_to_budget("Your route has been displayed.\n", lines, budget)
+
+
+def _around(eta: Optional[str], records: List[PlaceRecord]) -> str:
+    """
+    Clock time of an estimated arrival for a stop plan line, empty when unknown. It is
+    given in the time zone of the listed places (the one their opening hours were checked
+    in), the departure's when the store does not know it.
+    """
+    if not eta:
+        return ""
+    when = datetime.fromisoformat(eta)
+    stored = (place_store.get(record.id) if record.id else None for record in records)
+    tz = next((zone(place.tz) for place in stored if place is not None and place.tz), None)
+    if tz is not None and when.tzinfo is not None:
+        when = when.astimezone(tz)
+    return f" (around {when.strftime('%H:%M')})"
+
+
+def render_stop_plan(days: List[Dict[str, Any]], budget: int = MAX_RESULT_CHARS) -> str:
+    """
+    Format per-day stop bundles (see stop_planner.plan_stops) as a size-bounded chat
+    message (their handle stays in the app state)
+    """
+    if not days:
+        return ""
+
+    lines = []
+    for day in days:
+        line = f"**Day {day['day']}** ({format_time_duration(int(day['driving_seconds']))} of driving)\n"
+        if day['meals']:
+            line += f"- Lunch{_around(day.get('meal_eta'), day['meals'])}: " + ", ".join(place.title for place in day['meals']) + "\n"
+        if day['overnight']:
+            if day['hotels']:
+                line += f"- Overnight{_around(day.get('hotel_eta'), day['hotels'])}: " + ", ".join(place.title for place in day['hotels']) + "\n"
+            else:
+                line += "- Overnight: no hotels found near the end of this day\n"
+        lines.append(line + "\n")
+
+    return fit_to_budget("Here is a stop plan for each day:\n\n", lines, budget)
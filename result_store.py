@@ -0,0 +1,131 @@
+import json
+import sys
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+# Bytes of payload one session may keep before its oldest payloads are evicted
+SESSION_BUDGET_BYTES = 8 * 1024 * 1024
+# Bytes of payload the whole process may keep before the least recently used are evicted
+GLOBAL_BUDGET_BYTES = 256 * 1024 * 1024
+
+
+def estimate_size(payload: Any) -> int:
+    """Approximate memory footprint of a payload (its compact JSON length)"""
+    try:
+        return len(json.dumps(payload, separators=(",", ":")))
+    except (TypeError, ValueError):
+        return sys.getsizeof(payload)
+
+
+class ResultStore:
+    """
+    Process-level store for full provider payloads (HERE places, TomTom routes).
+    Session state and chat messages only keep the reference handle returned by put(),
+    the payload itself stays server-side.
+
+    Memory is bounded twice: each session has a byte budget (its own oldest payloads
+    are evicted first) and the process has a global cap enforced with LRU eviction
+    across all sessions. get() returns None for evicted handles, callers must be
+    prepared to fetch the data again.
+    """
+
+    def __init__(self, session_budget: int = SESSION_BUDGET_BYTES, global_budget: int = GLOBAL_BUDGET_BYTES):
+        self.session_budget = session_budget
+        self.global_budget = global_budget
+        # handle -> (payload, size, session_id), least recently used first
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        # session_id -> OrderedDict of that session's handles, least recently used first
+        self._sessions: Dict[str, "OrderedDict[str, None]"] = {}
+        self._session_bytes: Dict[str, int] = {}
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    def put(self, kind: str, payload: Any, session_id: Optional[str] = None) -> str:
+        """Store a payload and return its reference handle"""
+        handle = f"{kind}-{uuid.uuid4().hex[:12]}"
+        size = estimate_size(payload)
+        with self._lock:
+            self._entries[handle] = (payload, size, session_id)
+            self._total_bytes += size
+            if session_id is not None:
+                self._sessions.setdefault(session_id, OrderedDict())[handle] = None
+                self._session_bytes[session_id] = self._session_bytes.get(session_id, 0) + size
+                self._enforce_session_budget(session_id, keep=handle)
+            self._enforce_global_budget(keep=handle)
+        return handle
+
+    def get(self, handle: str) -> Optional[Any]:
+        """Return the payload for a handle, None if it is unknown or was evicted"""
+        with self._lock:
+            entry = self._entries.get(handle)
+            if entry is None:
+                return None
+            self._entries.move_to_end(handle)
+            session_id = entry[2]
+            if session_id is not None:
+                self._sessions[session_id].move_to_end(handle)
+            return entry[0]
+
+    def release(self, handle: str) -> None:
+        """Drop a payload that is no longer referenced"""
+        with self._lock:
+            self._evict(handle)
+
+    def drop_session(self, session_id: str) -> None:
+        """Drop all payloads of a session (e.g. when it ends)"""
+        with self._lock:
+            for handle in list(self._sessions.get(session_id, ())):
+                self._evict(handle)
+
+    def session_bytes(self, session_id: str) -> int:
+        with self._lock:
+            return self._session_bytes.get(session_id, 0)
+
+    @property
+    def total_bytes(self) -> int:
+        with self._lock:
+            return self._total_bytes
+
+    def __contains__(self, handle: str) -> bool:
+        with self._lock:
+            return handle in self._entries
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def _enforce_session_budget(self, session_id: str, keep: str) -> None:
+        handles = self._sessions[session_id]
+        while self._session_bytes[session_id] > self.session_budget and len(handles) > 1:
+            oldest = next(iter(handles))
+            if oldest == keep:
+                break
+            self._evict(oldest)
+
+    def _enforce_global_budget(self, keep: str) -> None:
+        while self._total_bytes > self.global_budget and len(self._entries) > 1:
+            oldest = next(iter(self._entries))
+            if oldest == keep:
+                break
+            self._evict(oldest)
+
+    def _evict(self, handle: str) -> None:
+        entry = self._entries.pop(handle, None)
+        if entry is None:
+            return
+        _, size, session_id = entry
+        self._total_bytes -= size
+        if session_id is not None:
+            handles = self._sessions.get(session_id)
+            if handles is not None:
+                handles.pop(handle, None)
+                self._session_bytes[session_id] -= size
+                if not handles:
+                    del self._sessions[session_id]
+                    del self._session_bytes[session_id]
+
+
+# Shared by all sessions of the process
+result_store = ResultStore()
@@ -0,0 +1,286 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from trip_optimizer import COORD_PRECISION, estimate_travel_times
+
+Point = Tuple[float, float]
+# Async routing of one leg: (origin, destination, depart_at, profile name) -> calculateRoute response
+LegRouteFn = Callable[[Point, Point, Optional[str], str], Awaitable[Dict[str, Any]]]
+# Async routing of a whole trip through its locations: (locations, depart_at, profile name) -> calculateRoute response
+TripRouteFn = Callable[[List[Point], Optional[str], str], Awaitable[Dict[str, Any]]]
+
+# Legs kept by the process-wide cache
+LEG_CACHE_SIZE = 2000
+# Travel times include traffic, a leg is routed again once it is this old
+LEG_TTL_SECONDS = 15 * 60
+# Summary fields of a route that are the sum of its legs
+ADDITIVE_SUMMARY_FIELDS = [
+    "lengthInMeters",
+    "travelTimeInSeconds",
+    "trafficDelayInSeconds",
+    "trafficLengthInMeters",
+    "noTrafficTravelTimeInSeconds",
+    "historicTrafficTravelTimeInSeconds",
+    "liveTrafficIncidentsTravelTimeInSeconds",
+]
+
+
+def _leg_key(origin: Point, destination: Point, profile: str) -> tuple:
+    return (round(origin[0], COORD_PRECISION), round(origin[1], COORD_PRECISION),
+            round(destination[0], COORD_PRECISION), round(destination[1], COORD_PRECISION), profile)
+
+
+class LegCache:
+    """One-leg routes (slimmed calculateRoute responses) by endpoints and profile, shared by all sessions"""
+
+    def __init__(self, max_entries: int = LEG_CACHE_SIZE, ttl: float = LEG_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # key -> (route, routed at), least recently used first
+        self._entries: "OrderedDict[tuple, Tuple[Dict[str, Any], float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, origin: Point, destination: Point, profile: str) -> Optional[Dict[str, Any]]:
+        key = _leg_key(origin, destination, profile)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.time() - entry[1] >= self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, origin: Point, destination: Point, profile: str, route: Dict[str, Any]) -> None:
+        key = _leg_key(origin, destination, profile)
+        with self._lock:
+            self._entries[key] = (route, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+leg_cache = LegCache()
+
+
+def _parse_time(value: Optional[str]) -> Optional[datetime]:
+    try:
+        return datetime.fromisoformat(value) if value else None
+    except ValueError:
+        return None
+
+
+def retime_summary(summary: Dict[str, Any], departure: Optional[datetime]) -> Tuple[Dict[str, Any], Optional[datetime]]:
+    """
+    Copy of a leg summary departing at departure (the routed times shifted, each keeps
+    its own UTC offset). Returns it and the arrival, which is when the next leg departs.
+    """
+    summary = dict(summary)
+    routed_departure = _parse_time(summary.get("departureTime"))
+    routed_arrival = _parse_time(summary.get("arrivalTime"))
+    if departure is None:
+        return summary, routed_arrival
+    if routed_departure is None or routed_arrival is None:
+        return summary, departure + timedelta(seconds=summary.get("travelTimeInSeconds", 0))
+
+    # Provider times are to the second; departAt without an offset is local time at the origin
+    departure = departure.replace(microsecond=0)
+    if departure.tzinfo is None:
+        departure = departure.replace(tzinfo=routed_departure.tzinfo)
+    shift = departure - routed_departure
+    summary["departureTime"] = (routed_departure + shift).isoformat()
+    arrival = routed_arrival + shift
+    summary["arrivalTime"] = arrival.isoformat()
+    return summary, arrival
+
+
+def splice_legs(legs: List[Dict[str, Any]], depart_at: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Join one-leg routes into one calculateRoute-shaped route: legs in order, point indices,
+    progress and guidance offset by what comes before, summaries retimed from depart_at
+    (or the first leg's own departure) and the totals recomputed.
+    """
+    route_legs: List[Dict[str, Any]] = []
+    progress: List[Dict[str, Any]] = []
+    instructions: List[Dict[str, Any]] = []
+    has_progress = has_guidance = False
+    point_offset = time_offset = length_offset = 0
+    departure = _parse_time(depart_at)
+
+    for index, route in enumerate(legs):
+        leg = route["legs"][0]
+        summary, departure = retime_summary(leg.get("summary", {}), departure)
+        route_legs.append({**leg, "summary": summary})
+
+        if "progress" in route:
+            has_progress = True
+            for entry in route["progress"]:
+                # Every leg starts at 0 s on its first point, which is the previous leg's last point
+                if index > 0 and entry.get("pointIndex") == 0:
+                    continue
+                entry = dict(entry)
+                entry["pointIndex"] = entry.get("pointIndex", 0) + point_offset
+                entry["travelTimeInSeconds"] = entry.get("travelTimeInSeconds", 0) + time_offset
+                if "distanceInMeters" in entry:
+                    entry["distanceInMeters"] += length_offset
+                progress.append(entry)
+
+        if "guidance" in route:
+            has_guidance = True
+            for instruction in route["guidance"].get("instructions", []):
+                maneuver = instruction.get("maneuver")
+                if index > 0 and maneuver == "DEPART":
+                    continue  # the previous leg's arrival is where it departs
+                instruction = dict(instruction)
+                if index < len(legs) - 1 and maneuver and maneuver.startswith("ARRIVE"):
+                    instruction["maneuver"] = "WAYPOINT_REACHED"
+                instruction["pointIndex"] = instruction.get("pointIndex", 0) + point_offset
+                instruction["travelTimeInSeconds"] = instruction.get("travelTimeInSeconds", 0) + time_offset
+                instruction["routeOffsetInMeters"] = instruction.get("routeOffsetInMeters", 0) + length_offset
+                instructions.append(instruction)
+
+        point_offset += len(leg.get("points", []))
+        time_offset += summary.get("travelTimeInSeconds", 0)
+        length_offset += summary.get("lengthInMeters", 0)
+
+    total = {field: sum(leg["summary"].get(field, 0) for leg in route_legs)
+             for field in ADDITIVE_SUMMARY_FIELDS if any(field in leg["summary"] for leg in route_legs)}
+    if route_legs:
+        for field, leg in (("departureTime", route_legs[0]), ("arrivalTime", route_legs[-1])):
+            if field in leg["summary"]:
+                total[field] = leg["summary"][field]
+
+    spliced: Dict[str, Any] = {"summary": total, "legs": route_legs}
+    if has_progress:
+        spliced["progress"] = progress
+    if has_guidance:
+        spliced["guidance"] = {"instructions": instructions}
+    return {"routes": [spliced]}
+
+
+def split_legs(route: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    The inverse of splice_legs: one-leg routes (as routed on their own, ready for the leg
+    cache) from a route through waypoints. Point indices, progress and guidance are
+    rebased to each leg, which departs at 0 s from its first point.
+    """
+    route_legs = route.get("legs", [])
+    progress = route.get("progress")
+    instructions = route.get("guidance", {}).get("instructions") if "guidance" in route else None
+    legs: List[Dict[str, Any]] = []
+    point_offset = time_offset = length_offset = 0
+
+    for index, leg in enumerate(route_legs):
+        summary = leg.get("summary", {})
+        n_points = len(leg.get("points", []))
+        last = index == len(route_legs) - 1
+        single: Dict[str, Any] = {"summary": summary, "legs": [leg]}
+
+        def in_leg(entry: Dict[str, Any]) -> bool:
+            return point_offset <= entry.get("pointIndex", 0) < point_offset + n_points
+
+        if progress is not None:
+            with_distance = any("distanceInMeters" in entry for entry in progress)
+            leg_progress = []
+            for entry in filter(in_leg, progress):
+                entry = dict(entry)
+                entry["pointIndex"] -= point_offset
+                entry["travelTimeInSeconds"] = entry.get("travelTimeInSeconds", 0) - time_offset
+                if "distanceInMeters" in entry:
+                    entry["distanceInMeters"] -= length_offset
+                leg_progress.append(entry)
+            # Progress is sparse, make sure each leg has its first and last point
+            if not leg_progress or leg_progress[0]["pointIndex"] != 0:
+                leg_progress.insert(0, {"pointIndex": 0, "travelTimeInSeconds": 0, **({"distanceInMeters": 0} if with_distance else {})})
+            if n_points and leg_progress[-1]["pointIndex"] != n_points - 1:
+                leg_progress.append({"pointIndex": n_points - 1, "travelTimeInSeconds": summary.get("travelTimeInSeconds", 0),
+                                     **({"distanceInMeters": summary.get("lengthInMeters", 0)} if with_distance else {})})
+            single["progress"] = leg_progress
+
+        if instructions is not None:
+            leg_instructions = []
+            if index > 0 and n_points:
+                start = leg["points"][0]
+                leg_instructions.append({"maneuver": "DEPART", "instructionType": "LOCATION_DEPARTURE", "pointIndex": 0,
+                                         "travelTimeInSeconds": 0, "routeOffsetInMeters": 0, "point": start})
+            for instruction in filter(in_leg, instructions):
+                instruction = dict(instruction)
+                if not last and instruction.get("maneuver") == "WAYPOINT_REACHED":
+                    instruction["maneuver"] = "ARRIVE"
+                instruction["pointIndex"] -= point_offset
+                instruction["travelTimeInSeconds"] = instruction.get("travelTimeInSeconds", 0) - time_offset
+                instruction["routeOffsetInMeters"] = instruction.get("routeOffsetInMeters", 0) - length_offset
+                leg_instructions.append(instruction)
+            single["guidance"] = {"instructions": leg_instructions}
+
+        legs.append(single)
+        point_offset += n_points
+        time_offset += summary.get("travelTimeInSeconds", 0)
+        length_offset += summary.get("lengthInMeters", 0)
+    return legs
+
+
+async def route_by_legs(locations: List[Point], depart_at: Optional[str], profile: str, route_fn: LegRouteFn,
+                        cache: LegCache = leg_cache, trip_fn: Optional[TripRouteFn] = None) -> Tuple[Dict[str, Any], int]:
+    """
+    Route a trip through locations (start, stops..., end) as a sequence of cached legs.
+    Only legs that are not cached are routed, concurrently; then all are spliced back
+    together. A trip with no leg cached is routed with one call of trip_fn (through its
+    waypoints, as before the leg cache) and split into legs for the cache, so the cold
+    path does not cost one provider request per leg. Returns the route (empty if a leg
+    failed) and the number of legs routed.
+    """
+    pairs = list(zip(locations[:-1], locations[1:]))
+    legs: List[Optional[Dict[str, Any]]] = [cache.get(origin, destination, profile) for origin, destination in pairs]
+    missing = [i for i, leg in enumerate(legs) if leg is None]
+
+    if trip_fn is not None and len(missing) == len(pairs) > 1:
+        try:
+            result = await trip_fn(locations, depart_at, profile)
+        except Exception as e:
+            print(f"Routing the trip in one request failed, routing it leg by leg: {e}")
+            result = {}
+        route = (result.get("routes") or [None])[0]
+        if route is not None and len(route.get("legs", [])) == len(pairs):
+            for (origin, destination), leg in zip(pairs, split_legs(route)):
+                cache.put(origin, destination, profile, leg)
+            return result, len(pairs)
+        if route is not None:
+            print(f"Trip route has {len(route.get('legs', []))} legs for {len(pairs)} stops, routing it leg by leg")
+
+    if missing:
+        # Each leg departs when the trip reaches its origin: cached legs count with their
+        # routed time, legs still to route with the travel time estimate
+        start = _parse_time(depart_at)
+        estimates = estimate_travel_times(locations)
+        offsets, elapsed = [], 0.0
+        for i, leg in enumerate(legs):
+            offsets.append(elapsed)
+            elapsed += leg["summary"]["travelTimeInSeconds"] if leg else float(estimates[i, i + 1])
+
+        def leg_depart_at(i: int) -> Optional[str]:
+            if start is None:
+                return depart_at
+            return (start + timedelta(seconds=round(offsets[i]))).isoformat()
+
+        results = await asyncio.gather(
+            *(route_fn(pairs[i][0], pairs[i][1], leg_depart_at(i), profile) for i in missing),
+            return_exceptions=True
+        )
+        for i, result in zip(missing, results):
+            if isinstance(result, Exception) or not result.get("routes"):
+                print(f"Routing leg {i + 1} of {len(pairs)} failed: {result if isinstance(result, Exception) else 'no route'}")
+                return {}, len(missing)
+            legs[i] = result["routes"][0]
+            cache.put(pairs[i][0], pairs[i][1], profile, legs[i])
+
+    return splice_legs(legs, depart_at), len(missing)
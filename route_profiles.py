@@ -0,0 +1,110 @@
+from dataclasses import dataclass, field
+from typing import Any, Dict, List
+
+# Request parameters every profile shares
+BASE_ROUTE_PARAMS = {
+    "routeType": "fastest",
+    "traffic": "true",
+}
+
+# Fields of a guidance instruction needed to render turn-by-turn directions
+INSTRUCTION_FIELDS = ["routeOffsetInMeters", "travelTimeInSeconds", "point", "pointIndex", "maneuver", "message"]
+
+
+@dataclass(frozen=True)
+class RouteProfile:
+    """
+    What a workflow path needs from TomTom calculateRoute: the request parameters
+    (so unused sections are not computed or downloaded) and the parts of the response
+    that are kept (so nothing else stays resident in the result store).
+    """
+    name: str
+    params: Dict[str, str] = field(default_factory=dict)
+    points: bool = False        # leg geometry, for drawing the route
+    instructions: bool = False  # guidance instructions, for turn-by-turn directions
+    progress: bool = False      # travel time per point, for splitting the drive into days
+
+
+ROUTE_PROFILES: Dict[str, RouteProfile] = {
+    # Drawing the route on the map
+    "map": RouteProfile(
+        name="map",
+        params={"routeRepresentation": "polyline"},
+        points=True,
+    ),
+    # Distance and times only, e.g. to compare alternatives
+    "summary": RouteProfile(
+        name="summary",
+        params={"routeRepresentation": "summaryOnly"},
+    ),
+    # Map plus textual directions
+    "turn_by_turn": RouteProfile(
+        name="turn_by_turn",
+        params={"routeRepresentation": "polyline", "instructionsType": "text"},
+        points=True,
+        instructions=True,
+    ),
+    # Map plus travel time along the route, to find where each driving day ends
+    "day_split": RouteProfile(
+        name="day_split",
+        params={
+            "routeRepresentation": "polyline",
+            "computeTravelTimeFor": "all",
+            "extendedRouteRepresentation": "travelTime",
+        },
+        points=True,
+        progress=True,
+    ),
+}
+
+DEFAULT_ROUTE_PROFILE = "map"
+
+
+def get_route_profile(name: str = DEFAULT_ROUTE_PROFILE) -> RouteProfile:
+    """Look up a route profile by name"""
+    if name not in ROUTE_PROFILES:
+        raise ValueError(f"Unknown route profile '{name}', expected one of: {', '.join(ROUTE_PROFILES)}")
+    return ROUTE_PROFILES[name]
+
+
+def route_request_params(profile: RouteProfile) -> Dict[str, str]:
+    """calculateRoute query parameters for a profile (without the API key)"""
+    return {**BASE_ROUTE_PARAMS, **profile.params}
+
+
+def slim_route_response(route_data: Dict[str, Any], profile: RouteProfile) -> Dict[str, Any]:
+    """
+    Keep only what the profile uses from a calculateRoute response. The result keeps
+    the TomTom shape (routes -> summary/legs/guidance/progress), so the map and summary
+    helpers work on it unchanged; sections and instruction groups are always dropped.
+    """
+    if not route_data.get("routes"):
+        return route_data  # errors and empty results are small, keep them as they are
+
+    routes: List[Dict[str, Any]] = []
+    for route in route_data["routes"]:
+        slim: Dict[str, Any] = {"summary": route.get("summary", {})}
+
+        legs = []
+        for leg in route.get("legs", []):
+            slim_leg = {"summary": leg.get("summary", {})}
+            if profile.points and "points" in leg:
+                slim_leg["points"] = leg["points"]
+            legs.append(slim_leg)
+        slim["legs"] = legs
+
+        if profile.instructions and "guidance" in route:
+            slim["guidance"] = {
+                "instructions": [
+                    {key: instruction[key] for key in INSTRUCTION_FIELDS if key in instruction}
+                    for instruction in route["guidance"].get("instructions", [])
+                ]
+            }
+        if profile.progress and "progress" in route:
+            slim["progress"] = route["progress"]
+        routes.append(slim)
+
+    slimmed = {"routes": routes}
+    if "formatVersion" in route_data:
+        slimmed["formatVersion"] = route_data["formatVersion"]
+    return slimmed
@@ -0,0 +1,130 @@
+import math
+import threading
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+# Radius used when nothing is known about an area (5 miles)
+DEFAULT_RADIUS_M = 8047
+MIN_RADIUS_M = 1000
+MAX_RADIUS_M = 50000
+# A search with fewer results than this is widened (while steps are left)
+MIN_RESULTS = 5
+# Results the radius is sized for: one browse page, all of it fits on the map
+TARGET_RESULTS = 100
+# Provider requests one adaptive search may make
+MAX_RADIUS_STEPS = 3
+# Bounds of the factor a radius grows by in one step
+MIN_GROWTH, MAX_GROWTH = 1.5, 3.0
+# Density tiles are ~11 km high, observations of a tile are blended with this weight
+TILE_DEGREES = 0.1
+OBSERVATION_WEIGHT = 0.5
+
+# Async search of one page at a radius: (radius in meters, max results) -> HERE browse response
+RadiusSearchFn = Callable[[int, int], Awaitable[Dict[str, Any]]]
+
+
+def _tile(location: Tuple[float, float]) -> Tuple[int, int]:
+    return (int(math.floor(location[0] / TILE_DEGREES)), int(math.floor(location[1] / TILE_DEGREES)))
+
+
+class DensityTiles:
+    """
+    Process-wide estimate of how many places of a kind there are per km², on a grid of
+    tiles, learned from the outcome of every search (including the ones that found nothing).
+    """
+
+    def __init__(self):
+        # (kind, tile) -> places per km²
+        self._density: Dict[Tuple[str, Tuple[int, int]], float] = {}
+        self._lock = threading.Lock()
+
+    def estimate(self, kind: str, location: Tuple[float, float]) -> Optional[float]:
+        """Density at location: its own tile, else the mean of the known neighbours, else None"""
+        row, col = _tile(location)
+        with self._lock:
+            own = self._density.get((kind, (row, col)))
+            if own is not None:
+                return own
+            neighbours = [self._density[(kind, (row + dr, col + dc))]
+                          for dr in (-1, 0, 1) for dc in (-1, 0, 1)
+                          if (kind, (row + dr, col + dc)) in self._density]
+        return sum(neighbours) / len(neighbours) if neighbours else None
+
+    def observe(self, kind: str, location: Tuple[float, float], radius: float, items: List[Dict[str, Any]], full: bool) -> None:
+        """
+        Record a search result. A full page only tells how far the nearest places reach,
+        so its density is taken over the circle up to the farthest returned place.
+        """
+        reach = radius
+        if full:
+            distances = [item["distance"] for item in items if item.get("distance") is not None]
+            if distances:
+                reach = max(MIN_RADIUS_M / 2, max(distances))
+        density = len(items) / (math.pi * (reach / 1000) ** 2)
+        key = (kind, _tile(location))
+        with self._lock:
+            previous = self._density.get(key)
+            self._density[key] = density if previous is None else \
+                OBSERVATION_WEIGHT * density + (1 - OBSERVATION_WEIGHT) * previous
+
+
+density_tiles = DensityTiles()
+
+
+def _clamp(radius: float) -> int:
+    return int(min(MAX_RADIUS_M, max(MIN_RADIUS_M, radius)))
+
+
+def initial_radius(density: Optional[float], target: int = TARGET_RESULTS) -> int:
+    """Radius expected to hold target places at this density, the default when unknown"""
+    if density is None:
+        return DEFAULT_RADIUS_M
+    if density <= 0:
+        return MAX_RADIUS_M  # searched before and found nothing, start wide
+    return _clamp(1000 * math.sqrt(target / (math.pi * density)))
+
+
+def expanded_radius(radius: int, found: int, wanted: int = MIN_RESULTS) -> int:
+    """Next radius of a search that found too little, growth bounded per step"""
+    growth = MAX_GROWTH if found == 0 else math.sqrt(wanted / found) * 1.2
+    return _clamp(radius * min(MAX_GROWTH, max(MIN_GROWTH, growth)))
+
+
+@dataclass
+class RadiusSearch:
+    """Outcome of an adaptive search: the radius used, its first page and the requests it took"""
+    radius: int
+    page: Dict[str, Any]
+    steps: int
+    complete: bool  # the page holds everything the chat and map will show, no need to page further
+
+
+async def adaptive_search(location: Tuple[float, float], kind: str, search_fn: RadiusSearchFn,
+                          tiles: DensityTiles = density_tiles, page_size: int = TARGET_RESULTS,
+                          min_results: int = MIN_RESULTS, max_steps: int = MAX_RADIUS_STEPS) -> RadiusSearch:
+    """
+    Search with a radius sized from the density estimate of the area. Too few results
+    widen the radius (at most max_steps requests in total). A full page contracts it to
+    the reach of the returned places: browse results come nearest first, so the page is
+    already the best answer and the places beyond it would only be extra candidates.
+    Only a full page that reaches the edge of the circle is left to be paged further.
+    """
+    radius = initial_radius(tiles.estimate(kind, location), page_size)
+    page: Dict[str, Any] = {"items": []}
+    for step in range(1, max_steps + 1):
+        # A page is only "full" against the limit it was requested with
+        page = await search_fn(radius, page_size)
+        items = page.get("items", [])
+        full = len(items) >= page_size
+        tiles.observe(kind, location, radius, items, full)
+
+        if full:
+            reach = max((item.get("distance") or 0 for item in items), default=radius)
+            if reach < radius:
+                return RadiusSearch(radius=_clamp(reach), page=page, steps=step, complete=True)
+            # The page reaches the edge (not ranked by distance), page through the circle instead
+            return RadiusSearch(radius=radius, page=page, steps=step, complete=False)
+        if len(items) >= min_results or radius >= MAX_RADIUS_M or step == max_steps:
+            return RadiusSearch(radius=radius, page=page, steps=step, complete=True)
+        radius = expanded_radius(radius, len(items), min_results)
+    return RadiusSearch(radius=radius, page=page, steps=max_steps, complete=True)
@@ -0,0 +1,108 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, Dict, List, Optional
+
+# First byte of every stored value tells which codec wrote it, so the format can change
+# without breaking databases written before
+_ZJSON = b"z"
+
+
+def encode_value(value: Any) -> bytes:
+    """Compact binary serialization of a session value (compressed JSON)"""
+    return _ZJSON + zlib.compress(json.dumps(value, separators=(",", ":")).encode("utf-8"))
+
+
+def decode_value(blob: bytes) -> Any:
+    """Inverse of encode_value, ValueError for a value this version cannot read"""
+    codec, data = blob[:1], blob[1:]
+    if codec != _ZJSON:
+        raise ValueError(f"Unknown session value codec {codec!r}")
+    try:
+        return json.loads(zlib.decompress(data).decode("utf-8"))
+    except zlib.error as e:
+        raise ValueError(f"Corrupt session value: {e}") from e
+
+
+class SQLiteSessionStore:
+    """
+    Durable session snapshots in a local SQLite file.
+
+    Each top-level session key (messages, app_state, chat_state, ...) is its own row,
+    so save() only rewrites the keys whose serialized value changed since the last
+    write, and load() restores a whole session by id with a single indexed query.
+    Route geometry is kept as encoded polylines in session state, which keeps rows small.
+    """
+
+    def __init__(self, path: str = "rovis_sessions.db"):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS session_state ("
+                " session_id TEXT NOT NULL,"
+                " key TEXT NOT NULL,"
+                " value BLOB NOT NULL,"
+                " digest BLOB NOT NULL,"
+                " updated_at REAL NOT NULL,"
+                " PRIMARY KEY (session_id, key))"
+            )
+        # (session_id, key) -> digest of the last value written, avoids re-reading the db
+        self._digests: Dict[tuple, bytes] = {}
+        self._lock = threading.Lock()
+
+    def save(self, session_id: str, session: Dict[str, Any]) -> List[str]:
+        """Write the keys of the session that changed since the last save, returns their names"""
+        now = time.time()
+        rows = []
+        for key, value in session.items():
+            blob = encode_value(value)
+            digest = hashlib.blake2b(blob, digest_size=16).digest()
+            if self._digests.get((session_id, key)) != digest:
+                rows.append((session_id, key, blob, digest, now))
+
+        if not rows:
+            return []
+
+        with self._lock:
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO session_state (session_id, key, value, digest, updated_at)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    rows
+                )
+            for _, key, _, digest, _ in rows:
+                self._digests[(session_id, key)] = digest
+        return [row[1] for row in rows]
+
+    def load(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Restore a session by id, None if it was never saved"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key, value, digest FROM session_state WHERE session_id = ?",
+                (session_id,)
+            ).fetchall()
+            if not rows:
+                return None
+            session = {}
+            for key, blob, digest in rows:
+                session[key] = decode_value(blob)
+                self._digests[(session_id, key)] = digest
+        return session
+
+    def delete(self, session_id: str) -> None:
+        """Remove a stored session"""
+        with self._lock:
+            with self._conn:
+                self._conn.execute("DELETE FROM session_state WHERE session_id = ?", (session_id,))
+            for cache_key in [k for k in self._digests if k[0] == session_id]:
+                del self._digests[cache_key]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
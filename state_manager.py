@@ -1,21 +1,48 @@
-from typing import Any, Dict
+import sqlite3
+import uuid
+from typing import Any, Dict, List, MutableMapping, Optional
 
-import streamlit as st
+from result_store import result_store
+
+# Keys that make up the state of one planning session. The agent never reads these
+# from st.session_state: app.py exports them into a plain dict per run, the workflow
+# carries that dict in its Context, and the result is imported back afterwards.
+SESSION_KEYS = ['session_id', 'messages', 'off_topic_count', 'app_state', 'chat_state', 'locations', 'token_usage']
+
+# Entries kept per app_state action. Entries only hold compact records and result store
+# handles; the payload of an entry that falls out is released from the result store.
+MAX_APP_STATE_ENTRIES = 20
 
 
 class StateManager:
+    # Optional durable store for session snapshots (see session_store.SQLiteSessionStore)
+    persistence_backend = None
+
     @staticmethod
-    def init_session_state():
+    def init_session_state(session: MutableMapping[str, Any]):
         """Initialize session state if not exists"""
-        if 'app_state' not in st.session_state:
-            st.session_state.app_state = {
+        if 'session_id' not in session:
+            session['session_id'] = uuid.uuid4().hex
+        if 'messages' not in session:
+            session['messages'] = []
+        if 'off_topic_count' not in session:
+            session['off_topic_count'] = 0
+        if 'app_state' not in session:
+            session['app_state'] = {
                 'searches': [],
                 'routes': [],
-                'ambiguous': [],  
-                'place_search_info': []  
+                'ambiguous': [],
+                'place_search_info': [],
+                'stop_plans': []
             }
-        if 'chat_state' not in st.session_state:
-            st.session_state.chat_state = {
+        if 'locations' not in session:
+            # Location names resolved in this session (see location_memo)
+            session['locations'] = {}
+        if 'token_usage' not in session:
+            # LLM token totals of this session (see token_accounting), restored on resume
+            session['token_usage'] = {}
+        if 'chat_state' not in session:
+            session['chat_state'] = {
                 'start': None,
                 'end': None,
                 'endAtStart': False,
@@ -31,19 +58,62 @@ class StateManager:
             }
 
     @staticmethod
-    def update_chat_state(route_info: Dict[str, Any]):
+    def export_session(state: MutableMapping[str, Any]) -> Dict[str, Any]:
+        """Copy the per-session keys (e.g. from st.session_state) into a plain dict for the agent"""
+        return {key: state[key] for key in SESSION_KEYS if key in state}
+
+    @staticmethod
+    def import_session(state: MutableMapping[str, Any], session: Dict[str, Any]):
+        """Write the session dict returned by the agent back (e.g. into st.session_state)"""
+        for key in SESSION_KEYS:
+            if key in session:
+                state[key] = session[key]
+
+    @staticmethod
+    def set_persistence_backend(backend):
+        """Enable durable snapshots of session state"""
+        StateManager.persistence_backend = backend
+
+    @staticmethod
+    def persist_session(state: MutableMapping[str, Any]) -> List[str]:
+        """Save the per-session keys that changed since the last save, returns their names"""
+        if StateManager.persistence_backend is None or 'session_id' not in state:
+            return []
+        session = StateManager.export_session(state)
+        return StateManager.persistence_backend.save(session['session_id'], session)
+
+    @staticmethod
+    def resume_session(session_id: str) -> Optional[Dict[str, Any]]:
+        """Load a saved session by id, None if there is none (or no backend, or it cannot be read)"""
+        if StateManager.persistence_backend is None or not session_id:
+            return None
+        try:
+            return StateManager.persistence_backend.load(session_id)
+        except (ValueError, sqlite3.Error) as e:
+            # A snapshot this version cannot read starts a fresh session instead of failing the page
+            print(f"Could not resume session {session_id}: {e}")
+            return None
+
+    @staticmethod
+    def update_chat_state(session: MutableMapping[str, Any], route_info: Dict[str, Any]):
         """Update chat state with route information"""
         for key, value in route_info.items():
-            if key in st.session_state.chat_state:
-                st.session_state.chat_state[key] = value
+            if key in session['chat_state']:
+                session['chat_state'][key] = value
 
     @staticmethod
-    def update_app_state(action: str, data: Dict[str, Any]):
+    def update_app_state(session: MutableMapping[str, Any], action: str, data: Dict[str, Any]):
         """Update app state based on action"""
-        if 'app_state' not in st.session_state:
-            st.session_state.app_state = {}  # This is extra defensive (optional)
-            
-        if action not in st.session_state.app_state:
-            st.session_state.app_state[action] = []
+        if 'app_state' not in session:
+            session['app_state'] = {}  # This is extra defensive (optional)
+
+        if action not in session['app_state']:
+            session['app_state'][action] = []
+
+        entries = session['app_state'][action]
+        entries.append(data)
 
-        st.session_state.app_state[action].append(data)
+        while len(entries) > MAX_APP_STATE_ENTRIES:
+            dropped = entries.pop(0)
+            if isinstance(dropped, dict) and dropped.get('ref'):
+                result_store.release(dropped['ref'])
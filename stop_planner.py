@@ -0,0 +1,251 @@
+import asyncio
+import math
+import re
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from opening_hours import HoursIndex, eta_after, local_minute_of_week
+from place_store import Place, place_store
+from polyline_codec import extract_polyline_from_route
+from result_projection import PlaceRecord, project_places
+from trip_optimizer import haversine_matrix
+
+# Stop points of the same kind closer than this share one search (about half the search radius)
+DEDUPE_RADIUS_M = 4000
+# HERE requests in flight at once for one trip
+MAX_CONCURRENT_SEARCHES = 4
+# Places listed per stop
+PLACES_PER_STOP = 3
+# Minutes a meal stop takes, a place has to stay open that long after the arrival
+STAY_MINUTES = {"meal": 45, "hotel": 0}
+
+_HOURS = re.compile(r"\d+(?:\.\d+)?")
+
+# Async search: (kind, (lat, lon)) -> HERE browse response, kind is "hotel" or "meal"
+SearchFn = Callable[[str, Tuple[float, float]], Awaitable[Dict[str, Any]]]
+
+
+@dataclass
+class DrivingDay:
+    """One day of driving along the route"""
+    day: int
+    start_seconds: float
+    end_seconds: float
+    end_point: Tuple[float, float]
+    midday_point: Tuple[float, float]
+    overnight: bool  # False on the last day, which ends at the destination
+
+
+@dataclass
+class StopRequest:
+    """A place search needed by the trip, shared by every day whose stop point is close enough"""
+    kind: str
+    location: Tuple[float, float]
+    days: List[int] = field(default_factory=list)
+
+
+def parse_driving_hours(value: Any) -> Optional[float]:
+    """
+    Daily driving limit of a route request in hours: a number, or the first number in a
+    string such as "6 hours". None when it has no usable (positive) limit.
+    """
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        hours = float(value)
+    elif isinstance(value, str):
+        match = _HOURS.search(value)
+        if match is None:
+            return None
+        hours = float(match.group())
+    else:
+        return None
+    return hours if math.isfinite(hours) and hours > 0 else None
+
+
+def cumulative_travel_times(route_data: Dict[str, Any], n_points: int) -> np.ndarray:
+    """
+    Seconds from departure at every route point. Uses the per-point progress of the
+    day_split route profile, else spreads the summary travel time by distance.
+    """
+    route = route_data["routes"][0]
+    progress = route.get("progress") or []
+    if progress:
+        indices = np.array([p["pointIndex"] for p in progress], dtype=float)
+        seconds = np.array([p["travelTimeInSeconds"] for p in progress], dtype=float)
+        return np.interp(np.arange(n_points), indices, seconds)
+
+    total = route.get("summary", {}).get("travelTimeInSeconds", 0)
+    return np.linspace(0.0, float(total), n_points)
+
+
+def split_into_days(route_data: Dict[str, Any], max_driving_hours: float) -> List[DrivingDay]:
+    """Cut the route where each day's driving limit is reached"""
+    points = extract_polyline_from_route(route_data)
+    if not points or not max_driving_hours or max_driving_hours <= 0:
+        return []
+
+    elapsed = cumulative_travel_times(route_data, len(points))
+    total = float(elapsed[-1])
+    limit = max_driving_hours * 3600
+    n_days = max(1, int(np.ceil(total / limit - 1e-9)))
+
+    def point_at(seconds: float) -> Tuple[float, float]:
+        index = min(len(points) - 1, int(np.searchsorted(elapsed, seconds)))
+        return points[index]
+
+    days = []
+    for day in range(1, n_days + 1):
+        start_seconds = (day - 1) * limit
+        end_seconds = min(day * limit, total)
+        days.append(DrivingDay(
+            day=day,
+            start_seconds=start_seconds,
+            end_seconds=end_seconds,
+            end_point=point_at(end_seconds),
+            midday_point=point_at((start_seconds + end_seconds) / 2),
+            overnight=day < n_days,
+        ))
+    return days
+
+
+def stop_requests(days: List[DrivingDay], radius_m: float = DEDUPE_RADIUS_M) -> List[StopRequest]:
+    """Hotel searches at each overnight end point and meal searches midday, nearby points merged"""
+    wanted = [("meal", day.midday_point, day.day) for day in days]
+    wanted += [("hotel", day.end_point, day.day) for day in days if day.overnight]
+
+    requests: List[StopRequest] = []
+    for kind in ("hotel", "meal"):
+        of_kind = [(location, day) for k, location, day in wanted if k == kind]
+        if not of_kind:
+            continue
+        distances = haversine_matrix([location for location, _ in of_kind])
+        assigned: List[Optional[StopRequest]] = [None] * len(of_kind)
+        for i, (location, day) in enumerate(of_kind):
+            # Reuse the search of an earlier point within the radius (e.g. a short day)
+            for j in range(i):
+                if assigned[j] is not None and distances[i, j] <= radius_m:
+                    assigned[i] = assigned[j]
+                    break
+            if assigned[i] is None:
+                assigned[i] = StopRequest(kind=kind, location=location)
+                requests.append(assigned[i])
+            assigned[i].days.append(day)
+    return requests
+
+
+async def run_searches(requests: List[StopRequest], search_fn: SearchFn,
+                       max_concurrency: int = MAX_CONCURRENT_SEARCHES) -> List[Dict[str, Any]]:
+    """All searches of a trip at once, at most max_concurrency in flight. Failed searches give no items."""
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def search(request: StopRequest) -> Dict[str, Any]:
+        async with semaphore:
+            try:
+                return await search_fn(request.kind, request.location)
+            except Exception as e:
+                print(f"Error searching {request.kind} stops near {request.location}: {e}")
+                return {"items": []}
+
+    return await asyncio.gather(*(search(request) for request in requests))
+
+
+def route_departure(route_data: Dict[str, Any]) -> Optional[datetime]:
+    """Departure time of a route (with its UTC offset), None if the route has none"""
+    value = route_data["routes"][0].get("summary", {}).get("departureTime")
+    try:
+        return datetime.fromisoformat(value) if value else None
+    except ValueError:
+        return None
+
+
+def stop_eta(departure: datetime, day: DrivingDay, kind: str) -> datetime:
+    """
+    When a day's stop is reached: meals halfway through the day's driving, hotels at its
+    end. Every driving day is assumed to start at the clock time of the departure.
+    """
+    seconds = day.end_seconds - day.start_seconds
+    return eta_after(departure, day.day, seconds / 2 if kind == "meal" else seconds)
+
+
+def open_on_arrival(records: List[PlaceRecord], places: List[Optional[Place]], index: HoursIndex,
+                    eta: datetime, stay: int) -> List[PlaceRecord]:
+    """
+    The records (in order) open at eta for stay minutes, each checked in the time zone of
+    its stored place (the departure's when unknown). Places with unknown hours are kept.
+    """
+    minutes_by_tz: Dict[Optional[str], int] = {}
+    minutes = np.empty(len(records), dtype=np.int64)
+    for i, place in enumerate(places):
+        tz = place.tz if place is not None else None
+        if tz not in minutes_by_tz:
+            minutes_by_tz[tz] = local_minute_of_week(eta, tz)
+        minutes[i] = minutes_by_tz[tz]
+    is_open = index.open_at(minutes, stay)
+    return [record for record, open_ in zip(records, is_open) if open_]
+
+
+def bundle_by_day(days: List[DrivingDay], requests: List[StopRequest], results: List[Dict[str, Any]],
+                  per_stop: int = PLACES_PER_STOP, departure: Optional[datetime] = None) -> List[Dict[str, Any]]:
+    """
+    Per-day bundle: where the day ends, and the top hotels and meal places for it. With
+    a departure time, each day gets the arrival times of its stops and only places open
+    on arrival are listed.
+    """
+    places: Dict[Tuple[str, int], List[PlaceRecord]] = {}
+    etas: Dict[Tuple[str, int], datetime] = {}
+    by_day = {day.day: day for day in days}
+    for request, result in zip(requests, results):
+        records = project_places(result)
+        if departure is None:
+            for day in request.days:
+                places[(request.kind, day)] = records[:per_stop]
+            continue
+
+        # One index of the candidates' hours, checked at the arrival time of every day sharing the search
+        stored = [place_store.get(record.id) if record.id else None for record in records]
+        index = HoursIndex([place.hours if place is not None else None for place in stored])
+        for day in request.days:
+            eta = stop_eta(departure, by_day[day], request.kind)
+            etas[(request.kind, day)] = eta
+            places[(request.kind, day)] = open_on_arrival(records, stored, index, eta, STAY_MINUTES[request.kind])[:per_stop]
+
+    def eta_of(kind: str, day: int) -> Optional[str]:
+        eta = etas.get((kind, day))
+        return eta.isoformat() if eta is not None else None
+
+    return [{
+        "day": day.day,
+        "driving_seconds": day.end_seconds - day.start_seconds,
+        "end": {"lat": day.end_point[0], "lon": day.end_point[1]},
+        "overnight": day.overnight,
+        "hotels": places.get(("hotel", day.day), []),
+        "meals": places.get(("meal", day.day), []),
+        "hotel_eta": eta_of("hotel", day.day),
+        "meal_eta": eta_of("meal", day.day),
+    } for day in days]
+
+
+async def plan_stops(route_data: Dict[str, Any], max_driving_hours: float, search_fn: SearchFn,
+                     max_concurrency: int = MAX_CONCURRENT_SEARCHES) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    Split a route into driving days and search overnight hotels and midday meal stops
+    for all of them in one batch. Stops are filtered to the places open when the route
+    reaches them. Returns the per-day bundles and the raw search results.
+    """
+    days = split_into_days(route_data, max_driving_hours)
+    requests = stop_requests(days)
+    results = await run_searches(requests, search_fn, max_concurrency)
+    return bundle_by_day(days, requests, results, departure=route_departure(route_data)), results
+
+
+def here_search_fn(here_api) -> SearchFn:
+    """SearchFn backed by HereAPI, the blocking requests run in worker threads"""
+    async def search(kind: str, location: Tuple[float, float]) -> Dict[str, Any]:
+        if kind == "hotel":
+            return await asyncio.to_thread(here_api.search_hotels, location)
+        return await asyncio.to_thread(here_api.search_meal_places, location)
+    return search
@@ -0,0 +1,27 @@
+import asyncio
+
+from api_wrappers import HereAPI
+
+CENTER = (39.74, -104.99)
+
+
+def collect(here, **kwargs):
+    async def run():
+        return [page async for page in here.iter_places(CENTER, radius=1000, page_size=3, **kwargs)]
+    return asyncio.run(run())
+
+
+def test_places_without_an_id_are_not_dropped_as_duplicates():
+    here = HereAPI(api_key="test")
+    near = {"lat": 39.7401, "lng": -104.9901}
+    first_page = {"items": [{"id": "a", "position": near}, {"position": near}, {"position": near}]}
+    # Every sub-area returns the same places, plus one without an id outside the circle
+    here.search_places = lambda *args: {"items": [{"id": "a", "position": near}, {"position": near},
+                                                  {"position": {"lat": 39.9, "lng": -104.99}}]}
+
+    pages = collect(here, first_page=first_page)
+    assert len(pages[0]["items"]) == 3
+    later = [item for page in pages[1:] for item in page["items"]]
+    # "a" is only yielded once, id-less places inside the circle are kept on every page
+    assert all("id" not in item and item["position"] == near for item in later)
+    assert len(later) == 7
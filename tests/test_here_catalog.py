@@ -0,0 +1,32 @@
+import pytest
+
+from here_catalog import get_food_type_index
+
+
+@pytest.fixture(scope="module")
+def index():
+    return get_food_type_index()
+
+
+@pytest.mark.parametrize("message", [
+    "find a nice restaurant near Denver",
+    "restaurants near Paris",
+    "restaurants in Tampa",
+    "food in Seoul",
+])
+def test_plain_restaurant_search_gets_no_food_types(index, message):
+    assert index.match(message) == []
+
+
+def test_american_diner_is_american_only(index):
+    assert index.match("american diner") == ["101-000"]
+
+
+@pytest.mark.parametrize("message, food_type", [
+    ("suhsi", "203-027"),
+    ("suhsi restaurant", "203-027"),
+    ("itallian food", "304-000"),
+    ("some good bbq", "101-003"),
+])
+def test_cuisine_requests_and_typos_still_match(index, message, food_type):
+    assert food_type in index.match(message)
@@ -0,0 +1,49 @@
+from json_extract import ROUTE_INFO_SCHEMA, matches_schema
+from location_memo import LocationMemo, known_location_names, resolve_mention, resolve_route_info
+
+DENVER = {"name": "Denver, CO", "lat": 39.7392, "lon": -104.9903}
+SPRINGFIELD_IL = {"name": "Springfield", "lat": 39.7817, "lon": -89.6501}
+SPRINGFIELD_MO = {"name": "Springfield", "lat": 37.2090, "lon": -93.2923}
+
+
+def test_known_places_are_given_by_name_and_keep_their_coordinates():
+    memo = LocationMemo()
+    session = {}
+    resolve_mention(session, DENVER, memo=memo)
+    assert known_location_names(session) == ["Denver, CO"]
+
+    route_info = {"start": {"name": "denver co"}, "end": {"name": "Salt Lake City, UT", "lat": 40.7608, "lon": -111.891}}
+    assert matches_schema(route_info, ROUTE_INFO_SCHEMA)
+    resolved = resolve_route_info(session, route_info, memo=memo)
+    assert (resolved["start"]["lat"], resolved["start"]["lon"]) == (DENVER["lat"], DENVER["lon"])
+
+
+def test_re_derived_coordinates_close_by_keep_the_remembered_ones():
+    memo = LocationMemo()
+    session = {}
+    resolve_mention(session, DENVER, memo=memo)
+    drifted = resolve_mention(session, {"name": "Denver, CO", "lat": 39.74, "lon": -104.99}, memo=memo)
+    assert (drifted["lat"], drifted["lon"]) == (DENVER["lat"], DENVER["lon"])
+
+
+def test_coordinates_far_away_correct_a_wrongly_resolved_place():
+    memo = LocationMemo()
+    session = {}
+    resolve_mention(session, SPRINGFIELD_IL, memo=memo)
+    corrected = resolve_mention(session, SPRINGFIELD_MO, memo=memo)
+    assert (corrected["lat"], corrected["lon"]) == (SPRINGFIELD_MO["lat"], SPRINGFIELD_MO["lon"])
+    # The correction is remembered, a later mention by name gets the corrected place
+    again = resolve_mention(session, {"name": "Springfield"}, memo=memo)
+    assert (again["lat"], again["lon"]) == (SPRINGFIELD_MO["lat"], SPRINGFIELD_MO["lon"])
+
+
+def test_global_memo_only_fills_in_missing_coordinates():
+    memo = LocationMemo()
+    resolve_mention({}, SPRINGFIELD_IL, memo=memo)
+
+    other_session = {}
+    filled = resolve_mention(other_session, {"name": "Springfield"}, memo=memo)
+    assert (filled["lat"], filled["lon"]) == (SPRINGFIELD_IL["lat"], SPRINGFIELD_IL["lon"])
+    # Another user's Springfield does not override coordinates the LLM gave
+    own = resolve_mention({}, SPRINGFIELD_MO, memo=memo)
+    assert (own["lat"], own["lon"]) == (SPRINGFIELD_MO["lat"], SPRINGFIELD_MO["lon"])
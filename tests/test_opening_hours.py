@@ -0,0 +1,25 @@
+import numpy as np
+
+from opening_hours import MINUTES_PER_DAY, HoursIndex, compile_opening_hours
+
+# Open Sunday 22:00 until Monday 02:00
+LATE_SUNDAY = [{"structured": [{"start": "T220000", "duration": "PT04H00M", "recurrence": "FREQ:DAILY;BYDAY:SU"}]}]
+
+
+def test_late_sunday_hours_stay_open_on_monday_morning():
+    index = HoursIndex([compile_opening_hours(LATE_SUNDAY)])
+    monday_1am = 60
+    sunday_11pm = 6 * MINUTES_PER_DAY + 23 * 60
+    monday_3am = 3 * 60
+
+    assert index.open_at(np.array([monday_1am]))[0]
+    assert index.open_at(np.array([sunday_11pm]))[0]
+    assert not index.open_at(np.array([monday_3am]))[0]
+    # A stay starting late on Sunday runs into Monday
+    assert index.open_at(np.array([sunday_11pm]), stay=120)[0]
+    assert not index.open_at(np.array([monday_1am]), stay=120)[0]
+
+
+def test_unknown_hours():
+    assert compile_opening_hours(None) is None
+    assert HoursIndex([None]).open_at(np.array([0]))[0]
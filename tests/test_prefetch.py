@@ -0,0 +1,45 @@
+import asyncio
+
+from prefetch import PrefetchCache, PrefetchScheduler
+from stop_planner import StopRequest
+
+BUSY = (36.1, -115.1)
+QUEUED = (35.2, -111.6)
+
+
+def test_lookups_do_not_wait_for_prefetches_queued_behind_others():
+    async def run():
+        release = asyncio.Event()
+        searched = []
+
+        async def background(kind, location):
+            searched.append(location)
+            await release.wait()
+            return {"items": [{"title": "prefetched"}]}
+
+        async def foreground(kind, location):
+            return {"items": [{"title": "searched now"}]}
+
+        scheduler = PrefetchScheduler(PrefetchCache(), max_in_flight=1)
+        scheduler.schedule("other", [StopRequest(kind="hotel", location=BUSY),
+                                     StopRequest(kind="hotel", location=QUEUED)], background)
+        await asyncio.sleep(0)
+
+        # The queued prefetch is not waited for, the user's own search answers and fills the cache
+        assert await asyncio.wait_for(scheduler.lookup("hotel", QUEUED), 1) is None
+        result = await asyncio.wait_for(scheduler.with_prefetch(foreground)("hotel", QUEUED), 1)
+        assert result["items"][0]["title"] == "searched now"
+
+        # The prefetch searching right now is waited for
+        waiting = asyncio.ensure_future(scheduler.lookup("hotel", BUSY))
+        await asyncio.sleep(0)
+        assert not waiting.done()
+        release.set()
+        assert (await asyncio.wait_for(waiting, 1))["items"][0]["title"] == "prefetched"
+
+        # Once it gets its turn, the queued prefetch finds its search answered and skips it
+        while scheduler.pending:
+            await asyncio.sleep(0)
+        assert searched == [BUSY]
+
+    asyncio.run(run())
@@ -0,0 +1,46 @@
+import json
+import os
+
+from place_store import place_store
+from result_projection import (PlaceRecord, RouteRecord, project_places, records_to_place_refs,
+                               render_places, render_route, render_stop_plan, resolve_place_refs)
+from session_store import SQLiteSessionStore
+
+FIXTURE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "api-mock", "location-response.json")
+
+
+def test_place_refs_survive_a_resume_with_an_empty_place_store(tmp_path):
+    with open(FIXTURE) as f:
+        records = project_places(json.load(f))
+    session = {"session_id": "resume", "app_state": {"searches": [{"places": records_to_place_refs(records)}]}}
+
+    store = SQLiteSessionStore(str(tmp_path / "sessions.db"))
+    store.save(session["session_id"], session)
+    # A restart (or another replica) starts with an empty place store
+    place_store._places.clear()
+    resumed = store.load(session["session_id"])
+
+    places = resolve_place_refs(resumed["app_state"]["searches"][0]["places"])
+    assert [(p.id, p.title, p.lat, p.lon) for p in places] == [(r.id, r.title, r.lat, r.lon) for r in records]
+
+
+def test_rendered_results_carry_no_handle():
+    with open(FIXTURE) as f:
+        records = project_places(json.load(f))
+    route = RouteRecord(distance=12000, travel_time=900, traffic_delay=0, departure_time=None,
+                        arrival_time=None, legs=1, points=10)
+
+    for text in (render_places(records), render_places(records, budget=200), render_route(route)):
+        assert "ref" not in text
+    assert render_places(records, budget=200).endswith("more.")
+
+
+def test_stop_plan_times_are_given_in_the_places_time_zone():
+    place_store.intern({"id": "tz-test", "title": "Motel", "position": {"lat": 36.1, "lng": -115.1},
+                        "timeZone": {"name": "America/Los_Angeles"}})
+    motel = PlaceRecord(id="tz-test", title="Motel", lat=36.1, lon=-115.1, address="", distance=None, category=None)
+    day = {"day": 1, "driving_seconds": 3600, "overnight": True, "meals": [], "hotels": [motel],
+           # 18:30 in Denver is 17:30 in Las Vegas
+           "hotel_eta": "2026-10-19T18:30:00-06:00", "meal_eta": None}
+
+    assert "Overnight (around 17:30): Motel" in render_stop_plan([day])
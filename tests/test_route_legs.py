@@ -0,0 +1,53 @@
+import asyncio
+import copy
+import json
+import os
+
+from route_legs import LegCache, route_by_legs, splice_legs, split_legs
+
+FIXTURE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "api-mock", "route-response.json")
+
+
+def fixture_leg():
+    with open(FIXTURE) as f:
+        route = json.load(f)["routes"][0]
+    route.pop("sections", None)
+    return route
+
+
+def two_leg_route():
+    return splice_legs([fixture_leg(), fixture_leg()])["routes"][0]
+
+
+def test_split_legs_undoes_splice_legs():
+    route = two_leg_route()
+    legs = split_legs(copy.deepcopy(route))
+    assert len(legs) == 2
+    assert legs[1]["progress"][0] == {"pointIndex": 0, "travelTimeInSeconds": 0}
+    assert legs[1]["guidance"]["instructions"][0]["maneuver"] == "DEPART"
+    assert legs[0]["guidance"]["instructions"][-1]["maneuver"] == "ARRIVE"
+    respliced = splice_legs(legs)["routes"][0]
+    assert respliced["progress"] == route["progress"]
+    assert respliced["guidance"] == route["guidance"]
+    assert respliced["summary"] == route["summary"]
+
+
+def test_cold_trip_is_routed_in_one_request_and_cached_by_leg():
+    calls = []
+
+    async def route_fn(origin, destination, depart_at, profile):
+        calls.append("leg")
+        return {"routes": [fixture_leg()]}
+
+    async def trip_fn(locations, depart_at, profile):
+        calls.append("trip")
+        return {"routes": [two_leg_route()]}
+
+    cache = LegCache()
+    locations = [(36.1, -115.1), (36.5, -114.0), (36.05, -112.1)]
+    route, routed = asyncio.run(route_by_legs(locations, None, "map", route_fn, cache, trip_fn=trip_fn))
+    assert calls == ["trip"] and routed == 2 and len(cache) == 2
+
+    route, routed = asyncio.run(route_by_legs(locations, None, "map", route_fn, cache, trip_fn=trip_fn))
+    assert calls == ["trip"] and routed == 0
+    assert len(route["routes"][0]["legs"]) == 2
@@ -0,0 +1,17 @@
+import asyncio
+
+from search_radius import TARGET_RESULTS, DensityTiles, adaptive_search
+
+
+def test_dense_area_asks_for_a_full_page_and_contracts_the_radius():
+    limits = []
+
+    async def search(radius, limit):
+        # A dense area: as many places as asked for, each 20 m further out
+        limits.append(limit)
+        return {"items": [{"distance": 20 * (i + 1)} for i in range(limit)]}
+
+    search_result = asyncio.run(adaptive_search((39.74, -104.99), "restaurant", search, tiles=DensityTiles()))
+    assert limits == [TARGET_RESULTS]
+    assert search_result.complete
+    assert search_result.radius < 8047
@@ -0,0 +1,22 @@
+from session_store import SQLiteSessionStore, decode_value, encode_value
+from state_manager import StateManager
+
+
+def test_values_round_trip():
+    value = {"messages": [{"role": "user", "content": "Denver to Salt Lake City"}], "off_topic_count": 0}
+    assert decode_value(encode_value(value)) == value
+
+
+def test_a_snapshot_that_cannot_be_read_starts_a_fresh_session(tmp_path):
+    store = SQLiteSessionStore(str(tmp_path / "sessions.db"))
+    store.save("sid", {"session_id": "sid", "messages": []})
+    # A row written by a codec this version does not know (e.g. msgpack)
+    with store._conn:
+        store._conn.execute("UPDATE session_state SET value = ? WHERE key = 'messages'", (b"m\x90",))
+
+    backend = StateManager.persistence_backend
+    StateManager.set_persistence_backend(store)
+    try:
+        assert StateManager.resume_session("sid") is None
+    finally:
+        StateManager.set_persistence_backend(backend)
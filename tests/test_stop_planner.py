@@ -0,0 +1,13 @@
+from stop_planner import parse_driving_hours
+
+
+def test_driving_hours_are_read_from_numbers_and_strings():
+    assert parse_driving_hours(8) == 8.0
+    assert parse_driving_hours("6") == 6.0
+    assert parse_driving_hours("6 hours") == 6.0
+    assert parse_driving_hours("about 7.5 hours a day") == 7.5
+
+
+def test_unusable_driving_hours_plan_no_stops():
+    for value in (None, "", "unknown", "no limit", 0, -3, True, float("nan"), {"hours": 6}):
+        assert parse_driving_hours(value) is None
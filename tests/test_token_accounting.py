@@ -0,0 +1,23 @@
+from token_accounting import CACHED_ANSWERS, AnswerCache, TokenAccountant
+
+
+def test_cached_answers_are_not_shared_between_callers():
+    cache = AnswerCache()
+    parsed = {"start": {"name": "Denver"}}
+    cache.put("route", "prompt", (parsed, "raw"))
+    parsed["start"]["name"] = "changed by the caller"
+
+    first = cache.get("route", "prompt")
+    first[0]["start"]["name"] = "changed by another session"
+    assert cache.get("route", "prompt")[0] == {"start": {"name": "Denver"}}
+
+
+def test_resumed_session_keeps_its_used_budget():
+    before_restart = TokenAccountant(session_budget=1000)
+    before_restart.record("s", "route", "google/gemma-3-27b-it", 1200, 0)
+    saved = before_restart.session_totals("s")
+
+    after_restart = TokenAccountant(session_budget=1000)
+    after_restart.restore_session("s", saved)
+    assert after_restart.session_usage("s").tokens == 1200
+    assert after_restart.degradation("s") == CACHED_ANSWERS
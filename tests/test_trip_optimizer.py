@@ -0,0 +1,31 @@
+import asyncio
+
+import numpy as np
+
+from trip_optimizer import TravelTimeCache, build_travel_time_matrix, estimate_travel_times
+
+POINTS = [(36.01, -114.99), (36.3, -114.9), (36.1, -114.7), (36.38, -114.62)]
+
+
+def test_unmeasured_pairs_keep_the_estimate_and_are_not_cached():
+    async def unrouted(origins, destinations):
+        return [[None] * len(destinations) for _ in origins]
+
+    cache = TravelTimeCache()
+    matrix, requests_made = asyncio.run(build_travel_time_matrix(POINTS, unrouted, cache=cache))
+
+    estimates = estimate_travel_times(POINTS)
+    np.fill_diagonal(estimates, 0.0)
+    assert requests_made == 1
+    assert np.allclose(matrix, estimates)
+    assert len(cache) == 0
+
+
+def test_measured_pairs_are_cached():
+    async def measured(origins, destinations):
+        return [[60.0] * len(destinations) for _ in origins]
+
+    cache = TravelTimeCache()
+    asyncio.run(build_travel_time_matrix(POINTS, measured, cache=cache))
+    assert len(cache) == len(POINTS) * (len(POINTS) - 1)
+    assert cache.get(POINTS[0], POINTS[1]) == 60.0
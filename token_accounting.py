@@ -0,0 +1,216 @@
+import copy
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from dataclasses import asdict, dataclass
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+# Approximate USD per million (prompt, completion) tokens of the models in model_tiers.STEP_MODELS,
+# unknown models are counted at 0
+MODEL_PRICES: Dict[str, Tuple[float, float]] = {
+    "google/gemma-3-4b-it": (0.02, 0.04),
+    "google/gemma-3-12b-it": (0.05, 0.10),
+    "google/gemma-3-27b-it": (0.10, 0.20),
+    "mistralai/mistral-small-3.1-24b-instruct": (0.10, 0.30),
+}
+
+# Tokens (prompt + completion) one session may use, 0 = unlimited
+SESSION_TOKEN_BUDGET = int(os.getenv("SESSION_TOKEN_BUDGET", "200000"))
+# Tokens all sessions together may use per GLOBAL_BUDGET_WINDOW_S, 0 = unlimited
+GLOBAL_TOKEN_BUDGET = int(os.getenv("GLOBAL_TOKEN_BUDGET", "0"))
+GLOBAL_BUDGET_WINDOW_S = 3600
+# Model every step falls back to once a budget is nearly spent
+BUDGET_MODEL = os.getenv("LLM_BUDGET_MODEL", "google/gemma-3-4b-it")
+
+# Degradation levels by the share of the budget used (the larger of session and global)
+SHORT_HISTORY, CHEAP_MODEL, CACHED_ANSWERS = 1, 2, 3
+DEGRADATION_THRESHOLDS = [(1.0, CACHED_ANSWERS), (0.8, CHEAP_MODEL), (0.5, SHORT_HISTORY)]
+# Chat messages of history pasted into prompts per degradation level, None = all
+HISTORY_MESSAGES = {0: None, SHORT_HISTORY: 6, CHEAP_MODEL: 4, CACHED_ANSWERS: 2}
+
+# Sessions tracked, least recently active dropped first
+MAX_TRACKED_SESSIONS = 10000
+# Answers kept for repeated prompts
+ANSWER_CACHE_SIZE = 1000
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about 4 characters per token) for calls the provider reports no usage for"""
+    return (len(text) + 3) // 4
+
+
+def response_usage(response: Any) -> Optional[Tuple[int, int]]:
+    """(prompt, completion) tokens reported with a llama_index completion response, None if not reported"""
+    kwargs = getattr(response, "additional_kwargs", None) or {}
+    if "prompt_tokens" in kwargs:
+        return int(kwargs["prompt_tokens"]), int(kwargs.get("completion_tokens", 0))
+    raw = getattr(response, "raw", None)
+    usage = raw.get("usage") if isinstance(raw, dict) else getattr(raw, "usage", None)
+    if usage is None:
+        return None
+    if isinstance(usage, dict):
+        return int(usage.get("prompt_tokens", 0)), int(usage.get("completion_tokens", 0))
+    return int(getattr(usage, "prompt_tokens", 0)), int(getattr(usage, "completion_tokens", 0))
+
+
+@dataclass
+class Usage:
+    """Running totals of LLM calls"""
+    calls: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cost_usd: float = 0.0
+
+    @property
+    def tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    def add(self, prompt_tokens: int, completion_tokens: int, cost_usd: float) -> None:
+        self.calls += 1
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+        self.cost_usd += cost_usd
+
+
+class TokenAccountant:
+    """
+    Process-wide token and cost accounting of LLM calls per step, session and model, with
+    per-session and global (rolling window) budgets. As a budget runs out, degradation()
+    tells the agent to cut history, then switch to the budget model, then reuse answers.
+    """
+
+    def __init__(self, session_budget: int = SESSION_TOKEN_BUDGET, global_budget: int = GLOBAL_TOKEN_BUDGET,
+                 window: float = GLOBAL_BUDGET_WINDOW_S):
+        self.session_budget = session_budget
+        self.global_budget = global_budget
+        self.window = window
+        self.total = Usage()
+        self.by_step: Dict[str, Usage] = {}
+        self.by_model: Dict[str, Usage] = {}
+        self._sessions: "OrderedDict[str, Dict[str, Usage]]" = OrderedDict()
+        # (time, tokens) of the calls in the global budget window
+        self._recent: Deque[Tuple[float, int]] = deque()
+        self._recent_tokens = 0
+        self._lock = threading.Lock()
+
+    def record(self, session_id: Optional[str], step: str, model: str, prompt_tokens: int, completion_tokens: int) -> None:
+        prompt_price, completion_price = MODEL_PRICES.get(model, (0.0, 0.0))
+        cost = (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1e6
+        with self._lock:
+            usages = [self.total, self.by_step.setdefault(step, Usage()), self.by_model.setdefault(model, Usage())]
+            if session_id:
+                session = self._sessions.setdefault(session_id, {})
+                self._sessions.move_to_end(session_id)
+                while len(self._sessions) > MAX_TRACKED_SESSIONS:
+                    self._sessions.popitem(last=False)
+                usages += [session.setdefault("total", Usage()), session.setdefault(step, Usage())]
+            for usage in usages:
+                usage.add(prompt_tokens, completion_tokens, cost)
+            self._recent.append((time.time(), prompt_tokens + completion_tokens))
+            self._recent_tokens += prompt_tokens + completion_tokens
+
+    def session_usage(self, session_id: str) -> Usage:
+        with self._lock:
+            return Usage(**asdict(self._sessions.get(session_id, {}).get("total", Usage())))
+
+    def session_totals(self, session_id: str) -> Dict[str, Dict[str, Any]]:
+        """The session's totals (overall and per step) as plain dicts, saved with the session"""
+        with self._lock:
+            return {key: asdict(usage) for key, usage in self._sessions.get(session_id, {}).items()}
+
+    def restore_session(self, session_id: str, totals: Optional[Dict[str, Dict[str, Any]]]) -> None:
+        """
+        Carry on the totals saved with a session resumed from its snapshot, so a restart does
+        not hand it a fresh budget. Totals this process already tracks are newer and kept.
+        """
+        if not totals:
+            return
+        with self._lock:
+            if session_id in self._sessions:
+                return
+            self._sessions[session_id] = {key: Usage(**usage) for key, usage in totals.items()}
+            while len(self._sessions) > MAX_TRACKED_SESSIONS:
+                self._sessions.popitem(last=False)
+
+    def window_tokens(self) -> int:
+        """Tokens used by all sessions within the global budget window"""
+        cutoff = time.time() - self.window
+        with self._lock:
+            while self._recent and self._recent[0][0] < cutoff:
+                self._recent_tokens -= self._recent.popleft()[1]
+            return self._recent_tokens
+
+    def budget_used(self, session_id: Optional[str]) -> float:
+        """Share of the tighter of the session and global budgets used so far"""
+        used = 0.0
+        if self.session_budget and session_id:
+            used = self.session_usage(session_id).tokens / self.session_budget
+        if self.global_budget:
+            used = max(used, self.window_tokens() / self.global_budget)
+        return used
+
+    def degradation(self, session_id: Optional[str]) -> int:
+        """0, or SHORT_HISTORY / CHEAP_MODEL / CACHED_ANSWERS as the budget runs out (each includes the ones before)"""
+        used = self.budget_used(session_id)
+        return next((level for threshold, level in DEGRADATION_THRESHOLDS if used >= threshold), 0)
+
+    def snapshot(self, session_id: Optional[str] = None) -> Dict[str, Any]:
+        """Running totals (overall, per step, per model and optionally of one session) as plain dicts"""
+        with self._lock:
+            snapshot = {
+                "total": asdict(self.total),
+                "by_step": {step: asdict(usage) for step, usage in self.by_step.items()},
+                "by_model": {model: asdict(usage) for model, usage in self.by_model.items()},
+            }
+            if session_id is not None:
+                snapshot["session"] = {key: asdict(usage) for key, usage in self._sessions.get(session_id, {}).items()}
+        return snapshot
+
+
+token_accountant = TokenAccountant()
+
+
+def budget_history(messages: List[Dict[str, Any]], session_id: Optional[str],
+                   accountant: TokenAccountant = token_accountant) -> List[Dict[str, Any]]:
+    """The chat history to paste into a prompt: all of it, or the last messages as the budget runs out"""
+    keep = HISTORY_MESSAGES[accountant.degradation(session_id)]
+    return messages if keep is None else messages[-keep:]
+
+
+class AnswerCache:
+    """
+    Answers of LLM calls by step and exact prompt, reused when a budget is spent. The cache
+    is shared by all sessions, so answers (parsed JSON included) go in and out as copies.
+    """
+
+    def __init__(self, max_entries: int = ANSWER_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._answers: "OrderedDict[Tuple[str, str], Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(step: str, prompt: str) -> Tuple[str, str]:
+        return step, hashlib.sha1(prompt.encode("utf-8")).hexdigest()
+
+    def get(self, step: str, prompt: str) -> Optional[Any]:
+        key = self._key(step, prompt)
+        with self._lock:
+            answer = self._answers.get(key)
+            if answer is None:
+                return None
+            self._answers.move_to_end(key)
+        return copy.deepcopy(answer)
+
+    def put(self, step: str, prompt: str, answer: Any) -> None:
+        key = self._key(step, prompt)
+        answer = copy.deepcopy(answer)
+        with self._lock:
+            self._answers[key] = answer
+            self._answers.move_to_end(key)
+            while len(self._answers) > self.max_entries:
+                self._answers.popitem(last=False)
+
+
+answer_cache = AnswerCache()
@@ -4,23 +4,12 @@ from typing import Any, Dict, List, Optional, Tuple
 import folium
 import streamlit as st
 
+from map_utils import add_fast_marker_layer, place_marker_rows
+from result_projection import format_distance, format_time_duration
 
-def format_time_duration(seconds: int) -> str:
-    """Format seconds into a readable time duration (e.g., 2h 30m)"""
-    hours = seconds // 3600
-    minutes = (seconds % 3600) // 60
-    
-    if hours > 0:
-        return f"{hours}h {minutes}m"
-    else:
-        return f"{minutes}m"
+# POIs above which create_poi_marker_cluster switches to the client-side cluster
+FAST_CLUSTER_THRESHOLD = 50
 
-def format_distance(meters: float) -> str:
-    """Format meters into a readable distance (km or m)"""
-    if meters >= 1000:
-        return f"{meters/1000:.1f} km"
-    else:
-        return f"{int(meters)} m"
 
 def create_daily_itinerary_card(
     day_number: int,
@@ -149,6 +138,16 @@ def create_poi_marker_cluster(m: folium.Map, pois: List[Dict[str, Any]]) -> foli
     if not pois or len(pois) == 0:
         return m
     
+    # Large result sets are rendered client-side, one folium.Marker each gets slow to build and ship
+    if len(pois) > FAST_CLUSTER_THRESHOLD:
+        places = [{
+            'lat': poi["position"][0],
+            'lon': poi["position"][1],
+            'title': poi.get('title', 'POI'),
+            'address': poi.get('address', {}).get('label', 'Address not available'),
+        } for poi in pois if "position" in poi and len(poi["position"]) == 2]
+        return add_fast_marker_layer(m, place_marker_rows(places), name="Points of Interest")
+    
     marker_cluster = folium.plugins.MarkerCluster(name="Points of Interest")
     
     for i, poi in enumerate(pois):
@@ -0,0 +1,255 @@
+import asyncio
+import threading
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+Point = Tuple[float, float]
+# Async provider of measured travel times: (origins, destinations) -> seconds[origin][destination],
+# None for pairs it could not route
+MatrixFn = Callable[[List[Point], List[Point]], Awaitable[List[List[Optional[float]]]]]
+
+EARTH_RADIUS_M = 6371000.0
+# Road distance is longer than the great circle, and the average speed over a road trip
+ROAD_DETOUR_FACTOR = 1.3
+AVERAGE_SPEED_MPS = 24.6  # ~55 mph
+# Cells (origins x destinations) per synchronous TomTom matrix request
+MAX_MATRIX_CELLS = 200
+# Measured pairs kept by the process-wide cache
+TRAVEL_TIME_CACHE_SIZE = 50000
+# Coordinates are rounded to ~10 m for cache keys, the same stop asked twice maps to one key
+COORD_PRECISION = 4
+MAX_IMPROVEMENT_ROUNDS = 50
+
+
+def haversine_matrix(points: List[Point]) -> np.ndarray:
+    """Great-circle distances in meters between all pairs of points"""
+    coords = np.radians(np.asarray(points, dtype=float).reshape(-1, 2))
+    lat = coords[:, 0][:, None]
+    lon = coords[:, 1][:, None]
+    dlat = lat.T - lat
+    dlon = lon.T - lon
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat) * np.cos(lat.T) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def haversine_distances(origin: Point, points: List[Point]) -> np.ndarray:
+    """Great-circle distances in meters from origin to each of the points"""
+    lat0, lon0 = np.radians(np.asarray(origin, dtype=float))
+    coords = np.radians(np.asarray(points, dtype=float).reshape(-1, 2))
+    dlat = coords[:, 0] - lat0
+    dlon = coords[:, 1] - lon0
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat0) * np.cos(coords[:, 0]) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def estimate_travel_times(points: List[Point]) -> np.ndarray:
+    """Driving time estimate in seconds between all pairs of points, without any provider call"""
+    return haversine_matrix(points) * ROAD_DETOUR_FACTOR / AVERAGE_SPEED_MPS
+
+
+def _pair_key(origin: Point, destination: Point) -> tuple:
+    return (round(origin[0], COORD_PRECISION), round(origin[1], COORD_PRECISION),
+            round(destination[0], COORD_PRECISION), round(destination[1], COORD_PRECISION))
+
+
+def _same_point(a: Point, b: Point) -> bool:
+    return _pair_key(a, b)[:2] == _pair_key(b, a)[:2]
+
+
+class TravelTimeCache:
+    """Measured travel times between coordinate pairs, shared by all sessions (LRU bounded)"""
+
+    def __init__(self, max_entries: int = TRAVEL_TIME_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[tuple, float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, origin: Point, destination: Point) -> Optional[float]:
+        key = _pair_key(origin, destination)
+        with self._lock:
+            seconds = self._entries.get(key)
+            if seconds is not None:
+                self._entries.move_to_end(key)
+            return seconds
+
+    def put(self, origin: Point, destination: Point, seconds: float) -> None:
+        key = _pair_key(origin, destination)
+        with self._lock:
+            self._entries[key] = seconds
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+travel_time_cache = TravelTimeCache()
+
+
+def matrix_batches(origin_indices: List[int], n_destinations: int, max_cells: int = MAX_MATRIX_CELLS) -> List[List[int]]:
+    """Split origin rows into requests of at most max_cells cells"""
+    rows_per_batch = max(1, max_cells // max(1, n_destinations))
+    return [origin_indices[i:i + rows_per_batch] for i in range(0, len(origin_indices), rows_per_batch)]
+
+
+async def build_travel_time_matrix(points: List[Point], matrix_fn: Optional[MatrixFn] = None,
+                                   cache: TravelTimeCache = travel_time_cache) -> Tuple[np.ndarray, int]:
+    """
+    Travel times in seconds between all pairs of points. Starts from the haversine
+    estimate, takes measured times from the cache, and asks matrix_fn only for the
+    origin rows that still have unmeasured pairs, in concurrent batches that fit a
+    matrix request. Returns the matrix and the number of provider requests made.
+    """
+    matrix = estimate_travel_times(points)
+    np.fill_diagonal(matrix, 0.0)
+
+    missing_rows = []
+    for i, origin in enumerate(points):
+        row_missing = False
+        for j, destination in enumerate(points):
+            if i == j:
+                continue
+            seconds = cache.get(origin, destination)
+            if seconds is None:
+                row_missing = True
+            else:
+                matrix[i, j] = seconds
+        if row_missing:
+            missing_rows.append(i)
+
+    if matrix_fn is None or not missing_rows:
+        return matrix, 0
+
+    batches = matrix_batches(missing_rows, len(points))
+    results = await asyncio.gather(
+        *(matrix_fn([points[i] for i in batch], list(points)) for batch in batches),
+        return_exceptions=True
+    )
+    for batch, rows in zip(batches, results):
+        if isinstance(rows, Exception):
+            print(f"Matrix request failed, keeping estimates: {rows}")
+            continue
+        for i, row in zip(batch, rows):
+            for j, seconds in enumerate(row):
+                if i != j and seconds is not None:
+                    matrix[i, j] = seconds
+                    cache.put(points[i], points[j], seconds)
+    return matrix, len(batches)
+
+
+def path_cost(matrix: np.ndarray, path: List[int]) -> float:
+    """Total travel time of visiting the nodes in order"""
+    nodes = np.asarray(path)
+    return float(matrix[nodes[:-1], nodes[1:]].sum())
+
+
+def nearest_neighbour_path(matrix: np.ndarray, start: int, end: int, stops: List[int]) -> List[int]:
+    """Greedy path start -> closest unvisited stop -> ... -> end"""
+    path = [start]
+    remaining = list(stops)
+    while remaining:
+        current = path[-1]
+        closest = min(remaining, key=lambda node: matrix[current, node])
+        path.append(closest)
+        remaining.remove(closest)
+    path.append(end)
+    return path
+
+
+def two_opt(matrix: np.ndarray, path: List[int]) -> List[int]:
+    """Reverse inner segments while that shortens the path (endpoints stay fixed)"""
+    best, best_cost = path, path_cost(matrix, path)
+    improved = True
+    rounds = 0
+    while improved and rounds < MAX_IMPROVEMENT_ROUNDS:
+        improved = False
+        rounds += 1
+        for i in range(1, len(best) - 2):
+            for j in range(i + 1, len(best) - 1):
+                # Travel times are not symmetric, so the reversed segment is costed in full
+                candidate = best[:i] + best[i:j + 1][::-1] + best[j + 1:]
+                cost = path_cost(matrix, candidate)
+                if cost < best_cost - 1e-6:
+                    best, best_cost, improved = candidate, cost, True
+    return best
+
+
+def or_opt(matrix: np.ndarray, path: List[int], max_segment: int = 3) -> List[int]:
+    """Move segments of up to max_segment stops to a better position (endpoints stay fixed)"""
+    best, best_cost = path, path_cost(matrix, path)
+    improved = True
+    rounds = 0
+    while improved and rounds < MAX_IMPROVEMENT_ROUNDS:
+        improved = False
+        rounds += 1
+        for length in range(1, max_segment + 1):
+            for i in range(1, len(best) - length):
+                segment = best[i:i + length]
+                rest = best[:i] + best[i + length:]
+                for k in range(1, len(rest)):
+                    if k == i:
+                        continue
+                    candidate = rest[:k] + segment + rest[k:]
+                    cost = path_cost(matrix, candidate)
+                    if cost < best_cost - 1e-6:
+                        best, best_cost, improved = candidate, cost, True
+                        break
+                if improved:
+                    break
+            if improved:
+                break
+    return best
+
+
+def solve_visiting_order(matrix: np.ndarray, start: int, end: int, stops: List[int]) -> List[int]:
+    """Visiting order of the stops between fixed start and end (end == start for a round trip)"""
+    if len(stops) < 2:
+        return list(stops)
+    path = nearest_neighbour_path(matrix, start, end, stops)
+    path = two_opt(matrix, path)
+    path = or_opt(matrix, path)
+    # A pass of each can open up a move for the other, one more 2-opt pass settles it
+    path = two_opt(matrix, path)
+    return path[1:-1]
+
+
+async def optimize_waypoint_order(start: Point, end: Point, waypoints: List[Point], end_at_start: bool = False,
+                                  matrix_fn: Optional[MatrixFn] = None) -> Dict[str, object]:
+    """
+    Order the waypoints of a trip to minimize total travel time. With end_at_start the
+    trip returns to the start and the end location (if different) becomes one more stop.
+    Returns the ordered stops, their positions in the input, the travel time estimates
+    before/after and the number of matrix requests made.
+    """
+    stops = list(waypoints)
+    if end_at_start and not _same_point(start, end):
+        stops.append(end)
+    final_end = start if end_at_start else end
+
+    points = [start] + stops + [final_end]
+    start_index, end_index = 0, len(points) - 1
+    stop_indices = list(range(1, len(points) - 1))
+
+    if len(stops) < 2:
+        return {"waypoints": stops, "order": list(range(len(stops))), "end": final_end,
+                "seconds_before": None, "seconds_after": None, "matrix_requests": 0}
+
+    # The start is both ends of a round trip, routing it once is enough
+    unique_points = points[:-1] if end_at_start else points
+    matrix, requests_made = await build_travel_time_matrix(unique_points, matrix_fn)
+    if end_at_start:
+        end_index = start_index
+
+    order = solve_visiting_order(matrix, start_index, end_index, stop_indices)
+    return {
+        "waypoints": [points[i] for i in order],
+        "order": [i - 1 for i in order],
+        "end": final_end,
+        "seconds_before": path_cost(matrix, [start_index] + stop_indices + [end_index]),
+        "seconds_after": path_cost(matrix, [start_index] + order + [end_index]),
+        "matrix_requests": requests_made,
+    }